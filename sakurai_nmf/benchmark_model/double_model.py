@@ -4,6 +4,8 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import os
+
 import agents
 import numpy as np
 import tensorflow as tf
@@ -36,9 +38,10 @@ def build_tf_model():
                                  )
 
 
-def build_tf_cross_entropy_model(batch_size, shape=784, use_bias=False, activation=None, use_softmax=False):
-    inputs = tf.placeholder(tf.float64, (batch_size, shape), name='inputs')
-    labels = tf.placeholder(tf.float64, (batch_size, 10), name='labels')
+def build_tf_cross_entropy_model(batch_size, shape=784, use_bias=False, activation=None, use_softmax=False,
+                                 dtype=tf.float64):
+    inputs = tf.placeholder(dtype, (batch_size, shape), name='inputs')
+    labels = tf.placeholder(dtype, (batch_size, 10), name='labels')
     
     x = tf.layers.dense(inputs, 1000, activation=activation, use_bias=use_bias)
     x = tf.layers.dense(x, 500, activation=activation, use_bias=use_bias)
@@ -58,9 +61,10 @@ def build_tf_cross_entropy_model(batch_size, shape=784, use_bias=False, activati
                                  accuracy=accuracy,
                                  )
 
-def build_tf_one_hot_model(batch_size, shape=784, use_bias=False, activation=None, use_softmax=False):
-    inputs = tf.placeholder(tf.float64, (batch_size, shape), name='inputs')
-    labels = tf.placeholder(tf.float64, (batch_size, 10), name='labels')
+def build_tf_one_hot_model(batch_size, shape=784, use_bias=False, activation=None, use_softmax=False,
+                           dtype=tf.float64):
+    inputs = tf.placeholder(dtype, (batch_size, shape), name='inputs')
+    labels = tf.placeholder(dtype, (batch_size, 10), name='labels')
     
     activation = None or activation
     x = tf.layers.dense(inputs, 1000, activation=activation, use_bias=use_bias)
@@ -103,7 +107,42 @@ def build_data(batch_size, label_size):
     return x, y
 
 
-def load_one_hot_data(dataset='mnist'):
+def _one_hot_cache_paths(cache_dir, dataset, dtype, seed):
+    # The order of the training rows depends on the seed, so each seed has its own files.
+    prefix = os.path.join(cache_dir, '{}_{}_seed{}'.format(dataset, np.dtype(dtype).name, seed))
+    return [prefix + '_' + name + '.npy' for name in ('x_train', 'y_train', 'x_test', 'y_test')]
+
+
+def load_one_hot_data(dataset='mnist', dtype=np.float64, cache_dir=None, seed=0):
+    """Load normalized (fashion) mnist or cifar10 with one hot labels.
+    
+    Args:
+        dataset: 'mnist', 'fashion' or 'cifar10'
+        dtype: dtype of the arrays
+        cache_dir: If given, the arrays are saved there as .npy the first time
+            and opened with np.memmap afterwards. The training rows are
+            shuffled before saving, so contiguous blocks of them are random
+            batches, see `block_batch`.
+        seed: Seed of the shuffle of the cached training rows, cached apart
+            for every seed.
+    
+    Returns:
+        (x_train, y_train), (x_test, y_test)
+    """
+    if cache_dir is not None:
+        paths = _one_hot_cache_paths(cache_dir, dataset, dtype, seed)
+        if not all(os.path.exists(path) for path in paths):
+            (x_train, y_train), (x_test, y_test) = load_one_hot_data(dataset, dtype=dtype)
+            index = np.random.RandomState(seed).permutation(len(x_train))
+            os.makedirs(cache_dir, exist_ok=True)
+            for path, array in zip(paths, (x_train[index], y_train[index], x_test, y_test)):
+                # Readers never see a partially written file.
+                with open(path + '.tmp', 'wb') as f:
+                    np.save(f, array)
+                os.replace(path + '.tmp', path)
+        x_train, y_train, x_test, y_test = (np.load(path, mmap_mode='r') for path in paths)
+        return (x_train, y_train), (x_test, y_test)
+    
     from keras.datasets.mnist import load_data
     shape = 784
     if dataset == 'fashion':
@@ -113,18 +152,45 @@ def load_one_hot_data(dataset='mnist'):
         shape = 32 * 32 * 3
     (x_train, y_train), (x_test, y_test) = load_data()
     
-    x_train = x_train.reshape((-1, shape)).astype(np.float64) / 255.
-    y_train = to_categorical(y_train, 10).astype(np.float64)
-    x_test = x_test.reshape((-1, shape)).astype(np.float64) / 255.
-    y_test = to_categorical(y_test, 10).astype(np.float64)
+    x_train = x_train.reshape((-1, shape)).astype(dtype) / 255.
+    y_train = to_categorical(y_train, 10).astype(dtype)
+    x_test = x_test.reshape((-1, shape)).astype(dtype) / 255.
+    y_test = to_categorical(y_test, 10).astype(dtype)
     return (x_train, y_train), (x_test, y_test)
 
 
-def batch(x, y, batch_size):
-    rand_index = np.random.choice(len(x), batch_size)
+def batch(x, y, batch_size, random_state=None):
+    random_state = random_state or np.random
+    rand_index = random_state.choice(len(x), batch_size)
     return x[rand_index], y[rand_index]
 
 
+def block_batch(x, y, batch_size, random_state=None):
+    """Batch of contiguous rows from a random offset.
+    
+    Unlike `batch`, it slices one block instead of gathering rows, so nothing
+    is copied and a memory-mapped array only reads the pages of the batch.
+    The rows should be shuffled beforehand, as the cached `load_one_hot_data`.
+    The offset is a multiple of batch_size like the blocks of `block_batches`,
+    drawn from random_state, the global np.random by default.
+    """
+    random_state = random_state or np.random
+    start = random_state.choice(np.arange(0, len(x) - batch_size + 1, batch_size))
+    return x[start:start + batch_size], y[start:start + batch_size]
+
+
+def block_batches(x, y, batch_size, shuffle=True):
+    """Yield the batches of one epoch as contiguous blocks in shuffled order.
+    
+    The remainder rows shorter than batch_size are skipped.
+    """
+    starts = np.arange(0, len(x) - batch_size + 1, batch_size)
+    if shuffle:
+        np.random.shuffle(starts)
+    for start in starts:
+        yield x[start:start + batch_size], y[start:start + batch_size]
+
+
 def get_train_ops(graph: tf.Graph):
     return graph.get_collection(tf.GraphKeys.TRAINABLE_VARIABLES)
 
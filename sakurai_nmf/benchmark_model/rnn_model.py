@@ -15,6 +15,7 @@ from tensorflow.contrib.rnn import GRUBlockCellV2
 
 from sakurai_nmf.losses import frobenius_norm
 from sakurai_nmf.optimizer import utility
+from sakurai_nmf.optimizer.discovery import discover_layers
 
 
 def search(x):
@@ -182,7 +183,7 @@ def _vanilla_rnn():
     (x_train, y_train), (x_test, y_test) = load_mnist()
     model = build_rnn_mnist(batch_size=batch_size, use_bias=True, activation=tf.nn.relu)
     ops = utility.get_train_ops()
-    layers = utility._zip_layer(model.inputs, model.frob_norm, ops)
+    layers = discover_layers(model.inputs, model.frob_norm, ops)
     variables = utility.TensorFlowVariables(model.frob_norm)
 
 
@@ -0,0 +1,9 @@
+"""Benchmarks of the factorizations on seeded fixtures."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from .fixtures import kinds, make_fixture, regimes, save_mat
+from .runner import (compare_results, environment, load_results, run_suite, run_svd_suite, solvers, time_solver,
+                     time_svd, write_results)
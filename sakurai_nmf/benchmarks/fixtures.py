@@ -0,0 +1,75 @@
+"""Seeded fixtures of the factorizations in several shape regimes"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+import scipy.io as sio
+
+from sakurai_nmf.matrix_factorization.utility import AttrDict
+
+# (batch_size, input_size, output_size) of a layer in batch first, where
+# a is [batch_size, output_size], u is [batch_size, input_size] and v is the kernel.
+regimes = dict(
+    tiny=(300, 40, 80),
+    small=(500, 700, 1000),
+    mnist_input=(3000, 784, 1000),
+    mnist_hidden=(3000, 1000, 500),
+    mnist_output=(3000, 500, 10),
+    wide=(1000, 3000, 1500),
+    large=(5000, 1500, 3000),
+)
+
+# Targets of the solvers, 'linear' for semi_nmf, 'relu' for nonlin_semi_nmf
+# and 'softmax' for softmax_nmf.
+kinds = ('linear', 'relu', 'softmax')
+
+
+def make_fixture(regime, kind='linear', use_bias=False, seed=0, dtype=np.float64):
+    """Generate a, u, v of a layer in batch first.
+
+    The same regime, kind, use_bias and seed always give the same matrices.
+
+    Args:
+        regime: Name in `regimes` or a (batch_size, input_size, output_size) tuple.
+        kind: One of `kinds`, the activation the target a comes from.
+        use_bias: Append the bias row to v.
+        seed: Seed of the matrices.
+        dtype: dtype of the matrices.
+
+    Returns:
+        AttrDict(name, a, u, v)
+    """
+    if kind not in kinds:
+        raise ValueError('kind should be one of {}, got {}'.format(kinds, kind))
+    if isinstance(regime, str):
+        if regime not in regimes:
+            raise ValueError('regime should be one of {}, got {}'.format(sorted(regimes), regime))
+        name = regime
+        batch_size, input_size, output_size = regimes[regime]
+    else:
+        batch_size, input_size, output_size = regime
+        name = '{}x{}x{}'.format(batch_size, input_size, output_size)
+    random_state = np.random.RandomState(seed)
+    u = random_state.uniform(0., 1., size=(batch_size, input_size))
+    v = random_state.uniform(-1., 1., size=(input_size + int(use_bias), output_size))
+    if kind == 'softmax':
+        a = np.eye(output_size)[random_state.randint(output_size, size=batch_size)]
+    else:
+        a = random_state.uniform(-1., 1., size=(batch_size, output_size))
+        if kind == 'relu':
+            a = np.maximum(a, 0.)
+    return AttrDict(name=name,
+                    a=a.astype(dtype),
+                    u=u.astype(dtype),
+                    v=v.astype(dtype))
+
+
+def save_mat(fixture, path):
+    """Write a fixture as a .mat file in MATLAB format, like tests/generate_test_mat.py.
+
+    In MATLAB format a = uv has u as the left matrix and v as the non-negative
+    one, so a^T, v^T and u^T of the batch-first fixture are stored as a, u and v.
+    """
+    sio.savemat(path, dict(a=fixture.a.T, u=fixture.v.T, v=fixture.u.T))
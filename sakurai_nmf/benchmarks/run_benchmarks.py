@@ -0,0 +1,55 @@
+"""Run the benchmark suite, write the results as JSON and compare them with a baseline.
+
+python sakurai_nmf/benchmarks/run_benchmarks.py --regimes tiny,mnist_hidden --output results.json
+python sakurai_nmf/benchmarks/run_benchmarks.py --regimes tiny,mnist_hidden --baseline results.json
+python sakurai_nmf/benchmarks/run_benchmarks.py --regimes mnist_hidden --solvers '' --svd_ranks 100,500
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import tensorflow as tf
+
+from sakurai_nmf import benchmarks
+
+
+def main(_):
+    records = benchmarks.run_suite(regime_names=FLAGS.regimes.split(','),
+                                   solver_names=FLAGS.solvers.split(','),
+                                   seed=FLAGS.seed,
+                                   num_warmup=FLAGS.num_warmup,
+                                   num_repeats=FLAGS.num_repeats,
+                                   num_iters=FLAGS.num_iters) if FLAGS.solvers else []
+    if FLAGS.svd_ranks:
+        records += benchmarks.run_svd_suite(regime_names=FLAGS.regimes.split(','),
+                                            ranks=[int(rank) for rank in FLAGS.svd_ranks.split(',')],
+                                            seed=FLAGS.seed,
+                                            num_warmup=FLAGS.num_warmup,
+                                            num_repeats=FLAGS.num_repeats)
+    for record in records:
+        print('{solver:>16} {regime:>13} bias={use_bias!s:<5} {min:.4f} sec (mean {mean:.4f}) '
+              'loss {old_loss:.4f} -> {new_loss:.4f}'.format(**record))
+    if FLAGS.output:
+        benchmarks.write_results(records, FLAGS.output)
+    if FLAGS.baseline:
+        regressions = benchmarks.compare_results(benchmarks.load_results(FLAGS.baseline), records,
+                                                 tolerance=FLAGS.tolerance)
+        for key, metric, old, new in regressions:
+            print('regression {} {}: {:.4f} -> {:.4f}'.format(key, metric, old, new))
+        print('{} regressions over {:.0%}'.format(len(regressions), FLAGS.tolerance))
+
+
+if __name__ == '__main__':
+    FLAGS = tf.app.flags.FLAGS
+    tf.app.flags.DEFINE_string('regimes', 'tiny,small,mnist_hidden', '''Comma separated names of the regimes''')
+    tf.app.flags.DEFINE_string('solvers', 'nonlin_semi_nmf,semi_nmf,softmax_nmf', '''Comma separated solvers''')
+    tf.app.flags.DEFINE_string('svd_ranks', '', '''Comma separated ranks of the SVDs of u timed, none by default''')
+    tf.app.flags.DEFINE_integer('num_iters', 1, '''Number of iterations of each solve''')
+    tf.app.flags.DEFINE_integer('num_warmup', 1, '''Number of untimed runs''')
+    tf.app.flags.DEFINE_integer('num_repeats', 3, '''Number of timed runs''')
+    tf.app.flags.DEFINE_integer('seed', 0, '''Seed of the fixtures''')
+    tf.app.flags.DEFINE_string('output', '', '''Path of the JSON results''')
+    tf.app.flags.DEFINE_string('baseline', '', '''Path of the JSON results compared with''')
+    tf.app.flags.DEFINE_float('tolerance', 0.1, '''Relative regression allowed''')
+    tf.app.run()
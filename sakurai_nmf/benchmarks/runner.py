@@ -0,0 +1,212 @@
+"""Time the factorizations on the fixtures and keep the results as JSON"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import functools
+import json
+import platform
+import subprocess
+import time
+
+import numpy as np
+
+import sakurai_nmf.matrix_factorization as mf
+from sakurai_nmf.losses import np_frobenius_norm
+from sakurai_nmf.matrix_factorization import utility
+from .fixtures import make_fixture
+
+# Name of each solver and the kind of the fixture it factorizes.
+solvers = dict(
+    semi_nmf=(mf.semi_nmf, 'linear'),
+    nonlin_semi_nmf=(mf.nonlin_semi_nmf, 'relu'),
+    softmax_nmf=(mf.softmax_nmf, 'softmax'),
+)
+
+
+def _loss(fixture, u, v, solver_name, use_bias):
+    """Objective of the solver, || a - uv || or || a - relu(uv) || for nonlin_semi_nmf.
+
+    softmax_nmf keeps the rows of u on the simplex and fits uv itself, so the
+    softmax is not applied to the product.
+    """
+    if use_bias:
+        u = np.hstack((u, np.ones((u.shape[0], 1), dtype=u.dtype)))
+    outputs = u @ v
+    if solver_name == 'nonlin_semi_nmf':
+        outputs = utility.relu(outputs)
+    return float(np_frobenius_norm(fixture.a, outputs))
+
+
+def time_solver(solver_name, fixture, use_bias=False, num_warmup=1, num_repeats=3, **kwargs):
+    """Time a solver on a fixture after warming it up.
+
+    Args:
+        solver_name: Name in `solvers`.
+        fixture: `make_fixture` of the kind of the solver.
+        use_bias: Use bias, the fixture has to have the bias row.
+        num_warmup: Number of untimed runs first.
+        num_repeats: Number of timed runs.
+        kwargs: Options of the solver, e.g. num_iters or precision.
+
+    Returns:
+        Record of the durations in seconds and of the losses before and after.
+    """
+    solver, _ = solvers[solver_name]
+    for _ in range(num_warmup):
+        solver(fixture.a, fixture.u, fixture.v, use_bias=use_bias, **kwargs)
+    durations = []
+    for _ in range(num_repeats):
+        start_time = time.perf_counter()
+        u, v = solver(fixture.a, fixture.u, fixture.v, use_bias=use_bias, **kwargs)
+        durations.append(time.perf_counter() - start_time)
+    old_loss = _loss(fixture, fixture.u, fixture.v, solver_name, use_bias)
+    new_loss = _loss(fixture, u, v, solver_name, use_bias)
+    return dict(solver=solver_name,
+                regime=fixture.name,
+                shape=[fixture.a.shape[0], fixture.u.shape[1], fixture.a.shape[1]],
+                use_bias=use_bias,
+                options=kwargs,
+                durations=durations,
+                mean=float(np.mean(durations)),
+                min=float(np.min(durations)),
+                std=float(np.std(durations)),
+                old_loss=old_loss,
+                new_loss=new_loss,
+                loss_reduction=old_loss - new_loss)
+
+
+def time_svd(svd_method, fixture, rank, num_warmup=1, num_repeats=3):
+    """Time a low-rank engine on the u of a fixture, truncated to rank.
+
+    Args:
+        svd_method: 'economy', or 'randomized' run by `utility.randomized_svd` with rank.
+        fixture: `make_fixture` of any kind.
+        rank: Number of singular triplets kept.
+        num_warmup: Number of untimed runs first.
+        num_repeats: Number of timed runs.
+
+    Returns:
+        Record like the ones of `time_solver`, whose losses are || a || and
+        the error of the truncated SVD of a = u.
+    """
+    a = fixture.u
+    rank = min(rank, min(a.shape))
+    if svd_method == 'randomized':
+        svd = functools.partial(utility.randomized_svd, rank=rank, seed=0)
+    else:
+        svd = utility.get_svd(svd_method)
+    for _ in range(num_warmup):
+        svd(a)
+    durations = []
+    for _ in range(num_repeats):
+        start_time = time.perf_counter()
+        u, s, vt = svd(a)
+        durations.append(time.perf_counter() - start_time)
+    old_loss = float(np.linalg.norm(a))
+    new_loss = float(np_frobenius_norm(a, (u[:, :rank] * s[:rank]) @ vt[:rank]))
+    return dict(solver='svd_{}'.format(svd_method),
+                regime=fixture.name,
+                shape=list(a.shape),
+                use_bias=False,
+                options=dict(rank=rank),
+                durations=durations,
+                mean=float(np.mean(durations)),
+                min=float(np.min(durations)),
+                std=float(np.std(durations)),
+                old_loss=old_loss,
+                new_loss=new_loss,
+                loss_reduction=old_loss - new_loss)
+
+
+def run_svd_suite(regime_names=('mnist_hidden',), svd_method_names=('economy', 'randomized'), ranks=(100,),
+                  seed=0, num_warmup=1, num_repeats=3):
+    """`time_svd` of every low-rank engine, regime and rank.
+
+    Returns:
+        List of the records.
+    """
+    records = []
+    for regime in regime_names:
+        fixture = make_fixture(regime, seed=seed)
+        for rank in ranks:
+            for svd_method in svd_method_names:
+                records.append(time_svd(svd_method, fixture, rank=rank, num_warmup=num_warmup,
+                                        num_repeats=num_repeats))
+    return records
+
+
+def run_suite(regime_names=('tiny',), solver_names=tuple(sorted(solvers)), biases=(False, True), seed=0,
+              num_warmup=1, num_repeats=3, **kwargs):
+    """`time_solver` of every solver, regime and bias.
+
+    Returns:
+        List of the records.
+    """
+    records = []
+    for regime in regime_names:
+        for solver_name in solver_names:
+            _, kind = solvers[solver_name]
+            for use_bias in biases:
+                fixture = make_fixture(regime, kind=kind, use_bias=use_bias, seed=seed)
+                records.append(time_solver(solver_name, fixture, use_bias=use_bias, num_warmup=num_warmup,
+                                           num_repeats=num_repeats, **kwargs))
+    return records
+
+
+def _git_revision():
+    try:
+        output = subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.decode().strip()
+
+
+def environment():
+    """Versions and machine the results are measured with."""
+    return dict(time=time.strftime('%Y-%m-%dT%H:%M:%S'),
+                git_revision=_git_revision(),
+                python=platform.python_version(),
+                numpy=np.__version__,
+                machine=platform.platform(),
+                processor=platform.processor())
+
+
+def write_results(records, path):
+    """Write the records and the `environment` as JSON."""
+    with open(path, 'w') as f:
+        json.dump(dict(environment=environment(), results=records), f, indent=2, sort_keys=True)
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)['results']
+
+
+def _key(record):
+    return (record['solver'], record['regime'], record['use_bias'],
+            json.dumps(record['options'], sort_keys=True))
+
+
+def compare_results(baseline, records, tolerance=0.1):
+    """Find the records slower or with a larger loss than the baseline.
+
+    Args:
+        baseline: Records of `load_results` measured before.
+        records: Records measured now.
+        tolerance: Relative slowdown of the fastest run or growth of the loss allowed.
+
+    Returns:
+        List of (key, metric, baseline value, current value) over the tolerance.
+    """
+    baseline = {_key(record): record for record in baseline}
+    regressions = []
+    for record in records:
+        old = baseline.get(_key(record))
+        if old is None:
+            continue
+        for metric in ('min', 'new_loss'):
+            if record[metric] > old[metric] * (1. + tolerance):
+                regressions.append((_key(record), metric, old[metric], record[metric]))
+    return regressions
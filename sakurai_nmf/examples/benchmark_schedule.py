@@ -0,0 +1,70 @@
+"""Compare the Gauss-Seidel and Jacobi schedules of NMFOptimizer on (fashion) mnist."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from sakurai_nmf import benchmark_model
+from sakurai_nmf.optimizer import NMFOptimizer
+from sakurai_nmf.optimizer.optimizers import schedules
+
+
+def run_schedule(train_op, init, model, batches, graph):
+    """Run the steps from the same initial weights and batches.
+    
+    Returns:
+        Wall-clock seconds of each step and the loss after it.
+    """
+    durations = []
+    losses = []
+    # The graph level seed gives the same initial weights in every session.
+    with tf.Session(graph=graph) as sess:
+        sess.run(init)
+        for x, y in batches:
+            feed_dict = {model.inputs: x, model.labels: y}
+            start_time = time.time()
+            sess.run(train_op, feed_dict=feed_dict)
+            durations.append(time.time() - start_time)
+            losses.append(sess.run(model.frob_norm, feed_dict=feed_dict))
+    return durations, losses
+
+
+def main(_):
+    graph = tf.Graph()
+    with graph.as_default():
+        tf.set_random_seed(FLAGS.seed)
+        activation = tf.nn.relu if FLAGS.use_relu else None
+        model = benchmark_model.build_tf_one_hot_model(batch_size=FLAGS.batch_size,
+                                                       use_bias=FLAGS.use_bias,
+                                                       activation=activation)
+        train_ops = {schedule: NMFOptimizer(schedule=schedule).minimize(model.frob_norm).nmf
+                     for schedule in schedules}
+        init = tf.global_variables_initializer()
+    
+    (x_train, y_train), _ = benchmark_model.load_one_hot_data(dataset=FLAGS.dataset)
+    np.random.seed(FLAGS.seed)
+    batches = [benchmark_model.batch(x_train, y_train, batch_size=FLAGS.batch_size)
+               for _ in range(FLAGS.num_steps)]
+    
+    for schedule in schedules:
+        durations, losses = run_schedule(train_ops[schedule], init, model, batches, graph)
+        # The first step includes the warm up of the session.
+        print('{:>12}: {:.3f} sec/step, loss {}'.format(
+            schedule, np.mean(durations[1:] or durations),
+            ' '.join('{:.4f}'.format(loss) for loss in losses)))
+
+
+if __name__ == '__main__':
+    FLAGS = tf.app.flags.FLAGS
+    tf.app.flags.DEFINE_integer('batch_size', 3000, """Size of batches""")
+    tf.app.flags.DEFINE_string('dataset', 'mnist', '''mnist or fashion''')
+    tf.app.flags.DEFINE_integer('num_steps', 5, '''Number of NMF steps of each schedule''')
+    tf.app.flags.DEFINE_boolean('use_relu', True, '''Use ReLU''')
+    tf.app.flags.DEFINE_boolean('use_bias', False, '''Use bias''')
+    tf.app.flags.DEFINE_integer('seed', 0, '''Seed of the initial weights and the batches''')
+    tf.app.run()
@@ -0,0 +1,60 @@
+"""Compare the iterations of the update rules of semi-NMF to a target loss on the .mat fixtures."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import time
+
+import numpy as np
+import scipy.io as sio
+import tensorflow as tf
+
+import sakurai_nmf.matrix_factorization as mf
+
+
+def iterations_to_target(residuals, target):
+    """The first iteration whose residual is at most target, or None."""
+    for i, residual in enumerate(residuals):
+        if residual <= target:
+            return i + 1
+    return None
+
+
+def run_update_rule(a, u, v, update_rule, num_iters, use_bias=False):
+    """Solve in MATLAB format and report the residual of each iteration.
+    
+    Returns:
+        Wall-clock seconds and the relative residuals.
+    """
+    start_time = time.time()
+    _, _, info = mf.semi_nmf(a, u, v, use_bias=use_bias, data_format=False, num_iters=num_iters,
+                             update_rule=update_rule, return_info=True)
+    return time.time() - start_time, info.residuals
+
+
+def main(_):
+    auv = sio.loadmat(FLAGS.mat_file)
+    a, u, v = auv['a'], auv['u'], auv['v']
+    if FLAGS.use_bias:
+        u = np.hstack((u, np.ones((u.shape[0], 1))))
+    
+    results = {update_rule: run_update_rule(a, u, v, update_rule, FLAGS.num_iters, use_bias=FLAGS.use_bias)
+               for update_rule in mf.update_rules}
+    # The target is the loss the multiplicative update reaches in num_iters.
+    target = results['multiplicative'][1][-1] * (1. + FLAGS.margin)
+    print('target loss {:.6f}'.format(target))
+    for update_rule, (duration, residuals) in results.items():
+        num_iters = iterations_to_target(residuals, target)
+        print('{:>14}: {} iterations to target, {:.3f} sec/iter, final loss {:.6f}'.format(
+            update_rule, num_iters, duration / len(residuals), residuals[-1]))
+
+
+if __name__ == '__main__':
+    FLAGS = tf.app.flags.FLAGS
+    tf.app.flags.DEFINE_string('mat_file', './sakurai_nmf/tests/datasets/large.mat',
+                               '''.mat fixture with a, u, v in MATLAB format, see tests/generate_test_mat.py''')
+    tf.app.flags.DEFINE_integer('num_iters', 50, '''Number of iterations of each update rule''')
+    tf.app.flags.DEFINE_float('margin', 1e-6, '''Relative margin of the target loss''')
+    tf.app.flags.DEFINE_boolean('use_bias', False, '''Use bias''')
+    tf.app.run()
@@ -5,13 +5,15 @@ from __future__ import division
 from __future__ import print_function
 
 import functools
-import numpy as np
 import tensorflow as tf
 from agents.tools import AttrDict
 import time
 
 from sakurai_nmf import benchmark_model
 from sakurai_nmf.optimizer import NMFOptimizer
+from sakurai_nmf.optimizer import TrainStep
+from sakurai_nmf.optimizer.training import evaluate
+from sakurai_nmf.utils import Prefetcher, fork_random_state
 
 
 def default_config():
@@ -32,44 +34,48 @@ def default_config():
         activation = None
     # NMF use bias
     use_bias = FLAGS.use_bias
+    # Dtype policy of NMF, float64, float32 or mixed
+    precision = FLAGS.precision
+    # Directory of the memory-mapped dataset cache
+    cache_dir = FLAGS.cache_dir or None
+    # Number of batches prepared ahead in the background
+    prefetch_depth = FLAGS.prefetch_depth
     return locals()
 
 
 def train_and_test(train_op, num_iters, sess, model, x_train, y_train, x_test, y_test, batch_size=1,
-                   output_debug=False):
+                   output_debug=False, batch=benchmark_model.batch, prefetch_depth=2):
+    metrics = dict(loss=model.frob_norm, accuracy=model.accuracy)
+    if output_debug:
+        metrics.update(outputs=model.outputs)
+    # The metrics after the update come from the same run as the update.
+    train_step = TrainStep(train_op, metrics)
+    # The sampler runs in the thread of the prefetcher, so it has a RandomState of its own.
+    with Prefetcher(functools.partial(batch, x_train, y_train, batch_size=batch_size,
+                                      random_state=fork_random_state()),
+                    depth=prefetch_depth) as train_batches:
+        _train_and_test(train_step, num_iters, sess, model, train_batches, x_test, y_test, batch_size)
+
+
+def _train_and_test(train_step, num_iters, sess, model, train_batches, x_test, y_test, batch_size):
+    test_metrics = dict(loss=model.frob_norm, accuracy=model.accuracy)
     for i in range(num_iters):
         # Train...
         start_time = time.time()
-        x, y = benchmark_model.batch(x_train, y_train, batch_size=batch_size)
-        _, = sess.run([train_op], feed_dict={
+        x, y = next(train_batches)
+        train = train_step(sess, feed_dict={
             model.inputs: x,
             model.labels: y,
         })
         duration = time.time() - start_time
+        if 'outputs' in train:
+            print(train.outputs)
+        # Compute test accuracy over the test set.
+        test = evaluate(sess, test_metrics, model.inputs, model.labels, x_test, y_test, batch_size)
         
-        train_loss, train_acc = sess.run([model.frob_norm, model.accuracy], feed_dict={
-            model.inputs: x,
-            model.labels: y,
-        })
-        if output_debug:
-            outputs = sess.run(model.outputs, feed_dict={
-                model.inputs: x,
-                model.labels: y,
-            })
-            print(outputs)
-        stats = []
-        # Compute test accuracy.
-        for _ in range(5):
-            x, y = benchmark_model.batch(x_test, y_test, batch_size=batch_size)
-            stats.append(sess.run([model.frob_norm, model.accuracy], feed_dict={
-                model.inputs: x,
-                model.labels: y,
-            }))
-        test_loss, test_acc = np.mean(stats, axis=0)
-
         print('\r({}/{}) [Train]loss {:.3f}, accuracy {:.3f} time, {:.3f} [Test]loss {:.3f}, accuracy {:.3f}'.format(
             i + 1, num_iters,
-            train_loss, train_acc, duration, test_loss, test_acc), end='', flush=True)
+            train.loss, train.accuracy, duration, test.loss, test.accuracy), end='', flush=True)
     print()
 
 
@@ -78,11 +84,15 @@ def main(_):
     # Set configuration
     config = AttrDict(default_config())
     # Build one hot mnist model.
+    dtype = tf.float64 if config.precision == 'float64' else tf.float32
     model = benchmark_model.build_tf_one_hot_model(batch_size=config.batch_size,
                                                    use_bias=config.use_bias,
-                                                   activation=config.activation)
+                                                   activation=config.activation,
+                                                   dtype=dtype)
     # Load one hot mnist data.
-    (x_train, y_train), (x_test, y_test) = benchmark_model.load_one_hot_data(dataset=config.dataset)
+    (x_train, y_train), (x_test, y_test) = benchmark_model.load_one_hot_data(dataset=config.dataset,
+                                                                             dtype=dtype.as_numpy_dtype,
+                                                                             cache_dir=config.cache_dir)
     
     # Testing whether the dataset have correct shape.
     assert x_train.shape == (60000, 784)
@@ -90,7 +100,7 @@ def main(_):
     
     # Minimize model's loss with NMF optimizer.
     # optimizer = NMFOptimizer(config)
-    optimizer = NMFOptimizer()
+    optimizer = NMFOptimizer(precision=config.precision)
     train_op = optimizer.minimize(model.frob_norm)
     
     # Minimize model's loss with Adam optimizer.
@@ -104,7 +114,11 @@ def main(_):
                                             sess=sess, model=model,
                                             x_train=x_train, y_train=y_train,
                                             x_test=x_test, y_test=y_test,
-                                            batch_size=config.batch_size)
+                                            batch_size=config.batch_size,
+                                            # The cached training rows are shuffled, so blocks are random batches.
+                                            batch=(benchmark_model.block_batch if config.cache_dir
+                                                   else benchmark_model.batch),
+                                            prefetch_depth=config.prefetch_depth)
         
         print('NMF-optimizer')
         # Train with NMF optimizer.
@@ -124,4 +138,7 @@ if __name__ == '__main__':
     tf.app.flags.DEFINE_float('lr', 0.001, '''learning rate for back propagation''')
     tf.app.flags.DEFINE_boolean('use_relu', False, '''Use ReLU''')
     tf.app.flags.DEFINE_boolean('use_bias', False, '''Use bias''')
+    tf.app.flags.DEFINE_string('precision', 'float64', '''float64, float32 or mixed''')
+    tf.app.flags.DEFINE_string('cache_dir', '', '''Cache the dataset as .npy there and memory-map it''')
+    tf.app.flags.DEFINE_integer('prefetch_depth', 2, '''Number of batches prepared ahead, 0 to disable''')
     tf.app.run()
@@ -5,6 +5,8 @@ from __future__ import print_function
 import numpy as np
 import tensorflow as tf
 
+from sakurai_nmf.matrix_factorization import tf_utility, utility
+
 
 def frobenius_norm(original_x, muled_y):
     losses = original_x - muled_y
@@ -15,4 +17,45 @@ def frobenius_norm(original_x, muled_y):
 def np_frobenius_norm(original_x, muled_y):
     losses = original_x - muled_y
     loss = np.linalg.norm(losses) / np.linalg.norm(original_x)
-    return loss
\ No newline at end of file
+    return loss
+
+
+def gram_frobenius_norm(original_x, u, v, utx=None, utu=None):
+    """frobenius_norm(original_x, u @ v) without forming u @ v.
+    
+    Args:
+        original_x: Original matrix
+        u: Left matrix
+        v: Right matrix
+        utx: u^T original_x when it is already computed.
+        utu: u^T u when it is already computed.
+    """
+    if utx is None:
+        utx = tf.matmul(u, original_x, transpose_a=True)
+    if utu is None:
+        utu = tf.matmul(u, u, transpose_a=True)
+    x_norm_sq = tf.reduce_sum(tf.square(original_x))
+    return tf_utility.gram_residual(x_norm_sq, utx, utu, v) / tf.sqrt(x_norm_sq)
+
+
+def np_gram_frobenius_norm(original_x, u, v, x_norm_sq=None, utx=None, utu=None):
+    """np_frobenius_norm(original_x, u @ v) without forming u @ v.
+    
+    Monitoring the loss of every iteration with the products the update
+    already has costs O(k^2) per column instead of a full reconstruction.
+    
+    Args:
+        original_x: Original matrix, an ndarray or a scipy.sparse matrix
+        u: Left matrix
+        v: Right matrix
+        x_norm_sq: || original_x ||^2, which does not change over iterations.
+        utx: u^T original_x when it is already computed.
+        utu: u^T u when it is already computed.
+    """
+    if x_norm_sq is None:
+        x_norm_sq = utility.squared_norm(original_x)
+    if utx is None:
+        utx = utility.matmul(np.transpose(u), original_x)
+    if utu is None:
+        utu = np.transpose(u) @ u
+    return utility.gram_residual(x_norm_sq, utx, utu, v) / np.sqrt(x_norm_sq)
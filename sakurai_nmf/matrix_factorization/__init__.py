@@ -1 +1,4 @@
-from .matrix_factorization import *
\ No newline at end of file
+from .matrix_factorization import *
+from .executor import ProcessExecutor
+from .streaming import RowChunks, iter_chunks, streaming_nonlin_semi_nmf, streaming_semi_nmf
+from .profiler import Profiler
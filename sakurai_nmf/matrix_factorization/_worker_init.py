@@ -0,0 +1,17 @@
+"""Run by the workers of `executor.ProcessExecutor` before any task
+
+The __init__ of the packages import TensorFlow. The packages of the solvers
+are registered here as bare packages instead, so unpickling a task imports
+only the modules it refers to, e.g. `np_nmf` and `utility`. `packages` is
+given by the executor as (name, path) from the outermost package.
+"""
+
+import sys
+import types
+
+for name, path in packages:
+    if name not in sys.modules:
+        package = types.ModuleType(name)
+        package.__path__ = [path]
+        package.__package__ = name
+        sys.modules[name] = package
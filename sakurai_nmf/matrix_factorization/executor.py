@@ -0,0 +1,148 @@
+"""Run the NumPy solvers in worker processes over shared memory
+
+The solvers run in the Python interpreter, so inside tf.py_func the solves
+of several layers or models serialize on the GIL. `ProcessExecutor` keeps a
+pool of worker processes instead. The matrices are copied into shared
+memory blocks, which the worker maps and solves into, so nothing is
+pickled but the names of the blocks and the solver. The workers do not run
+the __init__ of the packages, so they load the NumPy solvers without
+TensorFlow, see `_worker_init`.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import concurrent.futures
+import multiprocessing
+import os
+import runpy
+import traceback
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+def _release(shms):
+    for shm in shms:
+        shm.close()
+        shm.unlink()
+
+
+def _to_shared(matrix):
+    matrix = np.ascontiguousarray(matrix)
+    shm = shared_memory.SharedMemory(create=True, size=max(matrix.nbytes, 1))
+    try:
+        np.ndarray(matrix.shape, dtype=matrix.dtype, buffer=shm.buf)[...] = matrix
+    except BaseException:
+        _release([shm])
+        raise
+    return shm, (shm.name, matrix.shape, matrix.dtype.str)
+
+
+def _packages():
+    """(name, path) of the packages of this module, from the outermost one."""
+    packages = []
+    name = __name__.rpartition('.')[0]
+    path = os.path.dirname(os.path.abspath(__file__))
+    while name:
+        packages.insert(0, (name, path))
+        name = name.rpartition('.')[0]
+        path = os.path.dirname(path)
+    return packages
+
+
+def _solve_views(solver, shms, blocks, kwargs):
+    # The views into the blocks, and the outputs which may be the input views
+    # themselves, are dropped when this returns, so the blocks can be closed.
+    a, u, v = (np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+               for shm, (_, shape, dtype) in zip(shms, blocks))
+    new_u, new_v = solver(a, u, v, **kwargs)
+    assert new_u.shape == u.shape and new_v.shape == v.shape, (new_u.shape, new_v.shape)
+    u[...] = new_u
+    v[...] = new_v
+
+
+def _solve_in_worker(solver, blocks, kwargs):
+    """Solve a, u, v of the shared blocks and write u, v back into them."""
+    shms = [shared_memory.SharedMemory(name=name) for name, _, _ in blocks]
+    try:
+        _solve_views(solver, shms, blocks, kwargs)
+    except BaseException as e:
+        # The traceback would keep the views alive too.
+        traceback.clear_frames(e.__traceback__)
+        raise
+    finally:
+        for shm in shms:
+            shm.close()
+
+
+class ProcessExecutor(object):
+    """Persistent pool of processes solving `solver(a, u, v, **kwargs)`.
+
+    The solvers are module level functions, like `semi_nmf` or the ones of
+    `np_nmf`, or functools.partial of them. u and v are returned in the dtypes
+    of the given u and v, like the outputs of tf.py_func.
+
+    with ProcessExecutor(max_workers=4) as executor:
+        u, v = semi_nmf(a, u, v, executor=executor)
+
+    Args:
+        max_workers: Number of worker processes, the number of CPUs by default.
+        mp_context: Start method of the workers. 'spawn' does not inherit
+            the threads of TensorFlow, nor load it unless the main module does.
+    """
+
+    def __init__(self, max_workers=None, mp_context='spawn'):
+        worker_init = os.path.join(os.path.dirname(os.path.abspath(__file__)), '_worker_init.py')
+        self._pool = concurrent.futures.ProcessPoolExecutor(
+            max_workers=max_workers, mp_context=multiprocessing.get_context(mp_context),
+            initializer=runpy.run_path, initargs=(worker_init, dict(packages=_packages())))
+
+    def submit(self, solver, a, u, v, **kwargs):
+        """Start solving in a worker.
+
+        Returns:
+            concurrent.futures.Future of (u, v)
+        """
+        shms = []
+        blocks = []
+        future = concurrent.futures.Future()
+
+        def _done(pool_future):
+            try:
+                pool_future.result()
+                u_shm, v_shm = shms[1:]
+                future.set_result(tuple(
+                    np.array(np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf))
+                    for shm, (_, shape, dtype) in zip((u_shm, v_shm), blocks[1:])))
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                _release(shms)
+
+        # Until the pool has the blocks, they are released here, and by _done after.
+        try:
+            for matrix in (a, u, v):
+                shm, block = _to_shared(matrix)
+                shms.append(shm)
+                blocks.append(block)
+            pool_future = self._pool.submit(_solve_in_worker, solver, blocks, kwargs)
+        except BaseException:
+            _release(shms)
+            raise
+        pool_future.add_done_callback(_done)
+        return future
+
+    def run(self, solver, a, u, v, **kwargs):
+        """Solve in a worker and wait for u, v. The GIL is free while waiting."""
+        return self.submit(solver, a, u, v, **kwargs).result()
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
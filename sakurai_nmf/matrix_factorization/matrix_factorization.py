@@ -8,8 +8,13 @@ import functools
 import numpy as np
 import tensorflow as tf
 
+from .np_nmf import new_update_state, update_rules
+from .utility import LowRankCache, check_numerics_guard, issparse, numerics_guards
+
 BATCH_FIRST = True
 
+backends = ('numpy', 'tensorflow')
+
 
 def _check_shape(a, u, v, use_bias):
     a_shape = a.shape
@@ -21,94 +26,250 @@ def _check_shape(a, u, v, use_bias):
            (u_shape[1] == v_shape[0] + int(use_bias))
 
 
+def _get_solvers(use_bias, backend='numpy'):
+    """Get the module implementing the solvers of the backend."""
+    if backend == 'numpy':
+        if use_bias:
+            from . import np_biased_nmf as solvers
+        else:
+            from . import np_nmf as solvers
+    elif backend == 'tensorflow':
+        if use_bias:
+            from . import tf_biased_nmf as solvers
+        else:
+            from . import tf_nmf as solvers
+    else:
+        raise ValueError('backend should be one of {}, got {}'.format(backends, backend))
+    return solvers
+
+
+def _check_numerics(tensor, name, numerics='full', sample_size=1024):
+    """tf.check_numerics of the outputs of the TensorFlow solvers as much as numerics says.
+    
+    'full' checks every element and 'sampled' a strided sample of about
+    sample_size of them, like `utility.assert_finite`. 'sum' checks none, the
+    solvers guard their operands by the singular values, see `tf_utility._low_rank`.
+    """
+    if numerics == 'full':
+        return tf.check_numerics(tensor, name)
+    if numerics != 'sampled':
+        return tensor
+    rows, columns = tensor.shape.as_list()
+    if rows is None or columns is None:
+        step = tf.maximum(tf.cast(tf.sqrt(tf.cast(tf.size(tensor), tf.float32) / sample_size), tf.int32), 1)
+    else:
+        step = max(int(np.sqrt(rows * columns / sample_size)), 1)
+    with tf.control_dependencies([tf.check_numerics(tensor[::step, ::step], name)]):
+        return tf.identity(tensor)
+
+
+def _factorize(solver, a, u, v, use_tf=False, data_format=BATCH_FIRST, backend='numpy', executor=None,
+               numerics='full'):
+    """Run a MATLAB format solver on NumPy arrays or inside the TensorFlow graph."""
+    if executor is not None:
+        if backend == 'tensorflow':
+            raise ValueError('executor runs the numpy backend only')
+        if issparse(a):
+            raise ValueError('executor shares dense matrices only')
+        solver = functools.partial(executor.run, solver)
+    if backend == 'tensorflow':
+        # The solver is built from graph ops, so no tf.py_func is needed.
+        # It returns the dtype of its precision, cast back to the ones of u and v like `_py_func`.
+        if data_format is BATCH_FIRST:
+            tf_u_t, tf_v_t = solver(a=tf.transpose(a), u=tf.transpose(v), v=tf.transpose(u))
+            tf_u = _check_numerics(tf.cast(tf.transpose(tf_v_t), u.dtype), 'u', numerics)
+            tf_v = _check_numerics(tf.cast(tf.transpose(tf_u_t), v.dtype), 'v', numerics)
+            return tf_u, tf_v
+        # For MATLAB format.
+        tf_u, tf_v = solver(a=a, u=u, v=v)
+        return (_check_numerics(tf.cast(tf_u, u.dtype), 'u', numerics),
+                _check_numerics(tf.cast(tf_v, v.dtype), 'v', numerics))
+    
+    if (isinstance(a, np.ndarray) or issparse(a)) and not use_tf:
+        # The algorithm is implemented as MATLAB format.
+        # scipy.sparse a stays sparse and u, v are converted to ndarrays.
+        # The solver works on the batch-first matrices as they are,
+        # which are a^T, v^T and u^T in MATLAB format.
+        if data_format is BATCH_FIRST:
+            # The report of return_info follows u and v.
+            outputs = solver(a=a, u=v, v=u, transposed=True)
+            return (outputs[1], outputs[0]) + tuple(outputs[2:])
+        # For MATLAB format.
+        return solver(a=a, u=u, v=v)
+    
+    if use_tf:
+        # For using tf.py_func the shape of matrix will be <unknown>
+        u_shape = u.shape
+        v_shape = v.shape
+        # The algorithm is implemented as MATLAB format.
+        # The solver works on the batch-first matrices as they are.
+        # It guards its outputs itself, so they are not checked again here.
+        if data_format is BATCH_FIRST:
+            tf_v, tf_u = _py_func(functools.partial(solver, transposed=True),
+                                  [a, v, u],
+                                  [v.dtype, u.dtype])
+            tf_u.set_shape(u_shape)
+            tf_v.set_shape(v_shape)
+            return tf_u, tf_v
+        # For MATLAB format.
+        tf_u, tf_v = _py_func(solver, [a, u, v], [u.dtype, v.dtype])
+        tf_u.set_shape(u_shape)
+        tf_v.set_shape(v_shape)
+        return tf_u, tf_v
+    
+    raise NotImplementedError('Never implement other type matrix')
+
+
+def _convergence_kwargs(tol, return_info, use_tf, backend, executor):
+    """Options of the stopping test, which only the NumPy solvers have."""
+    if tol is None and not return_info:
+        return {}
+    if backend == 'tensorflow':
+        raise ValueError('tol and return_info are options of the numpy backend')
+    if return_info and (use_tf or executor is not None):
+        raise ValueError('return_info reports only from the numpy solvers run in this process')
+    return dict(tol=tol, return_info=return_info)
+
+
+def _numerics_kwargs(numerics):
+    """numerics of the solvers, whose TensorFlow outputs are checked by `_check_numerics` too."""
+    check_numerics_guard(numerics)
+    return dict(numerics=numerics)
+
+
+def _py_func(solver, inputs, dtypes):
+    """tf.py_func whose outputs are cast back to the dtypes of the graph."""
+    
+    def _solver(*args):
+        outputs = solver(*args)
+        return tuple(np.asarray(output, dtype=dtype.as_numpy_dtype)
+                     for output, dtype in zip(outputs, dtypes))
+    
+    return tf.py_func(_solver, inputs, dtypes)
+
+
 def semi_nmf(a, u, v,
              use_bias=False,
              use_tf=False,
              data_format=BATCH_FIRST,
              first_nneg=True,
              num_iters=1,
+             num_calc_u=1,
+             num_calc_v=1,
              rcond=1e-14,
              eps=1e-15,
              alpha=1e-2,
-             beta=1e-2):
+             beta=1e-2,
+             svd_method='economy',
+             precision='float64',
+             backend='numpy',
+             executor=None,
+             tol=None,
+             return_info=False,
+             update_rule='multiplicative',
+             numerics='full',
+             state=None):
     """Semi-NMF
     
     u, v = semi_nmf(a, u, v, use_bias=False)
     assert np.min(u) > 0, np.min(u)
     
     Args:
-        a: Original matrix factorized
+        a: Original matrix factorized, an ndarray or with NumPy a scipy.sparse matrix
         u: Non-negative Left matrix IN BATCH FIRST
         v: Right matrix in BATCH FIRST
         data_format: if BATCH_FIRST, a's shape should be [batch_size, input_size]
         use_bias: Use bias
         use_tf: When use Tensorflow, `a` should be instance of tf.placeholder
         num_iters: Number of iterations
+        num_calc_u: Number of calculating u each iteration, 0 keeps u.
+        num_calc_v: Number of calculating v each iteration, 0 keeps v.
         rcond: Reciprocal condition number
         eps:
         alpha: Coefficient for solve u.
         beta: Coefficient for solve v.
+        svd_method: Low-rank engine, 'full', 'economy', 'randomized' or a callable
+            returning (u, s, vt), see `utility.get_svd`. 'randomized' keeps every
+            singular value unless given a rank, e.g.
+            `functools.partial(utility.randomized_svd, rank=100)`. A rank truncates
+            the pseudo-inverses to the top singular triplets, so the updates solve
+            the least squares only on that subspace.
+        precision: 'float64', 'float32' or 'mixed'. 'mixed' runs the updates in
+            float32 and only the SVD in float64.
+        backend: 'numpy' runs the NumPy solvers, through tf.py_func when use_tf.
+            'tensorflow' builds the solvers from TensorFlow ops.
+        executor: `ProcessExecutor` running the NumPy solvers in its worker
+            processes, so several factorizations run in parallel.
+        tol: Stop when the relative change of the residual between two iterations
+            is at most tol, so num_iters is the cap of the iterations. NumPy solvers only.
+        return_info: Also return AttrDict(num_iters, residuals, converged) with the
+            relative residual of each iteration, when use NumPy.
+        update_rule: Engine of the update of the non-negative matrix, one of
+            `update_rules`. 'multiplicative' is the default rule, 'projected_gradient'
+            and 'accelerated' step along the projected gradient, 'accelerated' with
+            Nesterov's momentum restarted when the loss increases, and 'hals' solves
+            one row after another. NumPy solvers only.
+        numerics: How much of the matrices is scanned for NaN and inf, one of
+            `numerics_guards`. 'full' scans every matrix, 'sum' and 'sampled' check
+            the singular values the solvers compute anyway and one sum or a strided
+            sample of the outputs, and scan a matrix only when it is suspected.
+            The tensorflow backend checks the singular values only with 'sum'.
+            'off' checks nothing. Non-finite values raise MatrixFactorizationError.
+        state: `new_update_state()` keeping the Lipschitz estimate of the projected
+            gradients across calls, e.g. across the steps of training in tf.py_func.
+            The momentum restarts at every call. A new one for each call by default.
 
     Returns:
         When use TensorFlow, it returns operation u and v solved.
-        When use NumPy, it returns results of u and v.
+        When use NumPy, it returns results of u and v, and the report when return_info.
     """
     assert _check_shape(a, u, v, use_bias)
+    if executor is not None and state is not None:
+        raise ValueError('state stays in this process, so it cannot be used with executor')
     
+    solvers = _get_solvers(use_bias, backend)
+    solver_kwargs = _convergence_kwargs(tol, return_info, use_tf, backend, executor)
+    solver_kwargs.update(_numerics_kwargs(numerics))
+    if update_rule not in update_rules:
+        raise ValueError('update_rule should be one of {}, got {}'.format(update_rules, update_rule))
+    if update_rule != 'multiplicative':
+        if backend == 'tensorflow':
+            raise ValueError('update_rule {} is an option of the numpy backend'.format(update_rule))
+        solver_kwargs['update_rule'] = update_rule
+    if state is not None:
+        if backend == 'tensorflow':
+            raise ValueError('state is an option of the numpy backend')
+        solver_kwargs['state'] = state
+    # The solvers are in MATLAB format, where u and v of batch first are swapped.
+    if data_format is BATCH_FIRST:
+        num_calc_u, num_calc_v = num_calc_v, num_calc_u
     if use_bias:
-        from .np_biased_nmf import semi_nmf as semi_nmf_
-        _semi_nmf = functools.partial(semi_nmf_,
+        _semi_nmf = functools.partial(solvers.semi_nmf,
                                       alpha=alpha,
                                       beta=beta,
                                       rcond=rcond,
                                       eps=eps,
+                                      svd_method=svd_method,
+                                      precision=precision,
                                       num_iters=num_iters,
+                                      num_calc_u=num_calc_u,
+                                      num_calc_v=num_calc_v,
                                       first_nneg=first_nneg,
-                                      )
+                                      **solver_kwargs)
     else:
-        from .np_nmf import semi_nmf as semi_nmf_
-        _semi_nmf = functools.partial(semi_nmf_,
+        _semi_nmf = functools.partial(solvers.semi_nmf,
                                       rcond=rcond,
                                       eps=eps,
+                                      svd_method=svd_method,
+                                      precision=precision,
                                       num_iters=num_iters,
+                                      num_calc_u=num_calc_u,
+                                      num_calc_v=num_calc_v,
                                       first_nneg=first_nneg,
-                                      )
+                                      **solver_kwargs)
     
-    if isinstance(a, np.ndarray) and not use_tf:
-        # The algorithm is implemented as MATLAB format.
-        # So that we have to transpose the matricies.
-        if data_format is BATCH_FIRST:
-            u_t, v_t = _semi_nmf(a=a.T, u=v.T, v=u.T)
-            u = v_t.T
-            v = u_t.T
-            return u, v
-        # For MATLAB format.
-        return _semi_nmf(a=a, u=u, v=v)
-    
-    if use_tf:
-        # For using tf.py_func the shape of matrix will be <unknown>
-        u_shape = u.shape
-        v_shape = v.shape
-        # The algorithm is implemented as MATLAB format.
-        # So that we have to transpose the matricies.
-        if data_format is BATCH_FIRST:
-            a_t = tf.transpose(a)
-            tf_u_t, tf_v_t = tf.py_func(_semi_nmf,
-                                        [a_t, tf.transpose(v), tf.transpose(u)],
-                                        [tf.float64, tf.float64])
-            tf_u = tf.check_numerics(tf.transpose(tf_v_t), 'u')
-            tf_v = tf.check_numerics(tf.transpose(tf_u_t), 'v')
-            tf_u.set_shape(u_shape)
-            tf_v.set_shape(v_shape)
-            return tf_u, tf_v
-        tf_u, tf_v = tf.py_func(_semi_nmf, [a, u, v], [tf.float64, tf.float64])
-        tf_u = tf.check_numerics(tf_u, 'u')
-        tf_v = tf.check_numerics(tf_v, 'v')
-        tf_u.set_shape(u_shape)
-        tf_v.set_shape(v_shape)
-        return tf_u, tf_v
-    
-    raise NotImplementedError('Never implement other type matrix')
+    return _factorize(_semi_nmf, a, u, v, use_tf=use_tf, data_format=data_format,
+                      backend=backend, executor=executor, numerics=numerics)
 
 
 def nonlin_semi_nmf(a, u, v,
@@ -122,10 +283,18 @@ def nonlin_semi_nmf(a, u, v,
                     rcond=1e-14,
                     eps=1e-15,
                     alpha=1e-2,
-                    beta=1e-2):
+                    beta=1e-2,
+                    svd_method='economy',
+                    svd_cache=None,
+                    precision='float64',
+                    backend='numpy',
+                    executor=None,
+                    tol=None,
+                    return_info=False,
+                    numerics='full'):
     """Nonlinear Semi-NMF
     Args:
-        a: Original matrix factorized
+        a: Original matrix factorized, an ndarray or with NumPy a scipy.sparse matrix
         u: Non-negative Left matrix
         v: Right matrix
         use_bias: Use bias
@@ -138,71 +307,60 @@ def nonlin_semi_nmf(a, u, v,
         eps:
         alpha: Coefficient for solve u.
         beta: Coefficient for solve v.
+        svd_method: See `semi_nmf`.
+        svd_cache: `LowRankCache` refreshing the SVD of v across calls instead of
+            recomputing it. u is the data of the batch, which is decomposed every call.
+            A refreshed SVD is of v projected onto the refreshed subspace, off by
+            at most `drift_tol` of the norm of v, see `LowRankCache`.
+        precision: See `semi_nmf`.
+        backend: 'numpy' runs the NumPy solvers, through tf.py_func when use_tf.
+            'tensorflow' builds the solvers from TensorFlow ops.
+        executor: `ProcessExecutor` running the NumPy solvers in its worker
+            processes, so several factorizations run in parallel.
+        tol: See `semi_nmf`.
+        return_info: See `semi_nmf`.
+        numerics: See `semi_nmf`.
 
     Returns:
         When use TensorFlow, it returns operation u and v solved.
-        When use NumPy, it returns results of u and v.
+        When use NumPy, it returns results of u and v, and the report when return_info.
     """
     assert _check_shape(a, u, v, use_bias)
+    if executor is not None and svd_cache is not None:
+        raise ValueError('svd_cache stays in this process, so it cannot be used with executor')
     
+    solvers = _get_solvers(use_bias, backend)
+    convergence_kwargs = _convergence_kwargs(tol, return_info, use_tf, backend, executor)
+    convergence_kwargs.update(_numerics_kwargs(numerics))
     if use_bias:
-        from .np_biased_nmf import nonlin_semi_nmf as nonlin_semi_nmf_
-        _nonlin_semi_nmf = functools.partial(nonlin_semi_nmf_,
+        _nonlin_semi_nmf = functools.partial(solvers.nonlin_semi_nmf,
                                              alpha=alpha,
                                              beta=beta,
                                              rcond=rcond,
                                              eps=eps,
+                                             svd_method=svd_method,
+                                             precision=precision,
+                                             svd_cache=svd_cache,
                                              num_iters=num_iters,
                                              num_calc_u=num_calc_u,
                                              num_calc_v=num_calc_v,
                                              first_nneg=first_nneg,
-                                             )
+                                             **convergence_kwargs)
     else:
-        from .np_nmf import nonlin_semi_nmf as nonlin_semi_nmf_
-        _nonlin_semi_nmf = functools.partial(nonlin_semi_nmf_,
+        _nonlin_semi_nmf = functools.partial(solvers.nonlin_semi_nmf,
                                              rcond=rcond,
                                              eps=eps,
+                                             svd_method=svd_method,
+                                             precision=precision,
+                                             svd_cache=svd_cache,
                                              num_iters=num_iters,
                                              num_calc_u=num_calc_u,
                                              num_calc_v=num_calc_v,
                                              first_nneg=first_nneg,
-                                             )
-    
-    if isinstance(a, np.ndarray) and not use_tf:
-        # The algorithm is implemented as MATLAB format.
-        # So that we have to transpose the matricies.
-        if data_format is BATCH_FIRST:
-            u_t, v_t = _nonlin_semi_nmf(a=a.T, u=v.T, v=u.T)
-            u = v_t.T
-            v = u_t.T
-            return u, v
-        # For MATLAB format.
-        return _nonlin_semi_nmf(a=a, u=u, v=v)
-    
-    if use_tf:
-        # For using tf.py_func the shape of matrix will be <unknown>
-        u_shape = u.shape
-        v_shape = v.shape
-        # The algorithm is implemented as MATLAB format.
-        # So that we have to transpose the matricies.
-        if data_format is BATCH_FIRST:
-            tf_u_t, tf_v_t = tf.py_func(_nonlin_semi_nmf,
-                                        [tf.transpose(a), tf.transpose(v), tf.transpose(u)],
-                                        [tf.float64, tf.float64])
-            tf_u = tf.check_numerics(tf.transpose(tf_v_t), 'u')
-            tf_v = tf.check_numerics(tf.transpose(tf_u_t), 'v')
-            tf_u.set_shape(u_shape)
-            tf_v.set_shape(v_shape)
-            return tf_u, tf_v
-        # For MATLAB format.
-        tf_u, tf_v = tf.py_func(_nonlin_semi_nmf, [a, u, v], [tf.float64, tf.float64])
-        tf_u = tf.check_numerics(tf_u, 'u')
-        tf_v = tf.check_numerics(tf_v, 'v')
-        tf_u.set_shape(u_shape)
-        tf_v.set_shape(v_shape)
-        return tf_u, tf_v
+                                             **convergence_kwargs)
     
-    raise NotImplementedError('Never implement other type matrix')
+    return _factorize(_nonlin_semi_nmf, a, u, v, use_tf=use_tf, data_format=data_format,
+                      backend=backend, executor=executor, numerics=numerics)
 
 
 def softmax_nmf(a, u, v,
@@ -213,14 +371,21 @@ def softmax_nmf(a, u, v,
                 rcond=1e-14,
                 eps=1e-15,
                 alpha=1e-2,
-                beta=1e-2):
+                beta=1e-2,
+                svd_method='economy',
+                precision='float64',
+                backend='numpy',
+                executor=None,
+                tol=None,
+                return_info=False,
+                numerics='full'):
     """Softmax Semi-NMF
     
     u, v = semi_nmf(a, u, v, use_bias=False)
     assert np.min(u) > 0, np.min(u)
     
     Args:
-        a: Original matrix factorized
+        a: Original matrix factorized, an ndarray or with NumPy a scipy.sparse matrix
         u: Non-negative Left matrix IN BATCH FIRST
         v: Right matrix in BATCH FIRST
         data_format: if BATCH_FIRST, a's shape should be [batch_size, input_size]
@@ -231,61 +396,42 @@ def softmax_nmf(a, u, v,
         eps:
         alpha: Coefficient for solve u.
         beta: Coefficient for solve v.
+        svd_method: See `semi_nmf`.
+        precision: See `semi_nmf`.
+        backend: 'numpy' runs the NumPy solvers, through tf.py_func when use_tf.
+            'tensorflow' builds the solvers from TensorFlow ops.
+        executor: `ProcessExecutor` running the NumPy solvers in its worker
+            processes, so several factorizations run in parallel.
+        tol: See `semi_nmf`.
+        return_info: See `semi_nmf`.
+        numerics: See `semi_nmf`.
 
     Returns:
         When use TensorFlow, it returns operation u and v solved.
-        When use NumPy, it returns results of u and v.
+        When use NumPy, it returns results of u and v, and the report when return_info.
     """
     
+    solvers = _get_solvers(use_bias, backend)
+    convergence_kwargs = _convergence_kwargs(tol, return_info, use_tf, backend, executor)
+    convergence_kwargs.update(_numerics_kwargs(numerics))
     if use_bias:
-        from .np_biased_nmf import softmax_nmf as softmax_nmf_
-        _semi_nmf = functools.partial(softmax_nmf_,
+        _semi_nmf = functools.partial(solvers.softmax_nmf,
                                       alpha=alpha,
                                       beta=beta,
                                       rcond=rcond,
                                       eps=eps,
+                                      svd_method=svd_method,
+                                      precision=precision,
                                       num_iters=num_iters,
-                                      )
+                                      **convergence_kwargs)
     else:
-        from .np_nmf import softmax_nmf as softmax_nmf_
-        _semi_nmf = functools.partial(softmax_nmf_,
+        _semi_nmf = functools.partial(solvers.softmax_nmf,
                                       rcond=rcond,
                                       eps=eps,
+                                      svd_method=svd_method,
+                                      precision=precision,
                                       num_iters=num_iters,
-                                      )
-    
-    if isinstance(a, np.ndarray) and not use_tf:
-        # The algorithm is implemented as MATLAB format.
-        # So that we have to transpose the matricies.
-        if data_format is BATCH_FIRST:
-            u_t, v_t = _semi_nmf(a=a.T, u=v.T, v=u.T)
-            u = v_t.T
-            v = u_t.T
-            return u, v
-        # For MATLAB format.
-        return _semi_nmf(a=a, u=u, v=v)
-    
-    if use_tf:
-        # For using tf.py_func the shape of matrix will be <unknown>
-        u_shape = u.shape
-        v_shape = v.shape
-        # The algorithm is implemented as MATLAB format.
-        # So that we have to transpose the matricies.
-        if data_format is BATCH_FIRST:
-            a_t = tf.transpose(a)
-            tf_u_t, tf_v_t = tf.py_func(_semi_nmf,
-                                        [a_t, tf.transpose(v), tf.transpose(u)],
-                                        [tf.float64, tf.float64])
-            tf_u = tf.check_numerics(tf.transpose(tf_v_t), 'u')
-            tf_v = tf.check_numerics(tf.transpose(tf_u_t), 'v')
-            tf_u.set_shape(u_shape)
-            tf_v.set_shape(v_shape)
-            return tf_u, tf_v
-        tf_u, tf_v = tf.py_func(_semi_nmf, [a, u, v], [tf.float64, tf.float64])
-        tf_u = tf.check_numerics(tf_u, 'u')
-        tf_v = tf.check_numerics(tf_v, 'v')
-        tf_u.set_shape(u_shape)
-        tf_v.set_shape(v_shape)
-        return tf_u, tf_v
+                                      **convergence_kwargs)
     
-    raise NotImplementedError('Never implement other type matrix')
\ No newline at end of file
+    return _factorize(_semi_nmf, a, u, v, use_tf=use_tf, data_format=data_format,
+                      backend=backend, executor=executor, numerics=numerics)
\ No newline at end of file
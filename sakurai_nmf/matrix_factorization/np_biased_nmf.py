@@ -6,10 +6,148 @@ from __future__ import print_function
 
 import numpy as np
 
+from . import np_nmf
+from . import profiler
 from . import utility
 
 
-def semi_nmf(a, u, v, alpha=1e-2, beta=1e-2, rcond=1e-14, eps=1e-15, num_iters=1, first_nneg=True):
+def _stack_bias(v, transposed=False, workspace=None):
+    if workspace is not None:
+        # Write into the reused buffer of the biased matrix.
+        if transposed:
+            bias_v = workspace.get('bias_v', (v.shape[0], v.shape[1] + 1), v.dtype)
+            bias_v[:, :-1] = v
+            bias_v[:, -1] = 1.
+        else:
+            bias_v = workspace.get('bias_v', (v.shape[0] + 1, v.shape[1]), v.dtype)
+            bias_v[:-1] = v
+            bias_v[-1] = 1.
+        return bias_v
+    if transposed:
+        bias = np.ones((v.shape[0], 1), dtype=v.dtype)
+        return np.hstack((v, bias))
+    bias = np.ones((1, v.shape[1]), dtype=v.dtype)
+    return np.vstack((v, bias))
+
+
+@profiler.profile('compute_u')
+def _compute_u(a, u, bias_v, alpha=1e-2, rcond=1e-14, svd_method='economy', precision='float64',
+               transposed=False, numerics='full'):
+    """Ridge-like update of the biased left matrix."""
+    svd = utility._low_rank(bias_v, rcond=rcond, svd_method=svd_method, precision=precision,
+                            numerics=numerics)
+    ss_square = np.square(svd.s)
+    ss = np.divide(ss_square,
+                   (alpha + ss_square))
+    with profiler.phase('residual'):
+        if transposed:
+            r = utility.subtract(a, utility.matmul(bias_v, u))
+        else:
+            r = utility.subtract(a, utility.matmul(u, bias_v))
+    with profiler.phase('solve'):
+        if transposed:
+            # The left singular vectors of bias_v are the right ones of bias_v^T.
+            u = u + utility.left_solve(svd, r)
+            return utility.chain_matmul(svd.v * ss, svd.v.T, u)
+        u = u + utility.right_solve(r, svd)
+        return utility.chain_matmul(u, svd.u * ss, svd.u.T)
+
+
+@profiler.profile('compute_v')
+def _compute_v(a, u, v, bias_v, beta=1e-2, eps=1e-15, transposed=False, workspace=None):
+    """Multiplicative update of the non-negative v, in place.
+    
+    The temporaries and the returned biased v are buffers of `workspace`,
+    so v has to be owned by the caller.
+    """
+    if workspace is None:
+        workspace = utility.Workspace()
+    if transposed:
+        # (u_org^T a)^T and (u_org^T u)^T from a^T and u^T
+        u_org = u[:-1]
+        uu_shape = (u.shape[0], u_org.shape[0])
+    else:
+        u_org = u[:, :-1]
+        uu_shape = (u_org.shape[1], u.shape[1])
+    uu = workspace.get('uu', uu_shape, v.dtype)
+    uup = workspace.get('uup', uu_shape, v.dtype)
+    uum = workspace.get('uum', uu_shape, v.dtype)
+    ua = workspace.get('ua', v.shape, v.dtype)
+    numer = workspace.get('numer', v.shape, v.dtype)
+    denom = workspace.get('denom', v.shape, v.dtype)
+    
+    with profiler.phase('gram'):
+        if transposed:
+            utility.matmul(a, np.transpose(u_org), out=ua)
+            utility.matmul(u, np.transpose(u_org), out=uu)
+        else:
+            u_t = np.transpose(u_org)
+            utility.matmul(u_t, a, out=ua)
+            utility.matmul(u_t, u, out=uu)
+    with profiler.phase('update'):
+        np.maximum(uu, 0., out=uup)
+        np.minimum(uu, 0., out=uum)
+        np.negative(uum, out=uum)
+        
+        np.maximum(ua, 0., out=numer)
+        np.minimum(ua, 0., out=ua)
+        if transposed:
+            utility.matmul(bias_v, uum, out=denom)
+            numer += denom
+            utility.matmul(bias_v, uup, out=denom)
+        else:
+            utility.matmul(uum, bias_v, out=denom)
+            numer += denom
+            utility.matmul(uup, bias_v, out=denom)
+        denom -= ua
+        np.multiply(v, beta, out=ua)
+        numer += ua
+        denom += ua
+        denom += eps
+        np.divide(numer, denom, out=numer)
+        # TODO: The divide induce Nan.
+        np.maximum(numer, 0., out=numer)
+        np.sqrt(numer, out=numer)
+        v *= numer
+    return v, _stack_bias(v, transposed=transposed, workspace=workspace)
+
+
+def _unbiased_update_v(a, u, v, update_rule, state, transposed=False, workspace=None):
+    """Update v by an engine of `np_nmf._update_v` against a without the bias column of u."""
+    if transposed:
+        a_org = utility.subtract(a, np.broadcast_to(u[-1], a.shape))
+        u_org = u[:-1]
+    else:
+        a_org = utility.subtract(a, np.broadcast_to(u[:, -1:], a.shape))
+        u_org = u[:, :-1]
+    v = np_nmf._update_v(a_org, u_org, v, update_rule=update_rule, state=state, transposed=transposed,
+                         workspace=workspace)
+    return v, _stack_bias(v, transposed=transposed, workspace=workspace)
+
+
+def _update_v(a, u, v, bias_v, update_rule='multiplicative', state=None, beta=1e-2, eps=1e-15,
+              transposed=False, workspace=None):
+    """Update the non-negative v in place by the engine of update_rule.
+    
+    Only the multiplicative rule has beta. The others are the ones of
+    `np_nmf` on the residual of the bias.
+    """
+    if update_rule == 'multiplicative':
+        return _compute_v(a, u, v, bias_v, beta=beta, eps=eps, transposed=transposed, workspace=workspace)
+    return _unbiased_update_v(a, u, v, update_rule, state, transposed=transposed, workspace=workspace)
+
+
+@profiler.profile('monitor')
+def _monitor(convergence, u, bias_v, alpha, num_calc_u, transposed):
+    """Add the residual of u just solved by the ridge-like least squares."""
+    if convergence is not None and num_calc_u:
+        convergence.add(utility.least_squares_residual(convergence.a_norm_sq, u, bias_v, alpha=alpha,
+                                                       transposed=transposed))
+
+
+def semi_nmf(a, u, v, alpha=1e-2, beta=1e-2, rcond=1e-14, eps=1e-15, num_iters=1, num_calc_u=1, num_calc_v=1,
+             first_nneg=True, svd_method='economy', precision='float64', transposed=False, workspace=None,
+             tol=None, return_info=False, update_rule='multiplicative', numerics='full', state=None):
     """Biased Semi-NMF
     Args:
         a: Original matrix factorized
@@ -17,58 +155,70 @@ def semi_nmf(a, u, v, alpha=1e-2, beta=1e-2, rcond=1e-14, eps=1e-15, num_iters=1
         v: Non-negative matrix
         rcond: Reciprocal condition number
         eps:
+        num_calc_u: Number of calculating u each iteration, 0 keeps u.
+        num_calc_v: Number of calculating v each iteration, 0 keeps v.
+        svd_method: Low-rank engine, see `utility.get_svd`
+        precision: 'float64', 'float32' or 'mixed', see `utility.get_dtypes`
+        transposed: a, u and v are given as a^T, u^T and v^T (batch-first layout)
+            and u^T, v^T are returned, without transposing any of them.
+        workspace: `utility.Workspace` holding the buffers of the update of v
+        tol: Stop at this relative change of the residual, see `matrix_factorization.semi_nmf`.
+        return_info: Also return the report of `utility.Convergence.info`.
+            The residual is measured right after each solve of u.
+        update_rule: Engine of the update of v, one of `np_nmf.update_rules`.
+            Only the multiplicative rule has beta.
+        numerics: One of `utility.numerics_guards`, see `matrix_factorization.semi_nmf`.
+        state: `np_nmf.new_update_state()` of the projected gradients, whose
+            eigenvector is kept across the calls, a new one for this call by default.
 
     Returns:
         u, v
     """
-    n = v.shape[1]
-    bias = np.ones((n, 1))
-    bias_v = np.vstack((v, bias.T))
-    
-    def _compute_u(u, bias_v):
-        svd = utility._low_rank(bias_v, rcond=rcond)
-        u_t = np.transpose(svd.u)
-        r = a - u @ bias_v
-        rv = r @ svd.v
-        s_inv = np.linalg.inv(svd.s)
-        u = u + (rv @ s_inv) @ u_t
-        ss = np.diag(svd.s)
-        ss_square = np.square(ss)
-        ss = np.divide(ss_square,
-                       (alpha + ss_square))
-        u = u @ (svd.u @ np.diag(ss) @ u_t)
-        return u
-    
-    def _compute_v(u, v, bias_v):
-        u_org = u[:, :-1]
-        u_t = np.transpose(u_org)
-        ua = u_t @ a
-        uap = (np.abs(ua) + ua) * 0.5
-        uam = (np.abs(ua) - ua) * 0.5
-        uu = u_t @ u
-        uup = (np.abs(uu) + uu) * 0.5
-        uum = (np.abs(uu) - uu) * 0.5
-        
-        divide = np.divide(uap + uum @ bias_v + beta * v,
-                           uam + uup @ bias_v + beta * v + eps)
-        # TODO: The divide induce Nan.
-        divide[divide < 0.] = 0.
-        sqrt = np.sqrt(divide)
-        v = np.multiply(v, sqrt)
-        bias_v = np.vstack((v, bias.T))
-        return v, bias_v
+    if update_rule not in np_nmf.update_rules:
+        raise ValueError('update_rule should be one of {}, got {}'.format(np_nmf.update_rules, update_rule))
+    if state is None:
+        state = np_nmf.new_update_state()
+    np_nmf._restart_momentum(state)
+    utility.check_numerics_guard(numerics)
+    a, u, v = utility.cast(precision, a, u, v)
+    u, v = utility.dense(u, v)
+    # v is updated in place.
+    v = v.copy()
+    if workspace is None:
+        workspace = utility.Workspace()
+    bias_v = _stack_bias(v, transposed=transposed, workspace=workspace)
+    convergence = utility.Convergence(a, tol=tol) if tol is not None or return_info else None
     
-    for _ in range(num_iters):
+    i = 0
+    for i in range(1, num_iters + 1):
         if first_nneg:
-            v, bias_v = _compute_v(u, v, bias_v)
-            u = _compute_u(u, bias_v)
+            for _ in range(num_calc_v):
+                v, bias_v = _update_v(a, u, v, bias_v, update_rule=update_rule, state=state, beta=beta,
+                                      eps=eps, transposed=transposed, workspace=workspace)
+            for _ in range(num_calc_u):
+                u = _compute_u(a, u, bias_v, alpha=alpha, rcond=rcond, svd_method=svd_method,
+                               precision=precision, transposed=transposed, numerics=numerics)
+            _monitor(convergence, u, bias_v, alpha, num_calc_u, transposed)
         else:
-            u = _compute_u(u, bias_v)
-            v, bias_v = _compute_v(u, v, bias_v)
+            for _ in range(num_calc_u):
+                u = _compute_u(a, u, bias_v, alpha=alpha, rcond=rcond, svd_method=svd_method,
+                               precision=precision, transposed=transposed, numerics=numerics)
+            _monitor(convergence, u, bias_v, alpha, num_calc_u, transposed)
+            for _ in range(num_calc_v):
+                v, bias_v = _update_v(a, u, v, bias_v, update_rule=update_rule, state=state, beta=beta,
+                                      eps=eps, transposed=transposed, workspace=workspace)
+        if convergence is not None and convergence.converged:
+            break
+    utility.assert_finite('u', u, numerics=numerics)
+    utility.assert_finite('v', v, numerics=numerics)
+    if return_info:
+        return u, v, convergence.info(i)
     return u, v
 
 
-def softmax_nmf(a, u, v, alpha=1e-2, beta=1e-2, rcond=1e-14, eps=1e-15, num_iters=1):
+def softmax_nmf(a, u, v, alpha=1e-2, beta=1e-2, rcond=1e-14, eps=1e-15, num_iters=1, svd_method='economy',
+                precision='float64', transposed=False, workspace=None, tol=None, return_info=False,
+                numerics='full'):
     """Softmax Biased Semi-NMF
     Args:
         a: Original matrix factorized
@@ -76,116 +226,127 @@ def softmax_nmf(a, u, v, alpha=1e-2, beta=1e-2, rcond=1e-14, eps=1e-15, num_iter
         v: Non-negative matrix
         rcond: Reciprocal condition number
         eps:
+        svd_method: Low-rank engine, see `utility.get_svd`
+        precision: 'float64', 'float32' or 'mixed', see `utility.get_dtypes`
+        transposed: a, u and v are given as a^T, u^T and v^T (batch-first layout)
+            and u^T, v^T are returned, without transposing any of them.
+        workspace: `utility.Workspace` holding the buffers of the update of v
+        tol: Stop at this relative change of the residual, see `matrix_factorization.semi_nmf`.
+        return_info: Also return the report of `utility.Convergence.info`.
+        numerics: One of `utility.numerics_guards`, see `matrix_factorization.semi_nmf`.
 
     Returns:
         u, v
     """
-    n = v.shape[1]
-    bias = np.ones((n, 1))
-    bias_v = np.vstack((v, bias.T))
-    
-    def _compute_u(u, bias_v):
-        svd = utility._low_rank(bias_v, rcond=rcond)
-        u_t = np.transpose(svd.u)
-        r = a - u @ bias_v
-        rv = r @ svd.v
-        s_inv = np.linalg.inv(svd.s)
-        u = u + (rv @ s_inv) @ u_t
-        ss = np.diag(svd.s)
-        ss_square = np.square(ss)
-        ss = np.divide(ss_square,
-                       (alpha + ss_square))
-        u = u @ (svd.u @ np.diag(ss) @ u_t)
-        return u
-    
-    def _compute_v(u, v, bias_v):
-        u_org = u[:, :-1]
-        u_t = np.transpose(u_org)
-        ua = u_t @ a
-        uap = (np.abs(ua) + ua) * 0.5
-        uam = (np.abs(ua) - ua) * 0.5
-        uu = u_t @ u
-        uup = (np.abs(uu) + uu) * 0.5
-        uum = (np.abs(uu) - uu) * 0.5
-        
-        divide = np.divide(uap + uum @ bias_v + beta * v,
-                           uam + uup @ bias_v + beta * v + eps)
-        # TODO: The divide induce Nan.
-        divide[divide < 0.] = 0.
-        sqrt = np.sqrt(divide)
-        v = np.multiply(v, sqrt)
-        bias_v = np.vstack((v, bias.T))
-        return v, bias_v
+    utility.check_numerics_guard(numerics)
+    a, u, v = utility.cast(precision, a, u, v)
+    u, v = utility.dense(u, v)
+    # v is updated in place.
+    v = v.copy()
+    if workspace is None:
+        workspace = utility.Workspace()
+    bias_v = _stack_bias(v, transposed=transposed, workspace=workspace)
+    convergence = utility.Convergence(a, tol=tol) if tol is not None or return_info else None
     
-    for _ in range(num_iters):
-        v, bias_v = _compute_v(u, v, bias_v)
-        v = utility.softmax(v)
-        bias_v = utility.softmax(bias_v)
-        u = _compute_u(u, bias_v)
+    i = 0
+    for i in range(1, num_iters + 1):
+        v, bias_v = _compute_v(a, u, v, bias_v, beta=beta, eps=eps, transposed=transposed,
+                               workspace=workspace)
+        axis = 1 if transposed else 0
+        v = utility.softmax(v, axis=axis)
+        bias_v = utility.softmax(bias_v, axis=axis)
+        u = _compute_u(a, u, bias_v, alpha=alpha, rcond=rcond, svd_method=svd_method,
+                       precision=precision, transposed=transposed, numerics=numerics)
+        _monitor(convergence, u, bias_v, alpha, 1, transposed)
+        if convergence is not None and convergence.converged:
+            break
+    utility.assert_finite('u', u, numerics=numerics)
+    utility.assert_finite('v', v, numerics=numerics)
+    if return_info:
+        return u, v, convergence.info(i)
     return u, v
 
 
-def _nonlin_solve(a, b, x, _lambda=1e-2, rcond=1e-14, eps=1e-15, num_iters=1, solve_ax=True):
+@profiler.profile('nonlin_solve')
+def _nonlin_solve(a, b, x, _lambda=1e-2, rcond=1e-14, eps=1e-15, num_iters=1, solve_ax=True,
+                  svd_method='economy', svd_cache=None, cache_key=None, precision='float64',
+                  transposed=False, numerics='full'):
     """Nonlinear Solver.
     Args:
         num_iters: Number of iterations each solving.
         solve_ax: Whether to solve min_x || b - f(ax) || or min_x || b - f(xa) ||
+        svd_method: Low-rank engine, see `utility.get_svd`
+        svd_cache: `utility.LowRankCache` reused across calls
+        cache_key: Key of `a` in svd_cache
+        precision: 'float64', 'float32' or 'mixed', see `utility.get_dtypes`
+        transposed: a, b and x are given as a^T, b^T and x^T
+        numerics: One of `utility.numerics_guards`, a is guarded by its SVD
     """
+    if num_iters == 0:
+        return x
     _omega = 1.0
     
     def _solve_ax(x):
         """
          min_x || b - f(ax) ||
         """
-        a_svd = utility._low_rank(a[:, :-1], rcond=1e-14)
-        u = a_svd.u
-        s = a_svd.s
-        v = a_svd.v
+        a_org = a[:-1] if transposed else a[:, :-1]
+        a_svd = utility._low_rank(a_org, rcond=1e-14, svd_method=svd_method,
+                                  svd_cache=svd_cache, cache_key=(cache_key, 'a'),
+                                  precision=precision, numerics=numerics)
         
-        n = a.shape[1]
-        bias = np.ones((x.shape[1], 1))
-        bias_x = np.vstack((x, bias.T))
-        _aa = a[:, :-1].T @ a[:, :-1]
-        u_svd = utility._low_rank(_aa, rcond=rcond)
+        bias_x = _stack_bias(x, transposed=transposed)
+        _aa = a_org @ a_org.T if transposed else a_org.T @ a_org
+        u_svd = utility._low_rank(_aa, rcond=rcond, svd_method=svd_method,
+                                  svd_cache=svd_cache, cache_key=(cache_key, 'aa'),
+                                  precision=precision, numerics=numerics)
+        # aa is symmetric, aa = u diag(s) u^T, so the inverse of (I + lambda * pinv(aa)),
+        # which does not depend on x, is I - u diag(lambda / (s + lambda)) u^T.
+        shrink = _lambda / (u_svd.s + _lambda)
         
         for _ in range(num_iters):
-            r = b - utility.relu(a @ bias_x)
-            ur = u.T @ r
-            sur_solve = np.linalg.solve(s, ur)
-            x = x + _omega * (v @ sur_solve)
-            _eye = np.eye(n - 1)
-            su_solve = np.linalg.solve(u_svd.s, u_svd.u.T)
-            vsu = u_svd.v @ su_solve
-            _x = _eye + _lambda * vsu
-            x = np.linalg.solve(_x, x)
+            with profiler.phase('residual'):
+                if transposed:
+                    r = utility.subtract(b, utility.relu(utility.matmul(bias_x, a)))
+                else:
+                    r = utility.subtract(b, utility.relu(utility.matmul(a, bias_x)))
+            with profiler.phase('solve'):
+                if transposed:
+                    x = x + _omega * utility.right_solve(r, a_svd)
+                    x = x - utility.chain_matmul(x, u_svd.u * shrink, u_svd.u.T)
+                else:
+                    x = x + _omega * utility.left_solve(a_svd, r)
+                    x = x - utility.chain_matmul(u_svd.u * shrink, u_svd.u.T, x)
             x = utility.relu(x)
-            bias_x = np.vstack((x, bias.T))
+            bias_x = _stack_bias(x, transposed=transposed)
         return x
     
     def _solve_xa(x):
         """
          min_x || b - f(xa) ||
         """
-        bias = np.ones((a.shape[1], 1))
-        _a = np.vstack((a, bias.T))
-        a_svd = utility._low_rank(_a, rcond=rcond)
-        u = a_svd.u
-        s = a_svd.s
-        v = a_svd.v
+        bias_x = _stack_bias(a, transposed=transposed)
+        a_svd = utility._low_rank(bias_x, rcond=rcond, svd_method=svd_method,
+                                  svd_cache=svd_cache, cache_key=(cache_key, 'a'),
+                                  precision=precision, numerics=numerics)
+        ss_square = np.square(a_svd.s)
+        ss = np.divide(ss_square,
+                       ss_square + _lambda)
         
-        bias = np.ones((a.shape[1], 1))
-        bias_x = np.vstack((a, bias.T))
         for _ in range(num_iters):
-            r = b - utility.relu(x @ bias_x)
-            rv = r @ v
-            s_inv = np.linalg.inv(s)
-            rvs = rv @ s_inv
-            x = x + _omega * (rvs @ u.T)
-            ss = np.diag(s)
-            ss = np.divide(
-                np.square(ss),
-                np.square(ss) + _lambda)
-            x = x @ (u @ np.diag(ss) @ u.T)
+            with profiler.phase('residual'):
+                if transposed:
+                    r = utility.subtract(b, utility.relu(utility.matmul(bias_x, x)))
+                else:
+                    r = utility.subtract(b, utility.relu(utility.matmul(x, bias_x)))
+            with profiler.phase('solve'):
+                if transposed:
+                    # The left singular vectors of bias_x are the right ones of bias_x^T.
+                    x = x + _omega * utility.left_solve(a_svd, r)
+                    x = utility.chain_matmul(a_svd.v * ss, a_svd.v.T, x)
+                else:
+                    x = x + _omega * utility.right_solve(r, a_svd)
+                    x = utility.chain_matmul(x, a_svd.u * ss, a_svd.u.T)
         return x
     
     if solve_ax:
@@ -195,7 +356,8 @@ def _nonlin_solve(a, b, x, _lambda=1e-2, rcond=1e-14, eps=1e-15, num_iters=1, so
 
 
 def nonlin_semi_nmf(a, u, v, alpha=1e2, beta=1e-2, rcond=1e-14, eps=1e-15, num_iters=1, num_calc_u=1, num_calc_v=1,
-                    first_nneg=True, batch_first=True):
+                    first_nneg=True, batch_first=True, svd_method='economy', svd_cache=None,
+                    precision='float64', transposed=False, tol=None, return_info=False, numerics='full'):
     """Biased Nonlinear Semi-NMF
     Args:
         a: Original non-negative matrix factorized
@@ -207,22 +369,60 @@ def nonlin_semi_nmf(a, u, v, alpha=1e2, beta=1e-2, rcond=1e-14, eps=1e-15, num_i
         eps:
         num_iters: Number of iterations
         batch_first: like TensorFlow format.
+        svd_method: Low-rank engine, see `utility.get_svd`
+        svd_cache: `utility.LowRankCache` keeping the SVD of u across calls. v is
+            the data of the batch, which is new every call, so it is not cached.
+            A refreshed SVD is of u projected onto the refreshed subspace, off by
+            at most `drift_tol` of the norm of u, see `utility.LowRankCache`.
+        precision: 'float64', 'float32' or 'mixed', see `utility.get_dtypes`
+        transposed: a, u and v are given as a^T, u^T and v^T (batch-first layout)
+            and u^T, v^T are returned, without transposing any of them.
+        tol: Stop at this relative change of || a - f(u [v; 1]) ||, see `matrix_factorization.semi_nmf`.
+        return_info: Also return the report of `utility.Convergence.info`.
+        numerics: One of `utility.numerics_guards`, see `matrix_factorization.semi_nmf`.
 
     Returns:
 
     """
+    utility.check_numerics_guard(numerics)
+    a, u, v = utility.cast(precision, a, u, v)
+    u, v = utility.dense(u, v)
     if batch_first:
         num_calc_u, num_calc_v = num_calc_v, num_calc_u
+    convergence = utility.Convergence(a, tol=tol) if tol is not None or return_info else None
     
-    for _ in range(num_iters):
+    i = 0
+    for i in range(1, num_iters + 1):
         if first_nneg:
             # In batch first, v has negative elements.
-            v = _nonlin_solve(u, a, v, _lambda=beta, rcond=rcond, eps=eps, solve_ax=True, num_iters=num_calc_v)
+            v = _nonlin_solve(u, a, v, _lambda=beta, rcond=rcond, eps=eps, solve_ax=True, num_iters=num_calc_v,
+                              svd_method=svd_method, svd_cache=svd_cache, cache_key='u',
+                              precision=precision, transposed=transposed, numerics=numerics)
             # In batch first, u has only non-negative elements.
-            u = _nonlin_solve(v, a, u, _lambda=alpha, rcond=rcond, eps=eps, solve_ax=False, num_iters=num_calc_u)
+            u = _nonlin_solve(v, a, u, _lambda=alpha, rcond=rcond, eps=eps, solve_ax=False, num_iters=num_calc_u,
+                              svd_method=svd_method, precision=precision, transposed=transposed,
+                              numerics=numerics)
         else:
             # In batch first, u has only non-negative elements.
-            u = _nonlin_solve(v, a, u, _lambda=alpha, rcond=rcond, eps=eps, solve_ax=False, num_iters=num_calc_u)
+            u = _nonlin_solve(v, a, u, _lambda=alpha, rcond=rcond, eps=eps, solve_ax=False, num_iters=num_calc_u,
+                              svd_method=svd_method, precision=precision, transposed=transposed,
+                              numerics=numerics)
             # In batch first, v has negative elements.
-            v = _nonlin_solve(u, a, v, _lambda=beta, rcond=rcond, eps=eps, solve_ax=True, num_iters=num_calc_v)
+            v = _nonlin_solve(u, a, v, _lambda=beta, rcond=rcond, eps=eps, solve_ax=True, num_iters=num_calc_v,
+                              svd_method=svd_method, svd_cache=svd_cache, cache_key='u',
+                              precision=precision, transposed=transposed, numerics=numerics)
+        if convergence is not None:
+            # The least-squares identity does not hold through f, so the residual is formed.
+            with profiler.phase('monitor'):
+                if transposed:
+                    uv = _stack_bias(v, transposed=True) @ u
+                else:
+                    uv = u @ _stack_bias(v)
+                convergence.add(np.linalg.norm(utility.subtract(a, utility.relu(uv))))
+            if convergence.converged:
+                break
+    utility.assert_finite('u', u, numerics=numerics)
+    utility.assert_finite('v', v, numerics=numerics)
+    if return_info:
+        return u, v, convergence.info(i)
     return u, v
\ No newline at end of file
@@ -6,10 +6,251 @@ from __future__ import print_function
 
 import numpy as np
 
+from . import profiler
 from . import utility
 
+update_rules = ('multiplicative', 'accelerated', 'projected_gradient', 'hals')
 
-def semi_nmf(a, u, v, rcond=1e-14, eps=1e-15, num_iters=1, first_nneg=True):
+
+@profiler.profile('compute_u')
+def _compute_u(a, v, rcond=1e-14, svd_method='economy', precision='float64', transposed=False,
+               numerics='full'):
+    """Solve min_u || a - uv || by the pseudo inverse of v."""
+    svd = utility._low_rank(v, rcond=rcond, svd_method=svd_method, precision=precision, numerics=numerics)
+    with profiler.phase('solve'):
+        if transposed:
+            # u^T = pinv(v^T) a^T
+            return utility.left_solve(svd, a)
+        return utility.right_solve(a, svd)
+
+
+@profiler.profile('gram')
+def _gram_products(a, u, v, workspace, transposed=False):
+    """u^T a and u^T u into the buffers 'uta' and 'utu' of workspace.
+    
+    With transposed, a^T and u^T are given and (u^T a)^T is computed, which
+    has the shape of v^T.
+    """
+    k = v.shape[1] if transposed else v.shape[0]
+    uta = workspace.get('uta', v.shape, v.dtype)
+    utu = workspace.get('utu', (k, k), v.dtype)
+    if transposed:
+        utility.matmul(a, np.transpose(u), out=uta)
+        utility.matmul(u, np.transpose(u), out=utu)
+    else:
+        u_t = np.transpose(u)
+        utility.matmul(u_t, a, out=uta)
+        utility.matmul(u_t, u, out=utu)
+    return uta, utu
+
+
+@profiler.profile('compute_v')
+def _compute_v(a, u, v, eps=1e-15, transposed=False, workspace=None):
+    """Multiplicative update of the non-negative v, in place.
+    
+    v <- v * sqrt(([u^T a]^+ + [u^T u]^- v) / ([u^T a]^- + [u^T u]^+ v + eps))
+    where [x]^+ = max(x, 0) and [x]^- = -min(x, 0). Every temporary is a buffer
+    of `workspace`, so v has to be owned by the caller. The buffers 'uta' and
+    'utu' keep u^T a and u^T u for `utility.gram_residual`.
+    """
+    if workspace is None:
+        workspace = utility.Workspace()
+    k = v.shape[1] if transposed else v.shape[0]
+    u_tu_p = workspace.get('utu_p', (k, k), v.dtype)
+    u_tu_m = workspace.get('utu_m', (k, k), v.dtype)
+    u_ta_m = workspace.get('uta_m', v.shape, v.dtype)
+    numer = workspace.get('numer', v.shape, v.dtype)
+    denom = workspace.get('denom', v.shape, v.dtype)
+    
+    # (u^T a)^T and (u^T u) from a^T and u^T when transposed
+    uta, utu = _gram_products(a, u, v, workspace, transposed=transposed)
+    with profiler.phase('update'):
+        np.maximum(utu, 0., out=u_tu_p)
+        np.minimum(utu, 0., out=u_tu_m)
+        np.negative(u_tu_m, out=u_tu_m)
+        
+        np.maximum(uta, 0., out=numer)
+        np.minimum(uta, 0., out=u_ta_m)
+        if transposed:
+            # utu is symmetric, so (utu v)^T = v^T utu
+            utility.matmul(v, u_tu_m, out=denom)
+            numer += denom
+            utility.matmul(v, u_tu_p, out=denom)
+        else:
+            utility.matmul(u_tu_m, v, out=denom)
+            numer += denom
+            utility.matmul(u_tu_p, v, out=denom)
+        denom -= u_ta_m
+        denom += eps
+        np.divide(numer, denom, out=numer)
+        # TODO: The divide induce Nan.
+        np.maximum(numer, 0., out=numer)
+        np.sqrt(numer, out=numer)
+        v *= numer
+    return v
+
+
+@profiler.profile('hals_v')
+def _hals_v(a, u, v, transposed=False, workspace=None):
+    """One sweep of hierarchical ALS over the rows of the non-negative v, in place.
+    
+    Each row v_j, the coefficients of the column u_j, is solved exactly with
+    the other rows fixed, v_j <- max(v_j + ([u^T a]_j - [u^T u]_j v) / [u^T u]_jj, 0),
+    so one sweep is k updates vectorized over the columns of v. Rows of v^T
+    when transposed.
+    """
+    if workspace is None:
+        workspace = utility.Workspace()
+    uta, utu = _gram_products(a, u, v, workspace, transposed=transposed)
+    diag = np.diagonal(utu)
+    # u_j under the round-off, e.g. solved for a zero row of v, leaves v_j as it is.
+    cutoff = np.finfo(utu.dtype).eps * np.max(diag)
+    for j in range(len(utu)):
+        if diag[j] <= cutoff:
+            continue
+        if transposed:
+            v[:, j] += (uta[:, j] - v @ utu[:, j]) / utu[j, j]
+            np.maximum(v[:, j], 0., out=v[:, j])
+        else:
+            v[j] += (uta[j] - utu[j] @ v) / utu[j, j]
+            np.maximum(v[j], 0., out=v[j])
+    return v
+
+
+def new_update_state():
+    """State of `_projected_gradient_v` kept across the iterations of a solver.
+    
+    Given to the solvers as state, only the eigenvector of `_max_eigenvalue`
+    is kept across their calls. The momentum restarts at every call, since
+    the v of another call, e.g. of another batch, is of other samples.
+    """
+    return utility.AttrDict(v_prev=None, t=1., eigvec=None)
+
+
+def _restart_momentum(state):
+    with state.unlocked:
+        state.v_prev = None
+        state.t = 1.
+
+
+def _max_eigenvalue(utu, state, num_iters=10):
+    """Largest eigenvalue of the symmetric u^T u by the power iteration.
+    
+    The eigenvector of the previous call is the start, since u changes little
+    between the iterations.
+    """
+    vec = state.eigvec
+    if vec is None or len(vec) != len(utu):
+        vec = np.ones(len(utu), dtype=utu.dtype)
+    for _ in range(num_iters):
+        vec = utu @ vec
+        norm = np.linalg.norm(vec)
+        if norm == 0.:
+            return 1.
+        vec /= norm
+    with state.unlocked:
+        state.eigvec = vec
+    return max(float(vec @ utu @ vec), np.finfo(utu.dtype).tiny)
+
+
+@profiler.profile('projected_gradient_v')
+def _projected_gradient_v(a, u, v, state, accelerate=False, transposed=False, workspace=None,
+                          max_backtracks=10):
+    """Projected gradient step of the non-negative v, in place.
+    
+    min_{v >= 0} || a - uv ||^2 / 2 has the gradient u^T u v - u^T a, which is
+    Lipschitz with the largest eigenvalue L of u^T u, so the step is
+    v <- max(v - (u^T u v - u^T a) / L, 0). When accelerate, it starts from the
+    point extrapolated by Nesterov's momentum, y = v + (t_prev - 1) / t (v - v_prev).
+    If the loss increases, the momentum restarts and the step is retaken from
+    v, doubling L until the loss decreases.
+    
+    Args:
+        state: `new_update_state()` carried across the calls of one solve.
+        accelerate: Extrapolate with Nesterov's momentum.
+    """
+    if workspace is None:
+        workspace = utility.Workspace()
+    uta, utu = _gram_products(a, u, v, workspace, transposed=transposed)
+    
+    def _gram(x):
+        # u^T u x, or x^T u^T u from x^T since u^T u is symmetric
+        return x @ utu if transposed else utu @ x
+    
+    def _loss(x, utux):
+        # || a - ux ||^2 - || a ||^2
+        return np.sum(x * utux) - 2. * np.sum(uta * x)
+    
+    def _step(x, utux, lipschitz):
+        new_x = np.maximum(x - (utux - uta) / lipschitz, 0.)
+        return new_x, _loss(new_x, _gram(new_x))
+    
+    lipschitz = _max_eigenvalue(utu, state)
+    utuv = _gram(v)
+    loss = _loss(v, utuv)
+    t = 1.
+    new_v, new_loss = None, np.inf
+    if accelerate and state.v_prev is not None and state.v_prev.shape == v.shape:
+        t = (1. + np.sqrt(1. + 4. * state.t ** 2)) / 2.
+        y = v + ((state.t - 1.) / t) * (v - state.v_prev)
+        new_v, new_loss = _step(y, _gram(y), lipschitz)
+    if new_loss > loss:
+        # Restart from v without the momentum.
+        t = 1.
+        new_v, new_loss = _step(v, utuv, lipschitz)
+        for _ in range(max_backtracks):
+            if new_loss <= loss:
+                break
+            lipschitz *= 2.
+            new_v, new_loss = _step(v, utuv, lipschitz)
+    with state.unlocked:
+        if accelerate:
+            state.v_prev = v.copy()
+        state.t = t
+    if new_loss <= loss:
+        v[...] = new_v
+    return v
+
+
+def _update_v(a, u, v, update_rule='multiplicative', state=None, eps=1e-15, transposed=False,
+              workspace=None):
+    """Update the non-negative v in place by the engine of update_rule.
+    
+    Every engine leaves u^T a and u^T u in the buffers 'uta' and 'utu' of
+    workspace. state is `new_update_state()` for the projected gradients.
+    """
+    if update_rule == 'multiplicative':
+        return _compute_v(a, u, v, eps=eps, transposed=transposed, workspace=workspace)
+    if update_rule == 'hals':
+        return _hals_v(a, u, v, transposed=transposed, workspace=workspace)
+    return _projected_gradient_v(a, u, v, state, accelerate=update_rule == 'accelerated',
+                                 transposed=transposed, workspace=workspace)
+
+
+@profiler.profile('monitor')
+def _monitor(convergence, a, u, v, solved_u, transposed=False, workspace=None):
+    """Add the residual after the last update.
+    
+    After the least-squares solve of u the Gram matrices of u and v suffice,
+    after the update of v the products `_compute_v` left in workspace do.
+    """
+    if convergence is None:
+        return
+    if solved_u:
+        residual = utility.least_squares_residual(convergence.a_norm_sq, u, v, transposed=transposed)
+    elif workspace is not None:
+        k = v.shape[1] if transposed else v.shape[0]
+        uta = workspace.get('uta', v.shape, v.dtype)
+        utu = workspace.get('utu', (k, k), v.dtype)
+        residual = utility.gram_residual(convergence.a_norm_sq, uta, utu, v, transposed=transposed)
+    else:
+        residual = np.linalg.norm(utility.subtract(a, v @ u if transposed else u @ v))
+    convergence.add(residual)
+
+
+def semi_nmf(a, u, v, rcond=1e-14, eps=1e-15, num_iters=1, num_calc_u=1, num_calc_v=1, first_nneg=True,
+             svd_method='economy', precision='float64', transposed=False, workspace=None, tol=None,
+             return_info=False, update_rule='multiplicative', numerics='full', state=None):
     """Semi-NMF
     Args:
         a: Original matrix factorized
@@ -18,52 +259,75 @@ def semi_nmf(a, u, v, rcond=1e-14, eps=1e-15, num_iters=1, first_nneg=True):
         rcond: Reciprocal condition number
         eps:
         num_iters: Number of iterations
+        num_calc_u: Number of calculating u each iteration, 0 keeps u.
+        num_calc_v: Number of calculating v each iteration, 0 keeps v.
         first_nneg: Compute Non-negative matrix first
+        svd_method: Low-rank engine, see `utility.get_svd`
+        precision: 'float64', 'float32' or 'mixed', see `utility.get_dtypes`
+        transposed: a, u and v are given as a^T, u^T and v^T (batch-first layout)
+            and u^T, v^T are returned, without transposing any of them.
+        workspace: `utility.Workspace` holding the buffers of the update of v
+        tol: Stop at this relative change of the residual, see `matrix_factorization.semi_nmf`.
+        return_info: Also return the report of `utility.Convergence.info`.
+            The residual is measured at the end of each iteration, from the
+            products the last update computed.
+        update_rule: Engine of the update of v, one of `update_rules`.
+            'multiplicative' is the rule of `_compute_v`, 'projected_gradient'
+            and 'accelerated' (with Nesterov's momentum) are `_projected_gradient_v`
+            and 'hals' is `_hals_v`.
+        numerics: One of `utility.numerics_guards`, see `matrix_factorization.semi_nmf`.
+        state: `new_update_state()` of the projected gradients, whose eigenvector
+            is kept across the calls, a new one for this call by default.
 
     Returns:
         u, v
     """
-    
-    def _compute_u(v):
-        svd = utility._low_rank(v, rcond=rcond)
-        u_t = np.transpose(svd.u)
-        _v = svd.v
-        s_inv = np.linalg.inv(svd.s)
-        u = ((a @ _v) @ s_inv) @ u_t
-        return u
-    
-    def _compute_v(u, v):
-        u_t = np.transpose(u)
-        uta = u_t @ a
-        u_ta_p = (np.abs(uta) + uta) * 0.5
-        u_ta_m = (np.abs(uta) - uta) * 0.5
-        utu = u_t @ u
-        u_tu_p = (np.abs(utu) + utu) * 0.5
-        u_tu_m = (np.abs(utu) - utu) * 0.5
-        
-        uvm = u_tu_m @ v
-        uvp = u_tu_p @ v
-        divide = np.divide(u_ta_p + uvm,
-                           u_ta_m + uvp + eps)
-        # TODO: The divide induce Nan.
-        # assert not divide[divide < 0.].sum(), '-1'
-        divide[divide < 0.] = 0.
-        sqrt = np.sqrt(divide)
-        v = np.multiply(v, sqrt)
-        return v
-    
-    for _ in range(num_iters):
-        assert not np.isnan(v).any(), utility.have_nan('v', v)
+    if update_rule not in update_rules:
+        raise ValueError('update_rule should be one of {}, got {}'.format(update_rules, update_rule))
+    if state is None:
+        state = new_update_state()
+    _restart_momentum(state)
+    utility.check_numerics_guard(numerics)
+    a, u, v = utility.cast(precision, a, u, v)
+    u, v = utility.dense(u, v)
+    # v is updated in place.
+    v = v.copy()
+    if workspace is None:
+        workspace = utility.Workspace()
+    convergence = utility.Convergence(a, tol=tol) if tol is not None or return_info else None
+    i = 0
+    for i in range(1, num_iters + 1):
+        if numerics == 'full':
+            utility.assert_finite('v', v)
         if first_nneg:
-            v = _compute_v(u, v)
-            u = _compute_u(v)
+            for _ in range(num_calc_v):
+                v = _update_v(a, u, v, update_rule=update_rule, state=state, eps=eps,
+                              transposed=transposed, workspace=workspace)
+            for _ in range(num_calc_u):
+                u = _compute_u(a, v, rcond=rcond, svd_method=svd_method, precision=precision,
+                               transposed=transposed, numerics=numerics)
+            _monitor(convergence, a, u, v, solved_u=num_calc_u > 0, transposed=transposed,
+                     workspace=workspace if num_calc_v else None)
         else:
-            u = _compute_u(v)
-            v = _compute_v(u, v)
+            for _ in range(num_calc_u):
+                u = _compute_u(a, v, rcond=rcond, svd_method=svd_method, precision=precision,
+                               transposed=transposed, numerics=numerics)
+            for _ in range(num_calc_v):
+                v = _update_v(a, u, v, update_rule=update_rule, state=state, eps=eps,
+                              transposed=transposed, workspace=workspace)
+            _monitor(convergence, a, u, v, solved_u=num_calc_v == 0 and num_calc_u > 0,
+                     transposed=transposed, workspace=workspace if num_calc_v else None)
+        if convergence is not None and convergence.converged:
+            break
+    utility.assert_finite('u', u, numerics=numerics)
+    utility.assert_finite('v', v, numerics=numerics)
+    if return_info:
+        return u, v, convergence.info(i)
     return u, v
 
 
-def softmax_nmf(a, u, v, rcond=1e-14, eps=1e-15, num_iters=1):
+def softmax_nmf(a, u, v, rcond=1e-14, eps=1e-15, num_iters=1, svd_method='economy', precision='float64',
+                transposed=False, workspace=None, tol=None, return_info=False, numerics='full'):
     """Softmax Semi-NMF
     Args:
         a: Original matrix factorized
@@ -73,58 +337,63 @@ def softmax_nmf(a, u, v, rcond=1e-14, eps=1e-15, num_iters=1):
         eps:
         num_iters: Number of iterations
         first_nneg: Compute Non-negative matrix first
+        svd_method: Low-rank engine, see `utility.get_svd`
+        precision: 'float64', 'float32' or 'mixed', see `utility.get_dtypes`
+        transposed: a, u and v are given as a^T, u^T and v^T (batch-first layout)
+            and u^T, v^T are returned, without transposing any of them.
+        workspace: `utility.Workspace` holding the buffers of the update of v
+        tol: Stop at this relative change of the residual, see `matrix_factorization.semi_nmf`.
+        return_info: Also return the report of `utility.Convergence.info`.
+        numerics: One of `utility.numerics_guards`, see `matrix_factorization.semi_nmf`.
 
     Returns:
         u, v
     """
-    
-    def _compute_u(v):
-        svd = utility._low_rank(v, rcond=rcond)
-        u_t = np.transpose(svd.u)
-        _v = svd.v
-        s_inv = np.linalg.inv(svd.s)
-        u = ((a @ _v) @ s_inv) @ u_t
-        return u
-    
-    def _compute_v(u, v):
-        u_t = np.transpose(u)
-        uta = u_t @ a
-        u_ta_p = (np.abs(uta) + uta) * 0.5
-        u_ta_m = (np.abs(uta) - uta) * 0.5
-        utu = u_t @ u
-        u_tu_p = (np.abs(utu) + utu) * 0.5
-        u_tu_m = (np.abs(utu) - utu) * 0.5
-        
-        uvm = u_tu_m @ v
-        uvp = u_tu_p @ v
-        divide = np.divide(u_ta_p + uvm,
-                           u_ta_m + uvp + eps)
-        # TODO: The divide induce Nan.
-        # assert not divide[divide < 0.].sum(), '-1'
-        divide[divide < 0.] = 0.
-        sqrt = np.sqrt(divide)
-        v = np.multiply(v, sqrt)
-        return v
-    
-    for _ in range(num_iters):
-        assert not np.isnan(v).any(), utility.have_nan('v', v)
-        v = _compute_v(u, v)
-        v = utility.softmax(v)
-        u = _compute_u(v)
+    utility.check_numerics_guard(numerics)
+    a, u, v = utility.cast(precision, a, u, v)
+    u, v = utility.dense(u, v)
+    # v is updated in place.
+    v = v.copy()
+    if workspace is None:
+        workspace = utility.Workspace()
+    convergence = utility.Convergence(a, tol=tol) if tol is not None or return_info else None
+    i = 0
+    for i in range(1, num_iters + 1):
+        if numerics == 'full':
+            utility.assert_finite('v', v)
+        v = _compute_v(a, u, v, eps=eps, transposed=transposed, workspace=workspace)
+        v = utility.softmax(v, axis=1 if transposed else 0)
+        u = _compute_u(a, v, rcond=rcond, svd_method=svd_method, precision=precision,
+                       transposed=transposed, numerics=numerics)
+        _monitor(convergence, a, u, v, solved_u=True, transposed=transposed)
+        if convergence is not None and convergence.converged:
+            break
+    utility.assert_finite('u', u, numerics=numerics)
+    utility.assert_finite('v', v, numerics=numerics)
+    if return_info:
+        return u, v, convergence.info(i)
     return u, v
 
 
-def _nonlin_solve(a, b, x, rcond=1e-14, num_iters=1, solve_ax=True):
+@profiler.profile('nonlin_solve')
+def _nonlin_solve(a, b, x, rcond=1e-14, num_iters=1, solve_ax=True, svd_method='economy',
+                  svd_cache=None, cache_key=None, precision='float64', transposed=False, numerics='full'):
     """Nonlinear Solver.
     Args:
         num_iters: Number of iterations each solving.
         solve_ax: Whether to solve min_x || b - f(ax) || or min_x || b - f(xa) ||
+        svd_method: Low-rank engine, see `utility.get_svd`
+        svd_cache: `utility.LowRankCache` reused across calls
+        cache_key: Key of `a` in svd_cache
+        precision: 'float64', 'float32' or 'mixed', see `utility.get_dtypes`
+        transposed: a, b and x are given as a^T, b^T and x^T
+        numerics: One of `utility.numerics_guards`, a is guarded by its SVD
     """
-    assert not np.isnan(a).any(), utility.have_nan('a', a)
-    a_svd = utility._low_rank(a, rcond=rcond)
-    u = a_svd.u
-    s = a_svd.s
-    v = a_svd.v
+    if num_iters == 0:
+        return x
+    a_svd = utility._low_rank(a, rcond=rcond, svd_method=svd_method,
+                              svd_cache=svd_cache, cache_key=cache_key, precision=precision,
+                              numerics=numerics)
     
     _omega = 1.0
     
@@ -133,10 +402,18 @@ def _nonlin_solve(a, b, x, rcond=1e-14, num_iters=1, solve_ax=True):
          min_x || b - f(ax) ||
         """
         for _ in range(num_iters):
-            r = b - utility.relu(a @ x)
-            ur = u.T @ r
-            solve = np.linalg.solve(s, ur)
-            x = x + _omega * (v @ solve)
+            with profiler.phase('residual'):
+                if transposed:
+                    # (ax)^T = x^T a^T
+                    r = utility.subtract(b, utility.relu(utility.matmul(x, a)))
+                else:
+                    r = utility.subtract(b, utility.relu(utility.matmul(a, x)))
+            with profiler.phase('solve'):
+                if transposed:
+                    # (pinv(a) r)^T = r^T pinv(a^T)
+                    x = x + _omega * utility.right_solve(r, a_svd)
+                else:
+                    x = x + _omega * utility.left_solve(a_svd, r)
             x = utility.relu(x)
         return x
     
@@ -145,10 +422,18 @@ def _nonlin_solve(a, b, x, rcond=1e-14, num_iters=1, solve_ax=True):
          min_x || b - f(xa) ||
         """
         for _ in range(num_iters):
-            r = b - utility.relu(x @ a)
-            s_inv = np.linalg.inv(s)
-            rvs = r @ v @ s_inv
-            x = x + _omega * (rvs @ u.T)
+            with profiler.phase('residual'):
+                if transposed:
+                    # (xa)^T = a^T x^T
+                    r = utility.subtract(b, utility.relu(utility.matmul(a, x)))
+                else:
+                    r = utility.subtract(b, utility.relu(utility.matmul(x, a)))
+            with profiler.phase('solve'):
+                if transposed:
+                    # (r pinv(a))^T = pinv(a^T) r^T
+                    x = x + _omega * utility.left_solve(a_svd, r)
+                else:
+                    x = x + _omega * utility.right_solve(r, a_svd)
         return x
     
     if solve_ax:
@@ -158,7 +443,8 @@ def _nonlin_solve(a, b, x, rcond=1e-14, num_iters=1, solve_ax=True):
 
 
 def nonlin_semi_nmf(a, u, v, rcond=1e-14, eps=1e-15, num_iters=1, num_calc_u=1, num_calc_v=1,
-                    first_nneg=True, batch_first=True):
+                    first_nneg=True, batch_first=True, svd_method='economy', svd_cache=None,
+                    precision='float64', transposed=False, tol=None, return_info=False, numerics='full'):
     """Nonlinear semi-NMF
     
     Args:
@@ -169,22 +455,56 @@ def nonlin_semi_nmf(a, u, v, rcond=1e-14, eps=1e-15, num_iters=1, num_calc_u=1,
         num_iters: Number of iterations
         first_nneg: Compute Non-negative matrix first
         batch_first: Solve a = uv like TensorFlow format
+        svd_method: Low-rank engine, see `utility.get_svd`
+        svd_cache: `utility.LowRankCache` keeping the SVD of u across calls. v is
+            the data of the batch, which is new every call, so it is not cached.
+            A refreshed SVD is of u projected onto the refreshed subspace, off by
+            at most `drift_tol` of the norm of u, see `utility.LowRankCache`.
+        precision: 'float64', 'float32' or 'mixed', see `utility.get_dtypes`
+        transposed: a, u and v are given as a^T, u^T and v^T (batch-first layout)
+            and u^T, v^T are returned, without transposing any of them.
+        tol: Stop at this relative change of || a - f(uv) ||, see `matrix_factorization.semi_nmf`.
+        return_info: Also return the report of `utility.Convergence.info`.
+        numerics: One of `utility.numerics_guards`, see `matrix_factorization.semi_nmf`.
 
     Returns:
         Solved u, v
     """
+    utility.check_numerics_guard(numerics)
+    a, u, v = utility.cast(precision, a, u, v)
+    u, v = utility.dense(u, v)
     if batch_first:
         num_calc_u, num_calc_v = num_calc_v, num_calc_u
+    convergence = utility.Convergence(a, tol=tol) if tol is not None or return_info else None
     
-    for _ in range(num_iters):
+    i = 0
+    for i in range(1, num_iters + 1):
         if first_nneg:
             # In batch first, v has negative elements.
-            v = _nonlin_solve(u, a, v, rcond=rcond, num_iters=num_calc_v, solve_ax=True)
+            v = _nonlin_solve(u, a, v, rcond=rcond, num_iters=num_calc_v, solve_ax=True,
+                              svd_method=svd_method, svd_cache=svd_cache, cache_key='u',
+                              precision=precision, transposed=transposed, numerics=numerics)
             # In batch first, u has only non-negative elements.
-            u = _nonlin_solve(v, a, u, rcond=rcond, num_iters=num_calc_u, solve_ax=False)
+            u = _nonlin_solve(v, a, u, rcond=rcond, num_iters=num_calc_u, solve_ax=False,
+                              svd_method=svd_method, precision=precision, transposed=transposed,
+                              numerics=numerics)
         else:
             # In batch first, u has only non-negative elements.
-            u = _nonlin_solve(v, a, u, rcond=rcond, num_iters=num_calc_u, solve_ax=False)
+            u = _nonlin_solve(v, a, u, rcond=rcond, num_iters=num_calc_u, solve_ax=False,
+                              svd_method=svd_method, precision=precision, transposed=transposed,
+                              numerics=numerics)
             # In batch first, v has negative elements.
-            v = _nonlin_solve(u, a, v, rcond=rcond, num_iters=num_calc_v, solve_ax=True)
+            v = _nonlin_solve(u, a, v, rcond=rcond, num_iters=num_calc_v, solve_ax=True,
+                              svd_method=svd_method, svd_cache=svd_cache, cache_key='u',
+                              precision=precision, transposed=transposed, numerics=numerics)
+        if convergence is not None:
+            # The least-squares identity does not hold through f, so the residual is formed.
+            with profiler.phase('monitor'):
+                convergence.add(np.linalg.norm(utility.subtract(a, utility.relu(v @ u if transposed else u @ v))))
+            if convergence.converged:
+                break
+    utility.assert_finite('u', u, numerics=numerics)
+    utility.assert_finite('v', v, numerics=numerics)
+    if return_info:
+        return u, v, convergence.info(i)
     return u, v
\ No newline at end of file
@@ -0,0 +1,166 @@
+"""Opt-in profiling of the phases of the NumPy solvers
+
+The solvers open named phases, e.g. 'compute_u', 'svd' or 'gram', which
+nest, so the SVD of `_compute_u` is recorded as 'compute_u/svd'. Nothing is
+recorded unless a `Profiler` is active:
+
+with Profiler() as profiler:
+    u, v = semi_nmf(a, u, v)
+print(profiler.report())
+
+The active profilers are shared by all threads, so the solves running in
+tf.py_func during sess.run are recorded as well.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import contextlib
+import functools
+import threading
+import time
+
+from . import utility
+
+_profilers = []
+_local = threading.local()
+
+
+class _Frame(object):
+    __slots__ = ('name', 'flops', 'nbytes')
+    
+    def __init__(self, name):
+        self.name = name
+        self.flops = 0
+        self.nbytes = 0
+
+
+def _frames():
+    frames = getattr(_local, 'frames', None)
+    if frames is None:
+        frames = _local.frames = []
+    return frames
+
+
+@contextlib.contextmanager
+def _phase(name):
+    frames = _frames()
+    path = '/'.join([frame.name for frame in frames[-1:]] + [name])
+    frame = _Frame(path)
+    frames.append(frame)
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start_time
+        frames.pop()
+        if frames:
+            # The work of a phase is part of the one enclosing it.
+            frames[-1].flops += frame.flops
+            frames[-1].nbytes += frame.nbytes
+        for profiler in list(_profilers):
+            profiler.record(path, seconds, flops=frame.flops, nbytes=frame.nbytes)
+
+
+class _NullPhase(object):
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        return False
+
+
+_null_phase = _NullPhase()
+
+
+def phase(name):
+    """Context of a phase recorded by the active profilers, a no-op if none is."""
+    if not _profilers:
+        return _null_phase
+    return _phase(name)
+
+
+def profile(name):
+    """Decorator recording every call of a function as the phase name."""
+    
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return function(*args, **kwargs)
+        
+        return wrapper
+    
+    return decorator
+
+
+def count(flops=0, nbytes=0):
+    """Add floating point operations and allocated bytes to the innermost phase."""
+    if not _profilers:
+        return
+    frames = _frames()
+    if frames:
+        frames[-1].flops += int(flops)
+        frames[-1].nbytes += int(nbytes)
+
+
+class Profiler(object):
+    """Wall time, FLOP estimates and allocated bytes of each phase of the solvers.
+    
+    The FLOPs are the ones of the products, SVDs and inverses by their shapes,
+    and the bytes the ones of the arrays they allocate, so the products into
+    the buffers of `utility.Workspace` count no bytes. The statistics add up
+    over every activation until `reset`, e.g. over the steps of training.
+    
+    Attributes:
+        stats: Name of each phase to AttrDict(calls, seconds, flops, nbytes).
+    """
+    
+    def __init__(self):
+        self.stats = {}
+        self._lock = threading.Lock()
+    
+    def __enter__(self):
+        _profilers.append(self)
+        return self
+    
+    def __exit__(self, *exc):
+        _profilers.remove(self)
+    
+    def reset(self):
+        with self._lock:
+            self.stats = {}
+    
+    def record(self, name, seconds, flops=0, nbytes=0):
+        with self._lock:
+            stat = self.stats.get(name)
+            if stat is None:
+                stat = self.stats[name] = utility.AttrDict(calls=0, seconds=0., flops=0, nbytes=0)
+            with stat.unlocked:
+                stat.calls += 1
+                stat.seconds += seconds
+                stat.flops += flops
+                stat.nbytes += nbytes
+    
+    def report(self):
+        """Table of the phases by time spent."""
+        lines = ['{:<40} {:>7} {:>10} {:>9} {:>10}'.format('phase', 'calls', 'seconds', 'GFLOP/s', 'MB')]
+        for name, stat in sorted(self.stats.items(), key=lambda item: -item[1].seconds):
+            gflops = stat.flops / max(stat.seconds, 1e-12) / 1e9
+            lines.append('{:<40} {:>7} {:>10.4f} {:>9.2f} {:>10.1f}'.format(
+                name, stat.calls, stat.seconds, gflops, stat.nbytes / 2 ** 20))
+        return '\n'.join(lines)
+    
+    def summary(self, prefix='profile'):
+        """tf.Summary of the statistics for `tf.summary.FileWriter.add_summary`."""
+        # The NumPy solvers import this module, so they do not depend on TensorFlow.
+        import tensorflow as tf
+        
+        values = []
+        for name, stat in sorted(self.stats.items()):
+            for key in ('calls', 'seconds', 'flops', 'nbytes'):
+                values.append(tf.Summary.Value(tag='{}/{}/{}'.format(prefix, name, key),
+                                               simple_value=float(stat[key])))
+        return tf.Summary(value=values)
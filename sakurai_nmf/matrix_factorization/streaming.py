@@ -0,0 +1,268 @@
+"""Semi-NMF and Nonlinear semi-NMF over row chunks (batch-first)
+
+The factorization a = uv in batch-first has one row of a and u per sample
+and a v shared by all of them. The update of the non-negative u is local to
+each row, and the solve of v only needs the sufficient statistics u^T u and
+u^T a, which are summed over row chunks. So a and u can be memory-mapped
+arrays or any other source of row chunks, and only the chunks and the
+statistics of the width of the layer are in memory at once.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+
+from . import np_biased_nmf
+from . import np_nmf
+from . import utility
+
+
+def iter_chunks(*matrices, chunk_size=1000):
+    """Yield the same rows of each matrix, chunk_size rows at a time.
+    
+    Chunks of np.ndarray or np.memmap are views, so updating a chunk of u in
+    place writes through to u.
+    """
+    num_rows = len(matrices[0])
+    for matrix in matrices:
+        assert len(matrix) == num_rows, (len(matrix), num_rows)
+    for start in range(0, num_rows, chunk_size):
+        yield tuple(matrix[start:start + chunk_size] for matrix in matrices)
+
+
+class RowChunks(object):
+    """Re-iterable (a, u) row chunks, e.g. of two np.memmap opened with 'r+'."""
+    
+    def __init__(self, a, u, chunk_size=1000):
+        self.a = a
+        self.u = u
+        self.chunk_size = chunk_size
+    
+    def __iter__(self):
+        return iter_chunks(self.a, self.u, chunk_size=self.chunk_size)
+
+
+def _check_passes(chunks, num_passes):
+    if num_passes > 1 and iter(chunks) is chunks:
+        raise ValueError('chunks are read {} times, so they should be re-iterable '
+                         'like `RowChunks` rather than a generator'.format(num_passes))
+
+
+def _biased(u, use_bias):
+    return np_biased_nmf._stack_bias(u, transposed=True) if use_bias else u
+
+
+def update_stats(stats, a, u, use_bias=False, precision='float64'):
+    """Add the sufficient statistics of the rows a, u to stats.
+    
+    Args:
+        stats: AttrDict(utu, uta, count) or None to start new ones.
+        a: Rows of the original matrix.
+        u: Same rows of the non-negative left matrix.
+        use_bias: Append a column of ones to u.
+        precision: The statistics are summed in the dtype of the SVD.
+    
+    Returns:
+        AttrDict(utu=u^T u, uta=u^T a, count=number of rows).
+    """
+    _, dtype = utility.get_dtypes(precision)
+    u = _biased(u, use_bias)
+    if stats is None:
+        stats = utility.AttrDict(utu=np.zeros((u.shape[1], u.shape[1]), dtype=dtype),
+                                 uta=np.zeros((u.shape[1], a.shape[1]), dtype=dtype),
+                                 count=0)
+    u_t = np.transpose(u)
+    with stats.unlocked:
+        stats.utu += u_t @ u
+        stats.uta += u_t @ a
+        stats.count += len(u)
+    return stats
+
+
+def accumulate_stats(chunks, use_bias=False, precision='float64'):
+    """Sum `update_stats` over (a, u) row chunks."""
+    stats = None
+    for a, u in chunks:
+        a, u = utility.cast(precision, a, u)
+        stats = update_stats(stats, a, u, use_bias=use_bias, precision=precision)
+    if stats is None:
+        raise ValueError('chunks are empty')
+    return stats
+
+
+def _gram_inverse(utu, alpha=0., rcond=1e-14):
+    """(utu + alpha)^-1 on the eigenvectors of utu over the rcond cut-off.
+    
+    The eigenvalues of u^T u are the squared singular values of u, and they
+    carry only the round-off of the dtype relative to the largest one.
+    """
+    w, q = np.linalg.eigh(utu)
+    w_max = np.max(w)
+    cutoff = max(rcond ** 2, np.finfo(utu.dtype).eps * len(w)) * w_max
+    mask = w > cutoff
+    w, q = w[mask], q[:, mask]
+    return utility.AttrDict(w=w, q=q, inv=1. / (w + alpha))
+
+
+def solve_v(stats, alpha=0., rcond=1e-14):
+    """Solve min_v || a - uv ||^2 + alpha || v ||^2 from the sufficient statistics.
+    
+    alpha=0 gives pinv(u) a as `np_nmf`, alpha > 0 gives the ridge-like update
+    of the biased v as `np_biased_nmf`.
+    """
+    gram = _gram_inverse(stats.utu, alpha=alpha, rcond=rcond)
+    return utility.chain_matmul(gram.q * gram.inv, np.transpose(gram.q), stats.uta)
+
+
+def _update_u(a, u, v, use_bias, beta, eps, precision, workspace):
+    """Multiplicative update of a chunk of u, written back in place."""
+    _a, _u = utility.cast(precision, a, u)
+    _u = _u.copy()
+    if use_bias:
+        _u, _ = np_biased_nmf._compute_v(_a, v, _u, _biased(_u, True), beta=beta, eps=eps,
+                                         transposed=True, workspace=workspace)
+    else:
+        _u = np_nmf._compute_v(_a, v, _u, eps=eps, transposed=True, workspace=workspace)
+    u[...] = _u
+    return _u
+
+
+def streaming_semi_nmf(chunks, v, use_bias=False, num_iters=1, first_nneg=True, rcond=1e-14, eps=1e-15,
+                       alpha=1e-2, beta=1e-2, precision='float64'):
+    """Semi-NMF over row chunks in batch-first.
+    
+    Gives the same v as `semi_nmf(a, u, v)` on the stacked rows, while each
+    chunk of u is updated in place.
+    
+    Args:
+        chunks: (a, u) row chunks, re-iterable when read more than once.
+            See `RowChunks` and `iter_chunks`.
+        v: Right matrix in batch first, with the bias row when use_bias.
+        use_bias: Use bias
+        num_iters: Number of iterations, each reads the chunks once or twice.
+        first_nneg: Compute Non-negative matrix first
+        rcond: Reciprocal condition number
+        eps:
+        alpha: Coefficient for solve v.
+        beta: Coefficient for solve u.
+        precision: 'float64', 'float32' or 'mixed', see `utility.get_dtypes`
+    
+    Returns:
+        Solved v
+    """
+    _check_passes(chunks, num_iters * (1 if first_nneg else 2))
+    v, = utility.cast(precision, v)
+    dtype = v.dtype
+    alpha = alpha if use_bias else 0.
+    # Chunks of the same size share the buffers of the update of u.
+    workspace = utility.Workspace()
+    
+    for _ in range(num_iters):
+        stats = None
+        for a, u in chunks:
+            if first_nneg:
+                u = _update_u(a, u, v, use_bias, beta, eps, precision, workspace)
+            a, u = utility.cast(precision, a, u)
+            stats = update_stats(stats, a, u, use_bias=use_bias, precision=precision)
+        v = solve_v(stats, alpha=alpha, rcond=rcond).astype(dtype, copy=False)
+        if not first_nneg:
+            for a, u in chunks:
+                _update_u(a, u, v, use_bias, beta, eps, precision, workspace)
+    return v
+
+
+def nonlin_solve_v(stats, v, use_bias=False, alpha=1e-2, rcond=1e-14):
+    """Solve v of the nonlinear semi-NMF from the sufficient statistics of the residual.
+    
+    The statistics are the ones of `update_stats` with r = a - f(uv) in place
+    of a, summed while v stays fixed.
+    
+    Returns:
+        v + pinv(u) r, and for the biased v shrunk like `np_biased_nmf`.
+    """
+    dtype = v.dtype
+    gram = _gram_inverse(stats.utu, rcond=rcond)
+    q_t = np.transpose(gram.q)
+    v = v + utility.chain_matmul(gram.q * gram.inv, q_t, stats.uta).astype(dtype, copy=False)
+    if use_bias:
+        ss = gram.w / (gram.w + alpha)
+        v = utility.chain_matmul(gram.q * ss, q_t, v).astype(dtype, copy=False)
+    return v
+
+
+class _PassLowRank(object):
+    """SVDs of the operands which stay fixed during one pass over the chunks.
+    
+    Passed as `svd_cache` to the solvers, so v is decomposed once a pass
+    instead of once a chunk.
+    """
+    
+    def __init__(self):
+        self._entries = {}
+    
+    def low_rank(self, a, key, rcond=1e-14, svd_method='economy', precision='float64', numerics='full'):
+        if key not in self._entries:
+            self._entries[key] = utility._low_rank(a, rcond=rcond, svd_method=svd_method,
+                                                   precision=precision, numerics=numerics)
+        return self._entries[key]
+
+
+def streaming_nonlin_semi_nmf(chunks, v, use_bias=False, num_iters=1, num_calc_u=1, num_calc_v=1,
+                              first_nneg=True, rcond=1e-14, eps=1e-15, alpha=1e-2, beta=1e-2,
+                              svd_method='economy', precision='float64'):
+    """Nonlinear semi-NMF over row chunks in batch-first.
+    
+    Every solve of v reads the chunks once to sum u^T u and u^T (a - f(uv)),
+    so the chunks have to be re-iterable.
+    
+    Args:
+        chunks: (a, u) row chunks, see `RowChunks`.
+        v: Right matrix in batch first, with the bias row when use_bias.
+        use_bias: Use bias
+        num_iters: Number of iterations
+        num_calc_u: Number of calculating u.
+        num_calc_v: Number of calculating v.
+        first_nneg: Compute Non-negative matrix first
+        rcond: Reciprocal condition number
+        eps:
+        alpha: Coefficient for solve v.
+        beta: Coefficient for solve u.
+        svd_method: Low-rank engine, see `utility.get_svd`
+        precision: 'float64', 'float32' or 'mixed', see `utility.get_dtypes`
+    
+    Returns:
+        Solved v
+    """
+    _check_passes(chunks, 2)
+    v, = utility.cast(precision, v)
+    solvers = np_biased_nmf if use_bias else np_nmf
+    kwargs = dict(_lambda=beta, eps=eps) if use_bias else {}
+    
+    def _update_u():
+        svd_cache = _PassLowRank()
+        for a, u in chunks:
+            _a, _u = utility.cast(precision, a, u)
+            u[...] = solvers._nonlin_solve(v, _a, _u, rcond=rcond, num_iters=num_calc_u, solve_ax=True,
+                                           svd_method=svd_method, svd_cache=svd_cache, cache_key='v',
+                                           precision=precision, transposed=True, **kwargs)
+    
+    def _update_v(v):
+        stats = None
+        for a, u in chunks:
+            a, u = utility.cast(precision, a, u)
+            r = a - utility.relu(_biased(u, use_bias) @ v)
+            stats = update_stats(stats, r, u, use_bias=use_bias, precision=precision)
+        return nonlin_solve_v(stats, v, use_bias=use_bias, alpha=alpha, rcond=rcond)
+    
+    for _ in range(num_iters):
+        if first_nneg:
+            _update_u()
+            for _ in range(num_calc_v):
+                v = _update_v(v)
+        else:
+            for _ in range(num_calc_v):
+                v = _update_v(v)
+            _update_u()
+    return v
@@ -0,0 +1,215 @@
+"""Biased semi-NMF and Nonlinear semi-NMF built from TensorFlow ops (MATLAB format)"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import tensorflow as tf
+
+from . import tf_utility
+from .utility import get_dtypes
+
+
+def _stack_bias(v):
+    bias = tf.ones_like(v[:1])
+    return tf.concat((v, bias), axis=0)
+
+
+def _compute_u(a, u, bias_v, alpha=1e-2, rcond=1e-14, svd_method='economy', precision='float64',
+               numerics='full'):
+    """Ridge-like update of the biased left matrix."""
+    svd = tf_utility._low_rank(bias_v, rcond=rcond, svd_method=svd_method, precision=precision,
+                               numerics=numerics)
+    r = a - tf.matmul(u, bias_v)
+    u = u + tf_utility.right_solve(r, svd)
+    ss_square = tf.square(svd.s)
+    ss = ss_square / (alpha + ss_square)
+    u = tf_utility.chain_matmul(u, svd.u * ss, svd.u, transpose_c=True)
+    return u
+
+
+def _compute_v(a, u, v, bias_v, beta=1e-2, eps=1e-15):
+    """Multiplicative update of the non-negative v."""
+    u_org = u[:, :-1]
+    ua = tf.matmul(u_org, a, transpose_a=True)
+    uap = (tf.abs(ua) + ua) * 0.5
+    uam = (tf.abs(ua) - ua) * 0.5
+    uu = tf.matmul(u_org, u, transpose_a=True)
+    uup = (tf.abs(uu) + uu) * 0.5
+    uum = (tf.abs(uu) - uu) * 0.5
+    
+    divide = tf.maximum((uap + tf.matmul(uum, bias_v) + beta * v) /
+                        (uam + tf.matmul(uup, bias_v) + beta * v + eps), 0.)
+    v = v * tf.sqrt(divide)
+    return v, _stack_bias(v)
+
+
+def semi_nmf(a, u, v, alpha=1e-2, beta=1e-2, rcond=1e-14, eps=1e-15, num_iters=1, num_calc_u=1, num_calc_v=1,
+             first_nneg=True, svd_method='economy', precision='float64', numerics='full'):
+    """Biased Semi-NMF
+    Args:
+        a: Original matrix factorized
+        u: Biased-matrix
+        v: Non-negative matrix
+        rcond: Reciprocal condition number
+        eps:
+        num_calc_u: Number of calculating u each iteration, 0 keeps u.
+        num_calc_v: Number of calculating v each iteration, 0 keeps v.
+        svd_method: 'full' or 'economy', both run `tf.linalg.svd`
+        precision: 'float64', 'float32' or 'mixed', see `utility.get_dtypes`
+        numerics: One of `utility.numerics_guards`, see `tf_utility._low_rank`.
+    
+    Returns:
+        u, v
+    """
+    a, u, v = tf_utility.cast(precision, a, u, v)
+    bias_v = _stack_bias(v)
+    
+    for _ in range(num_iters):
+        if first_nneg:
+            for _ in range(num_calc_v):
+                v, bias_v = _compute_v(a, u, v, bias_v, beta=beta, eps=eps)
+            for _ in range(num_calc_u):
+                u = _compute_u(a, u, bias_v, alpha=alpha, rcond=rcond, svd_method=svd_method,
+                               precision=precision, numerics=numerics)
+        else:
+            for _ in range(num_calc_u):
+                u = _compute_u(a, u, bias_v, alpha=alpha, rcond=rcond, svd_method=svd_method,
+                               precision=precision, numerics=numerics)
+            for _ in range(num_calc_v):
+                v, bias_v = _compute_v(a, u, v, bias_v, beta=beta, eps=eps)
+    return u, v
+
+
+def softmax_nmf(a, u, v, alpha=1e-2, beta=1e-2, rcond=1e-14, eps=1e-15, num_iters=1, svd_method='economy',
+                precision='float64', numerics='full'):
+    """Softmax Biased Semi-NMF
+    Args:
+        a: Original matrix factorized
+        u: Biased-matrix
+        v: Non-negative matrix
+        rcond: Reciprocal condition number
+        eps:
+        svd_method: 'full' or 'economy', both run `tf.linalg.svd`
+        precision: 'float64', 'float32' or 'mixed', see `utility.get_dtypes`
+        numerics: One of `utility.numerics_guards`, see `tf_utility._low_rank`.
+    
+    Returns:
+        u, v
+    """
+    a, u, v = tf_utility.cast(precision, a, u, v)
+    bias_v = _stack_bias(v)
+    
+    for _ in range(num_iters):
+        v, bias_v = _compute_v(a, u, v, bias_v, beta=beta, eps=eps)
+        v = tf.nn.softmax(v, axis=0)
+        bias_v = tf.nn.softmax(bias_v, axis=0)
+        u = _compute_u(a, u, bias_v, alpha=alpha, rcond=rcond, svd_method=svd_method,
+                       precision=precision, numerics=numerics)
+    return u, v
+
+
+def _nonlin_solve(a, b, x, _lambda=1e-2, rcond=1e-14, eps=1e-15, num_iters=1, solve_ax=True,
+                  svd_method='economy', precision='float64', numerics='full'):
+    """Nonlinear Solver.
+    Args:
+        num_iters: Number of iterations each solving.
+        solve_ax: Whether to solve min_x || b - f(ax) || or min_x || b - f(xa) ||
+        svd_method: 'full' or 'economy', both run `tf.linalg.svd`
+        precision: 'float64', 'float32' or 'mixed', see `utility.get_dtypes`
+        numerics: One of `utility.numerics_guards`, see `tf_utility._low_rank`.
+    """
+    _, svd_dtype = get_dtypes(precision)
+    _omega = 1.0
+    
+    def _solve_ax(x):
+        """
+         min_x || b - f(ax) ||
+        """
+        a_svd = tf_utility._low_rank(a[:, :-1], rcond=1e-14, svd_method=svd_method,
+                                     precision=precision, numerics=numerics)
+        
+        _aa = tf.matmul(a[:, :-1], a[:, :-1], transpose_a=True)
+        u_svd = tf_utility._low_rank(_aa, rcond=rcond, svd_method=svd_method,
+                                     precision=precision, numerics=numerics)
+        # (I + lambda * pinv(aa)) does not depend on x.
+        vsu = tf.matmul(u_svd.v * u_svd.s_inv, u_svd.u, transpose_b=True)
+        _eye = tf.eye(tf.shape(_aa)[0], dtype=svd_dtype)
+        _x = _eye + _lambda * tf.cast(vsu, svd_dtype)
+        
+        bias_x = _stack_bias(x)
+        for _ in range(num_iters):
+            r = b - tf.nn.relu(tf.matmul(a, bias_x))
+            x = x + _omega * tf_utility.left_solve(a_svd, r)
+            x = tf.cast(tf.matrix_solve(_x, tf.cast(x, svd_dtype)), b.dtype)
+            x = tf.nn.relu(x)
+            bias_x = _stack_bias(x)
+        return x
+    
+    def _solve_xa(x):
+        """
+         min_x || b - f(xa) ||
+        """
+        bias_x = _stack_bias(a)
+        a_svd = tf_utility._low_rank(bias_x, rcond=rcond, svd_method=svd_method,
+                                     precision=precision, numerics=numerics)
+        u = a_svd.u
+        ss_square = tf.square(a_svd.s)
+        ss = ss_square / (ss_square + _lambda)
+        
+        for _ in range(num_iters):
+            r = b - tf.nn.relu(tf.matmul(x, bias_x))
+            x = x + _omega * tf_utility.right_solve(r, a_svd)
+            x = tf_utility.chain_matmul(x, u * ss, u, transpose_c=True)
+        return x
+    
+    if solve_ax:
+        return _solve_ax(x)
+    else:
+        return _solve_xa(x)
+
+
+def nonlin_semi_nmf(a, u, v, alpha=1e2, beta=1e-2, rcond=1e-14, eps=1e-15, num_iters=1, num_calc_u=1, num_calc_v=1,
+                    first_nneg=True, batch_first=True, svd_method='economy', svd_cache=None,
+                    precision='float64', numerics='full'):
+    """Biased Nonlinear Semi-NMF
+    Args:
+        a: Original non-negative matrix factorized
+        u: Biased-matrix
+        v: Non-negative matrix
+        alpha: Coefficient for solve u.
+        beta: Coefficient for solve v.
+        rcond: Reciprocal condition number
+        eps:
+        num_iters: Number of iterations
+        batch_first: like TensorFlow format.
+        svd_method: 'full' or 'economy', both run `tf.linalg.svd`
+        svd_cache: Not supported, the SVDs are ops of the graph.
+        precision: 'float64', 'float32' or 'mixed', see `utility.get_dtypes`
+        numerics: One of `utility.numerics_guards`, see `tf_utility._low_rank`.
+    
+    Returns:
+    
+    """
+    if svd_cache is not None:
+        raise ValueError('svd_cache is only supported by the numpy backend')
+    a, u, v = tf_utility.cast(precision, a, u, v)
+    if batch_first:
+        num_calc_u, num_calc_v = num_calc_v, num_calc_u
+    
+    for _ in range(num_iters):
+        if first_nneg:
+            # In batch first, v has negative elements.
+            v = _nonlin_solve(u, a, v, _lambda=beta, rcond=rcond, eps=eps, solve_ax=True, num_iters=num_calc_v,
+                              svd_method=svd_method, precision=precision, numerics=numerics)
+            # In batch first, u has only non-negative elements.
+            u = _nonlin_solve(v, a, u, _lambda=alpha, rcond=rcond, eps=eps, solve_ax=False, num_iters=num_calc_u,
+                              svd_method=svd_method, precision=precision, numerics=numerics)
+        else:
+            # In batch first, u has only non-negative elements.
+            u = _nonlin_solve(v, a, u, _lambda=alpha, rcond=rcond, eps=eps, solve_ax=False, num_iters=num_calc_u,
+                              svd_method=svd_method, precision=precision, numerics=numerics)
+            # In batch first, v has negative elements.
+            v = _nonlin_solve(u, a, v, _lambda=beta, rcond=rcond, eps=eps, solve_ax=True, num_iters=num_calc_v,
+                              svd_method=svd_method, precision=precision, numerics=numerics)
+    return u, v
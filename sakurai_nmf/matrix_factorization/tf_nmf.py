@@ -0,0 +1,180 @@
+"""Semi-NMF and Nonlinear semi-NMF built from TensorFlow ops (MATLAB format)"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import tensorflow as tf
+
+from . import tf_utility
+
+
+def _compute_u(a, v, rcond=1e-14, svd_method='economy', precision='float64', numerics='full'):
+    """Solve min_u || a - uv || by the pseudo inverse of v."""
+    svd = tf_utility._low_rank(v, rcond=rcond, svd_method=svd_method, precision=precision,
+                               numerics=numerics)
+    return tf_utility.right_solve(a, svd)
+
+
+def _compute_v(a, u, v, eps=1e-15):
+    """Multiplicative update of the non-negative v."""
+    uta = tf.matmul(u, a, transpose_a=True)
+    u_ta_p = (tf.abs(uta) + uta) * 0.5
+    u_ta_m = (tf.abs(uta) - uta) * 0.5
+    utu = tf.matmul(u, u, transpose_a=True)
+    u_tu_p = (tf.abs(utu) + utu) * 0.5
+    u_tu_m = (tf.abs(utu) - utu) * 0.5
+    
+    uvm = tf.matmul(u_tu_m, v)
+    uvp = tf.matmul(u_tu_p, v)
+    divide = tf.maximum((u_ta_p + uvm) / (u_ta_m + uvp + eps), 0.)
+    return v * tf.sqrt(divide)
+
+
+def semi_nmf(a, u, v, rcond=1e-14, eps=1e-15, num_iters=1, num_calc_u=1, num_calc_v=1, first_nneg=True,
+             svd_method='economy', precision='float64', numerics='full'):
+    """Semi-NMF
+    Args:
+        a: Original matrix factorized
+        u: Left matrix
+        v: Non-negative right matrix
+        rcond: Reciprocal condition number
+        eps:
+        num_iters: Number of iterations
+        num_calc_u: Number of calculating u each iteration, 0 keeps u.
+        num_calc_v: Number of calculating v each iteration, 0 keeps v.
+        first_nneg: Compute Non-negative matrix first
+        svd_method: 'full' or 'economy', both run `tf.linalg.svd`
+        precision: 'float64', 'float32' or 'mixed', see `utility.get_dtypes`
+        numerics: One of `utility.numerics_guards`, see `tf_utility._low_rank`.
+    
+    Returns:
+        u, v
+    """
+    a, u, v = tf_utility.cast(precision, a, u, v)
+    for _ in range(num_iters):
+        if first_nneg:
+            for _ in range(num_calc_v):
+                v = _compute_v(a, u, v, eps=eps)
+            for _ in range(num_calc_u):
+                u = _compute_u(a, v, rcond=rcond, svd_method=svd_method, precision=precision,
+                               numerics=numerics)
+        else:
+            for _ in range(num_calc_u):
+                u = _compute_u(a, v, rcond=rcond, svd_method=svd_method, precision=precision,
+                               numerics=numerics)
+            for _ in range(num_calc_v):
+                v = _compute_v(a, u, v, eps=eps)
+    return u, v
+
+
+def softmax_nmf(a, u, v, rcond=1e-14, eps=1e-15, num_iters=1, svd_method='economy', precision='float64',
+                numerics='full'):
+    """Softmax Semi-NMF
+    Args:
+        a: Original matrix factorized
+        u: Left matrix
+        v: Non-negative right matrix
+        rcond: Reciprocal condition number
+        eps:
+        num_iters: Number of iterations
+        svd_method: 'full' or 'economy', both run `tf.linalg.svd`
+        precision: 'float64', 'float32' or 'mixed', see `utility.get_dtypes`
+        numerics: One of `utility.numerics_guards`, see `tf_utility._low_rank`.
+    
+    Returns:
+        u, v
+    """
+    a, u, v = tf_utility.cast(precision, a, u, v)
+    for _ in range(num_iters):
+        v = _compute_v(a, u, v, eps=eps)
+        v = tf.nn.softmax(v, axis=0)
+        u = _compute_u(a, v, rcond=rcond, svd_method=svd_method, precision=precision,
+                       numerics=numerics)
+    return u, v
+
+
+def _nonlin_solve(a, b, x, rcond=1e-14, num_iters=1, solve_ax=True, svd_method='economy',
+                  precision='float64', numerics='full'):
+    """Nonlinear Solver.
+    Args:
+        num_iters: Number of iterations each solving.
+        solve_ax: Whether to solve min_x || b - f(ax) || or min_x || b - f(xa) ||
+        svd_method: 'full' or 'economy', both run `tf.linalg.svd`
+        precision: 'float64', 'float32' or 'mixed', see `utility.get_dtypes`
+        numerics: One of `utility.numerics_guards`, see `tf_utility._low_rank`.
+    """
+    a_svd = tf_utility._low_rank(a, rcond=rcond, svd_method=svd_method, precision=precision,
+                                 numerics=numerics)
+    
+    _omega = 1.0
+    
+    def _solve_ax(x):
+        """
+         min_x || b - f(ax) ||
+        """
+        for _ in range(num_iters):
+            r = b - tf.nn.relu(tf.matmul(a, x))
+            x = x + _omega * tf_utility.left_solve(a_svd, r)
+            x = tf.nn.relu(x)
+        return x
+    
+    def _solve_xa(x):
+        """
+         min_x || b - f(xa) ||
+        """
+        for _ in range(num_iters):
+            r = b - tf.nn.relu(tf.matmul(x, a))
+            x = x + _omega * tf_utility.right_solve(r, a_svd)
+        return x
+    
+    if solve_ax:
+        return _solve_ax(x)
+    else:
+        return _solve_xa(x)
+
+
+def nonlin_semi_nmf(a, u, v, rcond=1e-14, eps=1e-15, num_iters=1, num_calc_u=1, num_calc_v=1,
+                    first_nneg=True, batch_first=True, svd_method='economy', svd_cache=None,
+                    precision='float64', numerics='full'):
+    """Nonlinear semi-NMF
+    
+    Args:
+        a: Original non-negative matrix factorized
+        u: Left matrix
+        v: Non-negative right matrix
+        rcond: Reciprocal condition number
+        eps:
+        num_iters: Number of iterations
+        first_nneg: Compute Non-negative matrix first
+        batch_first: Solve a = uv like TensorFlow format
+        svd_method: 'full' or 'economy', both run `tf.linalg.svd`
+        svd_cache: Not supported, the SVDs are ops of the graph.
+        precision: 'float64', 'float32' or 'mixed', see `utility.get_dtypes`
+        numerics: One of `utility.numerics_guards`, see `tf_utility._low_rank`.
+    
+    Returns:
+        Solved u, v
+    """
+    if svd_cache is not None:
+        raise ValueError('svd_cache is only supported by the numpy backend')
+    a, u, v = tf_utility.cast(precision, a, u, v)
+    if batch_first:
+        num_calc_u, num_calc_v = num_calc_v, num_calc_u
+    
+    for _ in range(num_iters):
+        if first_nneg:
+            # In batch first, v has negative elements.
+            v = _nonlin_solve(u, a, v, rcond=rcond, num_iters=num_calc_v, solve_ax=True,
+                              svd_method=svd_method, precision=precision, numerics=numerics)
+            # In batch first, u has only non-negative elements.
+            u = _nonlin_solve(v, a, u, rcond=rcond, num_iters=num_calc_u, solve_ax=False,
+                              svd_method=svd_method, precision=precision, numerics=numerics)
+        else:
+            # In batch first, u has only non-negative elements.
+            u = _nonlin_solve(v, a, u, rcond=rcond, num_iters=num_calc_u, solve_ax=False,
+                              svd_method=svd_method, precision=precision, numerics=numerics)
+            # In batch first, v has negative elements.
+            v = _nonlin_solve(u, a, v, rcond=rcond, num_iters=num_calc_v, solve_ax=True,
+                              svd_method=svd_method, precision=precision, numerics=numerics)
+    return u, v
@@ -0,0 +1,82 @@
+"""TensorFlow counterparts of the low-rank helpers in utility"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+import tensorflow as tf
+
+from .utility import AttrDict, get_dtypes
+
+tf_svd_methods = ('full', 'economy')
+
+
+def cast(precision, *matrices):
+    """Cast tensors to the dtype of the updates."""
+    dtype, _ = get_dtypes(precision)
+    return tuple(tf.cast(matrix, dtype) for matrix in matrices)
+
+
+def _low_rank(a, rcond=1e-14, svd_method='economy', precision='float64', numerics='full'):
+    """Truncated SVD of a as a graph op.
+    
+    The shapes of the factors have to be static, so the singular values under
+    `rcond` are masked out instead of being cut off. `s_inv` is the masked
+    reciprocal of `s` and `s` itself is zero where it is masked.
+    
+    Unless numerics is 'full' or 'off', the factors depend on a check of the
+    sum of the singular values, which any NaN or inf of a makes non-finite,
+    so a is guarded without a pass over it.
+    """
+    if svd_method not in tf_svd_methods:
+        raise ValueError('svd_method of the tensorflow backend should be one of {}, got {}'.format(
+            tf_svd_methods, svd_method))
+    dtype = a.dtype
+    _, svd_dtype = get_dtypes(precision)
+    # Singular values under the round-off of float32 are only noise.
+    rcond = max(rcond, np.finfo(dtype.as_numpy_dtype).eps)
+    s, u, v = tf.linalg.svd(tf.cast(a, svd_dtype), full_matrices=False)
+    if numerics in ('sum', 'sampled'):
+        with tf.control_dependencies([tf.check_numerics(tf.reduce_sum(s), 'singular values')]):
+            s, u, v = tf.identity(s), tf.identity(u), tf.identity(v)
+    mask = s > rcond * tf.reduce_max(s)
+    ones = tf.ones_like(s)
+    zeros = tf.zeros_like(s)
+    s_inv = tf.where(mask, tf.reciprocal(tf.where(mask, s, ones)), zeros)
+    s = tf.where(mask, s, zeros)
+    return AttrDict(u=tf.cast(u, dtype),
+                    s=tf.cast(s, dtype),
+                    s_inv=tf.cast(s_inv, dtype),
+                    v=tf.cast(v, dtype))
+
+
+def chain_matmul(a, b, c, transpose_c=False):
+    """Compute a @ b @ c in the association order with fewer multiplications."""
+    shapes = [x.shape for x in (a, b, c)]
+    if not all(shape.is_fully_defined() for shape in shapes):
+        return tf.matmul(tf.matmul(a, b), c, transpose_b=transpose_c)
+    m, n = shapes[0].as_list()
+    k, p = shapes[2].as_list()
+    if transpose_c:
+        k, p = p, k
+    if m * n * k + m * k * p <= n * k * p + m * n * p:
+        return tf.matmul(tf.matmul(a, b), c, transpose_b=transpose_c)
+    return tf.matmul(a, tf.matmul(b, c, transpose_b=transpose_c))
+
+
+def right_solve(b, svd):
+    """Compute b @ pinv(x) from `svd = _low_rank(x)`."""
+    return chain_matmul(b, svd.v * svd.s_inv, svd.u, transpose_c=True)
+
+
+def left_solve(svd, b):
+    """Compute pinv(x) @ b from `svd = _low_rank(x)`."""
+    return tf.matmul(svd.v * svd.s_inv, tf.matmul(svd.u, b, transpose_a=True))
+
+
+def gram_residual(a_norm_sq, uta, utu, v):
+    """|| a - uv ||_F from || a ||^2, u^T a and u^T u, see `utility.gram_residual`."""
+    vvt = tf.matmul(v, v, transpose_b=True)
+    residual_sq = a_norm_sq - 2. * tf.reduce_sum(uta * v) + tf.reduce_sum(utu * vvt)
+    return tf.sqrt(tf.maximum(residual_sq, 0.))
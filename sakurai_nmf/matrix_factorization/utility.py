@@ -7,6 +7,10 @@ from __future__ import print_function
 import contextlib
 
 import numpy as np
+import scipy.sparse
+
+from . import profiler
+from ..exception import MatrixFactorizationError
 
 
 class AttrDict(dict):
@@ -46,32 +50,436 @@ def relu(x):
     return x * (x > 0)
 
 
-def _low_rank(a, rcond=1e-14):
-    # TODO
-    assert not np.isnan(a).any(), have_nan('a', a)
-    u, s, vt = np.linalg.svd(a, full_matrices=True)
-    v = np.transpose(vt)
-    _s = np.diag(s)
-    _s = _s / np.max(_s)
-    k = np.sum(_s > rcond)
-    
-    u = u[:, :k]
-    s = np.diag(s)[:k, :k]
-    v = v[:, :k]
-    assert not np.isnan(u).any(), have_nan('u', u)
-    assert not np.isnan(s).any(), have_nan('s', s)
-    assert not np.isnan(v).any(), have_nan('v', v)
+precisions = dict(
+    float64=(np.float64, np.float64),
+    float32=(np.float32, np.float32),
+    mixed=(np.float32, np.float64),
+)
+
+
+def get_dtypes(precision='float64'):
+    """Get the dtypes of the updates and of the SVD.
+    
+    Args:
+        precision: 'float64', 'float32' or 'mixed'. 'mixed' runs the updates
+            in float32 and promotes only the small SVD step to float64.
+
+    Returns:
+        (dtype of the updates, dtype of the SVD)
+    """
+    if precision not in precisions:
+        raise ValueError('precision should be one of {}, got {}'.format(
+            sorted(precisions), precision))
+    return precisions[precision]
+
+
+# How much of the matrices is scanned for NaN and inf. 'full' scans all of them,
+# 'sum' reduces them to one sum and 'sampled' looks at a strided sample, and both
+# rely on the singular values of the SVDs, which any non-finite operand turns
+# non-finite. A matrix is scanned fully only when it is suspected.
+numerics_guards = ('off', 'sampled', 'sum', 'full')
+
+
+def check_numerics_guard(numerics):
+    if numerics not in numerics_guards:
+        raise ValueError('numerics should be one of {}, got {}'.format(numerics_guards, numerics))
+
+
+def _non_finite(matrix):
+    """Number of NaN and of inf in matrix by a full scan."""
+    if issparse(matrix):
+        matrix = matrix.data
+    return int(np.isnan(matrix).sum()), int(np.isinf(matrix).sum())
+
+
+def assert_finite(name, matrix, numerics='full', suspected=False, sample_size=1024):
+    """Raise MatrixFactorizationError if matrix has NaN or inf.
+    
+    Args:
+        name: Name of the matrix in the message.
+        matrix: ndarray or scipy.sparse matrix.
+        numerics: One of `numerics_guards`, how much of matrix is scanned first.
+        suspected: Scan fully in any mode but 'off', e.g. after a reduction
+            computed from matrix came out non-finite.
+        sample_size: Number of the elements about looked at by 'sampled'.
+    """
+    if numerics == 'off':
+        return
+    with profiler.phase('nan_check'):
+        data = matrix.data if issparse(matrix) else matrix
+        if suspected or numerics == 'full':
+            suspected = True
+        elif numerics == 'sum':
+            suspected = not np.isfinite(np.sum(data))
+        elif data.size:
+            # A strided view, so nothing is copied.
+            if data.ndim == 2:
+                step = max(int(np.sqrt(data.size / sample_size)), 1)
+                sample = data[::step, ::step]
+            else:
+                sample = data[::max(data.size // sample_size, 1)]
+            suspected = not np.isfinite(sample).all()
+        if suspected:
+            num_nans, num_infs = _non_finite(matrix)
+            if num_nans or num_infs:
+                raise MatrixFactorizationError('{} has {} NaN and {} inf'.format(name, num_nans, num_infs))
+
+
+def issparse(matrix):
+    return scipy.sparse.issparse(matrix)
+
+
+def cast(precision, *matrices):
+    """Cast matrices to the dtype of the updates without copying if possible.
+    
+    scipy.sparse matrices stay sparse.
+    """
+    dtype, _ = get_dtypes(precision)
+    return tuple(matrix.astype(dtype, copy=False) if issparse(matrix) else np.asarray(matrix, dtype=dtype)
+                 for matrix in matrices)
+
+
+def dense(*matrices):
+    """Convert scipy.sparse matrices to ndarrays, the others are returned as they are."""
+    return tuple(matrix.toarray() if issparse(matrix) else matrix for matrix in matrices)
+
+
+def matmul(a, b, out=None):
+    """a @ b as an ndarray, where either of them may be scipy.sparse.
+    
+    The products with a sparse matrix cost in the number of its non-zeros.
+    """
+    if issparse(a):
+        flops = 2 * a.nnz * b.shape[1]
+    elif issparse(b):
+        flops = 2 * a.shape[0] * b.nnz
+    else:
+        flops = 2 * a.shape[0] * a.shape[1] * b.shape[1]
+    # Products into a buffer allocate nothing.
+    nbytes = 0 if out is not None else a.shape[0] * b.shape[1] * np.result_type(a.dtype, b.dtype).itemsize
+    profiler.count(flops=flops, nbytes=nbytes)
+    if not (issparse(a) or issparse(b)):
+        return np.matmul(a, b, out=out)
+    if issparse(a):
+        product = a @ b
+    else:
+        # ndarray @ sparse is not dispatched to scipy, so (b^T a^T)^T
+        product = (b.T @ a.T).T
+    product, = dense(product)
+    if out is None:
+        return np.asarray(product)
+    out[...] = product
+    return out
+
+
+def subtract(a, b):
+    """a - b as an ndarray, where a may be scipy.sparse."""
+    if not issparse(a):
+        return a - b
+    difference = np.negative(b)
+    a = a.tocoo()
+    a.sum_duplicates()
+    difference[a.row, a.col] += a.data
+    return difference
+
+
+def squared_norm(a):
+    """|| a ||_F^2 of an ndarray or a scipy.sparse matrix."""
+    if issparse(a):
+        return float(a.multiply(a).sum())
+    return float(np.linalg.norm(a)) ** 2
+
+
+def full_svd(a):
+    """SVD with square left and right bases, sliced down to the retained rank."""
+    return np.linalg.svd(a, full_matrices=True)
+
+
+def economy_svd(a):
+    """SVD whose bases only have min(a.shape) columns."""
+    return np.linalg.svd(a, full_matrices=False)
+
+
+def randomized_svd(a, rank=None, oversample=10, power_iters=2, seed=None):
+    """Truncated SVD with a randomized range-finder.
+    
+    The range-finder costs O(mn (rank + oversample)) per power iteration
+    against O(mn min(m, n)) of `economy_svd`, so it pays off for a rank well
+    under the width of a. From half of min(a.shape) on, the economy SVD is
+    truncated to rank instead. See `benchmarks.run_svd_suite` for timings.
+    
+    Args:
+        a: Matrix decomposed.
+        rank: Number of singular triplets kept. Defaults to all of them,
+            which is the economy SVD, so truncating takes an explicit rank.
+        oversample: Extra random directions sampled to stabilize the range.
+        power_iters: Number of power iterations to sharpen the spectrum.
+        seed: Seed of the Gaussian test matrix.
+
+    Returns:
+        u, s, vt like np.linalg.svd(a, full_matrices=False) truncated to rank.
+    """
+    m, n = a.shape
+    width = min(m, n)
+    rank = width if rank is None else min(rank, width)
+    size = min(rank + oversample, width)
+    if 2 * size >= width:
+        u, s, vt = economy_svd(a)
+        return u[:, :rank], s[:rank], vt[:rank]
+    # Find the range from the smaller side so that the basis is thin.
+    transpose = m < n
+    if transpose:
+        a = a.T
+    random_state = np.random.RandomState(seed)
+    omega = random_state.normal(size=(a.shape[1], size)).astype(a.dtype)
+    q, _ = np.linalg.qr(a @ omega)
+    for _ in range(power_iters):
+        q, _ = np.linalg.qr(a.T @ q)
+        q, _ = np.linalg.qr(a @ q)
+    b = np.asarray(q.T @ a)
+    u_b, s, vt = np.linalg.svd(b, full_matrices=False)
+    u = q @ u_b[:, :rank]
+    s = s[:rank]
+    vt = vt[:rank]
+    if transpose:
+        return vt.T, s, u.T
+    return u, s, vt
+
+
+svd_methods = dict(
+    full=full_svd,
+    economy=economy_svd,
+    randomized=randomized_svd,
+)
+
+
+def get_svd(svd_method='economy'):
+    """Get the low-rank engine.
+    
+    Args:
+        svd_method: Name in `svd_methods` or a callable `a -> (u, s, vt)`,
+            e.g. `functools.partial(randomized_svd, rank=100)` to truncate,
+            'randomized' alone keeps every singular value.
+    """
+    if callable(svd_method):
+        return svd_method
+    if svd_method not in svd_methods:
+        raise ValueError('svd_method should be one of {}, got {}'.format(
+            sorted(svd_methods), svd_method))
+    return svd_methods[svd_method]
+
+
+def _low_rank(a, rcond=1e-14, svd_method='economy', svd_cache=None, cache_key=None,
+              precision='float64', numerics='full'):
+    """Truncated SVD of a as AttrDict(u, s, v), a ~ u diag(s) v^T.
+    
+    Unless numerics is 'full', a is not scanned, but only the singular values,
+    whose sum is non-finite when a has NaN or inf, and then a is.
+    """
+    if svd_cache is not None:
+        return svd_cache.low_rank(a, cache_key, rcond=rcond, svd_method=svd_method,
+                                  precision=precision, numerics=numerics)
+    if numerics == 'full':
+        assert_finite('operand of the SVD', a)
+    dtype = a.dtype
+    _, svd_dtype = get_dtypes(precision)
+    # Singular values under the round-off of float32 are only noise.
+    rcond = max(rcond, np.finfo(dtype).eps)
+    svd = get_svd(svd_method)
+    with profiler.phase('svd'):
+        try:
+            u, s, vt = svd(a.astype(svd_dtype, copy=False))
+        except np.linalg.LinAlgError:
+            # LAPACK does not converge on non-finite a.
+            assert_finite('operand of the SVD', a, numerics=numerics, suspected=True)
+            raise
+        profiler.count(flops=4 * a.shape[0] * a.shape[1] * min(a.shape),
+                       nbytes=u.nbytes + s.nbytes + vt.nbytes)
+    if not np.isfinite(np.sum(s)):
+        assert_finite('operand of the SVD', a, numerics=numerics, suspected=True)
+        assert_finite('s', s, numerics=numerics)
+    k = np.sum(s / np.max(s) > rcond)
+    
+    u = u[:, :k].astype(dtype, copy=False)
+    s = s[:k].astype(dtype, copy=False)
+    v = np.transpose(vt[:k]).astype(dtype, copy=False)
+    if numerics == 'full':
+        assert_finite('u', u)
+        assert_finite('v', v)
     return AttrDict(u=u, s=s, v=v)
 
 
-def have_nan(name, matrix: np.ndarray):
-    vec = matrix.flatten()
-    num_nans = np.isnan(vec).sum()
-    message = '{} has Nan the number of {}'.format(name, num_nans)
-    return message
+class LowRankCache(object):
+    """Keep truncated SVDs of operands that move slowly between calls.
+    
+    When an operand stored under the same key comes back with the same shape,
+    the cached singular subspaces are moved by one step of subspace iteration,
+    `q_u = orth(a v)` and `q_v = orth(a^T q_u)`, and only the small core
+    `q_u^T a q_v` is decomposed. The refreshed SVD is the one of `q_u q_u^T a`,
+    so it differs from the SVD of `a` by the energy of `a` outside `q_u`.
+    The refresh is accepted while that energy is at most `drift_tol` of the
+    norm of `a`, otherwise the SVD is recomputed from scratch.
+    
+    Attributes:
+        drift_tol: Largest relative error `|| a - q_u q_u^T a || / || a ||` refreshed incrementally.
+        num_refreshes: Number of incremental refreshes.
+        num_misses: Number of SVDs computed from scratch.
+    """
+    
+    def __init__(self, drift_tol=1e-2):
+        self.drift_tol = drift_tol
+        self.num_refreshes = 0
+        self.num_misses = 0
+        self._entries = {}
+    
+    def clear(self):
+        self._entries.clear()
+    
+    def low_rank(self, a, key, rcond=1e-14, svd_method='economy', precision='float64', numerics='full'):
+        entry = self._entries.get(key)
+        if entry is not None and entry.shape == a.shape:
+            with profiler.phase('svd_refresh'):
+                svd = self._refresh(a, entry.svd, rcond, precision)
+            if svd is not None:
+                self.num_refreshes += 1
+                self._entries[key] = AttrDict(shape=a.shape, svd=svd)
+                return svd
+        svd = _low_rank(a, rcond=rcond, svd_method=svd_method, precision=precision, numerics=numerics)
+        self.num_misses += 1
+        self._entries[key] = AttrDict(shape=a.shape, svd=svd)
+        return svd
+    
+    def _refresh(self, a, svd, rcond, precision):
+        _, svd_dtype = get_dtypes(precision)
+        a_norm = np.sqrt(squared_norm(a))
+        # Non-finite a has NaN or inf a_norm and is decomposed again by `_low_rank`, which guards it.
+        if not a_norm > 0 or not np.isfinite(a_norm):
+            return None
+        m, n = a.shape
+        k = len(svd.s)
+        q_u, _ = np.linalg.qr(np.asarray(a @ svd.v).astype(svd_dtype))
+        q_v, r = np.linalg.qr(np.asarray(a.T @ q_u.astype(a.dtype)).astype(svd_dtype))
+        profiler.count(flops=4 * k * m * n + 4 * k * k * (m + n) + 4 * k ** 3)
+        # a^T q_u = q_v r, so q_u^T a = r^T q_v^T lies in q_v and the core is r^T.
+        outside = max(a_norm ** 2 - np.linalg.norm(r) ** 2, 0.)
+        if np.sqrt(outside) / a_norm > self.drift_tol:
+            return None
+        rcond = max(rcond, np.finfo(a.dtype).eps)
+        u, s, vt = np.linalg.svd(np.transpose(r))
+        k = np.sum(s / np.max(s) > rcond)
+        return AttrDict(u=(q_u @ u[:, :k]).astype(a.dtype),
+                        s=s[:k].astype(a.dtype),
+                        v=(q_v @ np.transpose(vt[:k])).astype(a.dtype))
+
+
+class Workspace(object):
+    """Buffers reused by the in-place updates of one layer.
+    
+    A buffer is allocated the first time it is asked for with a name, shape
+    and dtype, and the same array is handed out afterwards, so iterating an
+    update over a layer of fixed shape does not allocate.
+    """
+    
+    def __init__(self):
+        self._buffers = {}
+    
+    def clear(self):
+        self._buffers.clear()
+    
+    def get(self, name, shape, dtype):
+        key = (name, tuple(shape), np.dtype(dtype))
+        buffer = self._buffers.get(key)
+        if buffer is None:
+            buffer = np.empty(shape, dtype=dtype)
+            self._buffers[key] = buffer
+        return buffer
+    
+    @property
+    def nbytes(self):
+        return sum(buffer.nbytes for buffer in self._buffers.values())
+
+
+def chain_matmul(a, b, c):
+    """Compute a @ b @ c in the association order with fewer multiplications."""
+    m, n = a.shape
+    k, p = c.shape
+    if m * n * k + m * k * p <= n * k * p + m * n * p:
+        return matmul(matmul(a, b), c)
+    return matmul(a, matmul(b, c))
+
+
+def right_solve(b, svd):
+    """Compute b @ pinv(x) from `svd = _low_rank(x)`.
+    
+    The singular values stay a vector and scale the columns of v.
+    """
+    return chain_matmul(b, svd.v / svd.s, np.transpose(svd.u))
+
+
+def left_solve(svd, b):
+    """Compute pinv(x) @ b from `svd = _low_rank(x)`."""
+    return chain_matmul(svd.v / svd.s, np.transpose(svd.u), b)
+
+
+def gram_residual(a_norm_sq, uta, utu, v, transposed=False):
+    """|| a - uv ||_F from || a ||^2 and the products u^T a and u^T u.
+
+    || a - uv ||^2 = || a ||^2 - 2 <u^T a, v> + <u^T u, v v^T>, so with the
+    products the update of v already has, it costs O(k^2 n) instead of the
+    O(mkn) of forming uv. With transposed, uta is (u^T a)^T and v is v^T.
+    """
+    vvt = np.transpose(v) @ v if transposed else v @ np.transpose(v)
+    residual_sq = a_norm_sq - 2. * np.sum(uta * v) + np.sum(utu * vvt)
+    return np.sqrt(max(residual_sq, 0.))
+
+
+def least_squares_residual(a_norm_sq, u, v, alpha=0., transposed=False):
+    """|| a - uv ||_F right after u is solved from min_u || a - uv ||^2 + alpha || u ||^2.
+    
+    The normal equations give <u^T a, v> = <u^T u, v v^T> + alpha || u ||^2, so
+    || a - uv ||^2 = || a ||^2 - <u^T u, v v^T> - 2 alpha || u ||^2 needs only the
+    two Gram matrices instead of the product uv. The difference cancels, so it
+    resolves relative residuals down to about the square root of eps.
+    """
+    if transposed:
+        utu = u @ np.transpose(u)
+        vvt = np.transpose(v) @ v
+    else:
+        utu = np.transpose(u) @ u
+        vvt = v @ np.transpose(v)
+    residual_sq = a_norm_sq - np.sum(utu * vvt)
+    if alpha:
+        residual_sq -= 2. * alpha * np.sum(np.square(u))
+    return np.sqrt(max(residual_sq, 0.))
+
+
+class Convergence(object):
+    """Relative residuals of the iterations of a solver and the stopping test.
+    
+    The iterations stop when the relative change of the residual between two
+    iterations is at most `tol`.
+    """
+    
+    def __init__(self, a, tol=None):
+        self.tol = tol
+        self.a_norm_sq = squared_norm(a)
+        self.residuals = []
+    
+    def add(self, residual):
+        self.residuals.append(float(residual / max(np.sqrt(self.a_norm_sq), np.finfo(np.float64).tiny)))
+    
+    @property
+    def converged(self):
+        if self.tol is None or len(self.residuals) < 2:
+            return False
+        previous, residual = self.residuals[-2:]
+        return abs(previous - residual) <= self.tol * previous
+    
+    def info(self, num_iters):
+        return AttrDict(num_iters=num_iters, residuals=list(self.residuals), converged=self.converged)
 
 
-def softmax(x):
+def softmax(x, axis=0):
     """Compute softmax values for each sets of scores in x."""
     e_x = np.exp(x - np.max(x))
-    return e_x / e_x.sum(axis=0)  # only difference
\ No newline at end of file
+    return e_x / e_x.sum(axis=axis, keepdims=True)
\ No newline at end of file
@@ -1,3 +1,5 @@
+import functools
+
 import keras.backend.tensorflow_backend as K
 import numpy as np
 import tensorflow as tf
@@ -5,7 +7,7 @@ from keras.metrics import categorical_accuracy, binary_accuracy, sparse_categori
 from keras.metrics import categorical_crossentropy, sparse_categorical_crossentropy, binary_crossentropy
 
 from optimizer._optimizers import NMF
-from utils import batch
+from utils import batch, fork_random_state, Prefetcher
 
 
 class Model(object):
@@ -76,13 +78,17 @@ class Model(object):
     assert self.outputs is not None, "Please set the outputs"
     return sess.run([self.outputs], feed_dict={self.inputs: x})
 
-  def fit(self, x, y, mf_epochs=5, bp_epochs=10, use_nmf=True, use_backprop=False):
+  def fit(self, x, y, mf_epochs=5, bp_epochs=10, use_nmf=True, use_backprop=False, prefetch_depth=2,
+          profiler=None):
     """
     :param x: Train inputs.
     :param y: Train labels.
     :param mf_epochs: Matrix Factorization optimizer epochs
     :param bp_epochs: Back propagation epochs
     :param use_backprop: Whether use back propagation.
+    :param prefetch_depth: Number of batches sampled ahead in the background.
+    :param profiler: Active `matrix_factorization.profiler.Profiler`, whose phases of the solvers are
+        written to the summaries after each NMF step.
     """
 
     validation_split = 0.2
@@ -92,7 +98,9 @@ class Model(object):
 
     init = tf.global_variables_initializer()
     # with tf.Session() as sess:
-    with tf.Session(config=tf.ConfigProto(log_device_placement=self.use_gpu)) as sess:
+    with tf.Session(config=tf.ConfigProto(log_device_placement=self.use_gpu)) as sess, \
+        Prefetcher(functools.partial(batch, x, y, batch_size=self.batch_size, random_state=fork_random_state()),
+                   depth=prefetch_depth) as batches:
       init.run()
       # TODO: should use tf.Session() but, if using that predict() cannot call.
       K.set_session(sess)
@@ -107,9 +115,11 @@ class Model(object):
         for epoch in range(mf_epochs):
           print("NMF Epoch {0} / {1}".format(epoch, mf_epochs))
           for step in range(mf_step_size):
-            batch_x, batch_y = batch(x, y, batch_size=self.batch_size)
+            batch_x, batch_y = next(batches)
             feed_dict = {self.inputs: batch_x, self.labels: batch_y}
             self.optimizer.update(feed_dict=feed_dict, iter_size=self.iter_size)
+            if profiler is not None:
+              summary_writer.add_summary(profiler.summary(), epoch * mf_step_size + step)
             loss, acc = sess.run([self.loss, self.accuracy], feed_dict=feed_dict)
             # loss, acc, s, global_step = sess.run([self.loss, self.accuracy, summaries, self.mf_global_step_op],
             #                                      feed_dict=feed_dict)
@@ -121,7 +131,7 @@ class Model(object):
         for epoch in range(bp_epochs):
           print("Epoch {0} / {1}".format(epoch, bp_epochs))
           for step in range(bp_step_size):
-            batch_x, batch_y = batch(x, y, batch_size=self.batch_size)
+            batch_x, batch_y = next(batches)
             feed_dict = {self.inputs: batch_x, self.labels: batch_y}
             _, loss, acc = sess.run(
                 [self.train_op, self.loss, self.accuracy], feed_dict=feed_dict)
@@ -218,17 +228,19 @@ class BackpropModel(object):
       correct_prediction = tf.equal(tf.argmax(self.labels, 1), tf.argmax(self.outputs, 1))
       self.accuracy = tf.reduce_mean(tf.cast(correct_prediction, tf.float32))
 
-  def train(self, x_train, y_train, validation_split=0.2, epochs=10, batch_size=100):
+  def train(self, x_train, y_train, validation_split=0.2, epochs=10, batch_size=100, prefetch_depth=2):
     train_size = len(x_train) * (1. - validation_split)
     step_size = int(np.ceil(float(train_size * epochs) / batch_size))
 
     init = tf.global_variables_initializer()
-    with tf.Session() as sess:
+    with tf.Session() as sess, Prefetcher(functools.partial(batch, x_train, y_train, batch_size=batch_size,
+                                                            random_state=fork_random_state()),
+                                          depth=prefetch_depth) as batches:
       init.run()
       for epoch in range(epochs):
         print("Epoch {0} / {1}".format(epoch, epochs))
         for step in range(step_size):
-          batch_x, batch_y = batch(x_train, y_train, batch_size=batch_size)
+          batch_x, batch_y = next(batches)
           feed_dict = {self.inputs: batch_x, self.labels: batch_y}
           _, loss, acc = sess.run(
               [self.train_op, self.loss, self.accuracy], feed_dict=feed_dict)
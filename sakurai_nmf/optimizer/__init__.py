@@ -1,2 +1,3 @@
 from .optimizers import NMFOptimizer
-from .rnn_optimizers import RecurrentNMFOptimizer
\ No newline at end of file
+from .rnn_optimizers import RecurrentNMFOptimizer
+from .training import TrainStep
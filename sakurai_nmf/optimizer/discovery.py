@@ -0,0 +1,162 @@
+"""Discover the layers of a network by the topology of its graph
+
+A layer is the pattern
+    
+    outputs = activation(bias_add(matmul(inputs, kernel), bias))
+
+where the bias and the activation are optional, and a recurrent layer adds
+matmul(state, recurrent_kernel) before the activation. The patterns are
+matched by the types of the operations on the `utility.GraphIndex` of the
+loss, in one pass over its operations, so the names of the scopes and of
+the variables do not matter.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+
+from . import utility
+
+# Types of the operations taken as the activation of a layer by default,
+# the ones `NMFOptimizer` has a solver for.
+activation_types = ('Relu', 'Softmax')
+
+# Operations passing the value of a variable through to the product.
+_read_types = ('Identity', 'ReadVariableOp', 'Cast', 'Enter')
+_add_types = ('Add', 'AddV2', 'BiasAdd')
+
+
+def _read_variable(tensor):
+    """Name of the variable operation the tensor reads, or None, and whether it
+    is read into a loop."""
+    op = tensor.op
+    looped = False
+    while op.type in _read_types and op.inputs:
+        looped = looped or op.type == 'Enter'
+        op = op.inputs[0].op
+    if 'Variable' in op.type or op.type == 'VarHandleOp':
+        return op.name, looped
+    return None, looped
+
+
+def _other_input(op, producer):
+    others = [tensor for tensor in op.inputs if tensor.op is not producer]
+    return others[0] if len(others) == 1 else None
+
+
+def find_activation(kernel, activation_types=activation_types):
+    """Activation applied to a product of kernel, or None.
+    
+    The consumers are followed from the variable through the reads to the
+    products taking it as the right operand, and from the products through
+    the additions only, so the activation of a layer above is not reached.
+    Unlike `discover_layers` it needs no loss.
+    """
+    queue = collections.deque([(kernel.op, False)])
+    explored = {kernel.op}
+    while queue:
+        op, multiplied = queue.popleft()
+        for output in op.outputs:
+            for consumer in output.consumers():
+                if consumer in explored:
+                    continue
+                if multiplied and consumer.type in activation_types:
+                    return consumer
+                if consumer.type in _read_types:
+                    queue.append((consumer, multiplied))
+                elif not multiplied and consumer.type == 'MatMul' and consumer.inputs[1] is output:
+                    queue.append((consumer, True))
+                elif multiplied and consumer.type in _add_types:
+                    queue.append((consumer, True))
+                else:
+                    continue
+                explored.add(consumer)
+    return None
+
+
+def discover_layers(inputs, loss, ops, activation_types=activation_types):
+    """Match the layers of the trainable variables in the graph of the loss.
+    
+    The variables that are no kernel, bias or recurrent kernel of a layer the
+    loss depends on are skipped.
+    
+    Args:
+        inputs: Inputs of the network, the input of the first layer of a loop.
+        loss: Loss of the network.
+        ops: Trainable variables in the order of the layers, e.g. `utility.get_train_ops()`.
+        activation_types: Types of the operations taken as the activation of a layer.
+    
+    Returns:
+        List of `utility.Layer` in the order of their kernels in ops.
+    """
+    index = utility.get_graph_index(loss)
+    variables = {v.op.name: v for v in ops}
+    
+    # The first product of every variable as the right operand.
+    matmuls = {}
+    for op in index.operations.values():
+        if op.type != 'MatMul':
+            continue
+        name, looped = _read_variable(op.inputs[1])
+        if name in variables and name not in matmuls:
+            matmuls[name] = op, looped
+    kernels = {op.name: name for name, (op, _) in matmuls.items()}
+    
+    layers = []
+    claimed = set()
+    for kernel in ops:
+        name = kernel.op.name
+        if name in claimed or name not in matmuls:
+            continue
+        claimed.add(name)
+        matmul, looped = matmuls[name]
+        
+        # Follow the additions of the bias and of the recurrent product in either order.
+        bias = recurrent = None
+        head = matmul
+        found = True
+        while found:
+            found = False
+            for consumer in index.consumers(head.name):
+                other = _other_input(consumer, head) if consumer.type in _add_types else None
+                if other is None:
+                    continue
+                bias_name, _ = _read_variable(other)
+                recurrent_name = kernels.get(other.op.name)
+                if bias is None and bias_name in variables and bias_name not in claimed \
+                        and variables[bias_name].shape.ndims == 1:
+                    bias = variables[bias_name]
+                    claimed.add(bias_name)
+                elif recurrent is None and consumer.type != 'BiasAdd' and recurrent_name is not None \
+                        and recurrent_name not in claimed:
+                    recurrent = variables[recurrent_name]
+                    claimed.add(recurrent_name)
+                else:
+                    continue
+                head = consumer
+                found = True
+                break
+        activation = None
+        for consumer in index.consumers(head.name):
+            if consumer.type in activation_types:
+                activation = consumer
+                break
+        
+        if not looped:
+            output = matmul.inputs[0]
+        elif not layers:
+            output = inputs
+        else:
+            # The input of the product in a loop is one step, so the layers
+            # take the outputs of the scope of the layer below out of the loop.
+            output = index.scope_outputs[utility.get_name(layers[-1].kernel)]
+        layers.append(utility.Layer(kernel=kernel,
+                                    bias=bias,
+                                    recurrent=recurrent,
+                                    output=output,
+                                    activation=activation,
+                                    use_bias=bias is not None,
+                                    ))
+    return layers
@@ -4,22 +4,79 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import functools
+
 import tensorflow as tf
 from agents.tools import AttrDict
 
 import sakurai_nmf.matrix_factorization as mf
+from sakurai_nmf.matrix_factorization import streaming
+from sakurai_nmf.matrix_factorization import utility as mf_utility
+from . import discovery
 from . import utility
 
+schedules = ('gauss_seidel', 'jacobi')
+modes = ('batch', 'epoch')
+
+
+def _solve_kernel(utu, uta, v, num_rows, use_bias=False, nonlinear=False):
+    """Kernel solved from the sufficient statistics of an epoch, kept if there were no rows."""
+    if not num_rows:
+        return v
+    stats = mf_utility.AttrDict(utu=utu, uta=uta, count=num_rows)
+    if nonlinear:
+        return streaming.nonlin_solve_v(stats, v, use_bias=use_bias)
+    return streaming.solve_v(stats, alpha=1e-2 if use_bias else 0.).astype(v.dtype)
+
 
 class NMFOptimizer(object):
     """Optimize model like backpropagation."""
     
-    def __init__(self, config=None, graph=None):
+    def __init__(self, config=None, graph=None, use_svd_cache=False, precision='float64', backend='numpy',
+                 schedule='gauss_seidel', executor=None, update_rule='multiplicative', numerics='full',
+                 mode='batch'):
         """Optimize model like backpropagation.
         Args:
             config: configuration for setting optimizer.
             model: Neural network model.
+            use_svd_cache: Refresh the SVD of the kernel of each nonlinear layer
+                from the previous step instead of recomputing it.
+            precision: 'float64', 'float32' or 'mixed' used by the solvers of both backends.
+                'mixed' runs the updates in float32 and only the SVD in float64.
+                The kernels keep the dtype of the model.
+            backend: 'numpy' solves each layer in tf.py_func, 'tensorflow' builds
+                the solvers from TensorFlow ops so the whole step stays in the graph.
+            schedule: 'gauss_seidel' factorizes the layers one after another from
+                the top, each to the target solved by the layer above. 'jacobi'
+                first passes the targets down with the non-negative updates only,
+                then solves every kernel from its target as an independent op, so
+                the kernel solves run concurrently on the inter-op threads.
+            executor: `mf.ProcessExecutor` solving the layers of the numpy backend
+                in worker processes, out of the GIL of the inter-op threads.
+            update_rule: Engine of the update of the non-negative matrix of the
+                layers without activation, one of `mf.update_rules`. See `mf.semi_nmf`.
+                The Lipschitz estimate of 'accelerated' is kept per layer across
+                the steps, its momentum restarts at every step.
+            numerics: How much of the matrices of each layer is scanned for NaN and
+                inf, one of `mf.numerics_guards`. 'sum' and 'sampled' save the full
+                scans while nothing is suspected. See `mf.semi_nmf`.
+            mode: 'batch' solves the kernels from each fed batch. 'epoch' sums
+                the sufficient statistics of the kernels over every batch of an
+                epoch and solves them once from all of them. See `minimize`.
         """
+        if schedule not in schedules:
+            raise ValueError('schedule should be one of {}, got {}'.format(schedules, schedule))
+        if update_rule not in mf.update_rules:
+            raise ValueError('update_rule should be one of {}, got {}'.format(mf.update_rules, update_rule))
+        if mode not in modes:
+            raise ValueError('mode should be one of {}, got {}'.format(modes, mode))
+        if numerics not in mf.numerics_guards:
+            raise ValueError('numerics should be one of {}, got {}'.format(mf.numerics_guards, numerics))
+        if executor is not None and use_svd_cache:
+            raise ValueError('use_svd_cache keeps the SVDs in this process, so it cannot be used with executor')
+        if executor is not None and update_rule == 'accelerated':
+            raise ValueError('update_rule accelerated keeps its Lipschitz estimate in this process, '
+                             'so it cannot be used with executor')
         
         # self._config = config
         # if self._config:
@@ -27,14 +84,22 @@ class NMFOptimizer(object):
         # else:
         #     self._use_autoencoder = False
         self._graph = graph
+        self._use_svd_cache = use_svd_cache
+        self._svd_caches = []
+        self._precision = precision
+        self._backend = backend
+        self._schedule = schedule
+        self._executor = executor
+        self._update_rule = update_rule
+        self._numerics = numerics
+        self._mode = mode
     
     def _init(self, loss):
         self._ops = utility.get_train_ops(graph=self._graph)
         self.inputs, self.labels = utility.get_placeholder_ops(loss)
-        self._layers = utility._zip_layer(inputs=self.inputs,
-                                          loss=loss,
-                                          ops=self._ops,
-                                          graph=self._graph)
+        self._layers = discovery.discover_layers(inputs=self.inputs,
+                                                 loss=loss,
+                                                 ops=self._ops)
     
     def _autoencoder(self):
         
@@ -49,7 +114,7 @@ class NMFOptimizer(object):
                 temporary_shape[0] += 1
                 kernel = tf.concat((kernel, layer.bias[None, ...]), axis=0)
             temporary_kernel = tf.get_variable('temporal_{}'.format(i),
-                                               temporary_shape, dtype=tf.float64,
+                                               temporary_shape, dtype=kernel.dtype.base_dtype,
                                                initializer=tf.contrib.layers.xavier_initializer(),
                                                trainable=False)
             u, _ = mf.semi_nmf(a=a, u=u, v=temporary_kernel,
@@ -57,6 +122,11 @@ class NMFOptimizer(object):
                                use_bias=layer.use_bias,
                                num_iters=1,
                                first_nneg=True,
+                               precision=self._precision,
+                               backend=self._backend,
+                               executor=self._executor,
+                               numerics=self._numerics,
+                               update_rule=self._update_rule,
                                )
 
             # Not use activation (ReLU)
@@ -66,9 +136,14 @@ class NMFOptimizer(object):
                                    use_bias=layer.use_bias,
                                    num_iters=1,
                                    first_nneg=True,
+                                   precision=self._precision,
+                                   backend=self._backend,
+                                   executor=self._executor,
+                                   numerics=self._numerics,
+                                   update_rule=self._update_rule,
                                    )
             # Use activation (ReLU)
-            # else utility.get_op_name(layer.activation) == 'Relu':
+            # else layer.activation.type == 'Relu':
             else:
                 _, v = mf.nonlin_semi_nmf(a=u, u=a, v=kernel,
                                           use_tf=True,
@@ -76,6 +151,10 @@ class NMFOptimizer(object):
                                           num_calc_v=0,
                                           num_calc_u=1,
                                           first_nneg=True,
+                                          precision=self._precision,
+                                          backend=self._backend,
+                                          executor=self._executor,
+                                          numerics=self._numerics,
                                           )
             if layer.use_bias:
                 v, bias = utility.split_v_bias(v)
@@ -83,55 +162,183 @@ class NMFOptimizer(object):
             updates.append(layer.kernel.assign(v))
         return tf.group(*updates)
     
+    def _factorize_layer(self, layer, a, u, v, num_calc_u=1, num_calc_v=1, svd_cache=None, update_state=None):
+        """Factorize a = f(uv) of a layer, where u is its input and v its kernel.
+        
+        num_calc_u=0 keeps u and num_calc_v=0 keeps v, except for Softmax
+        which always solves both.
+        """
+        # Not use activation (ReLU)
+        if not layer.activation:
+            return mf.semi_nmf(a=a, u=u, v=v,
+                               use_tf=True,
+                               use_bias=layer.use_bias,
+                               num_iters=1,
+                               num_calc_u=num_calc_u,
+                               num_calc_v=num_calc_v,
+                               first_nneg=True,
+                               precision=self._precision,
+                               backend=self._backend,
+                               executor=self._executor,
+                               numerics=self._numerics,
+                               update_rule=self._update_rule,
+                               state=update_state,
+                               )
+        # Use activation (ReLU)
+        elif layer.activation.type == 'Relu':
+            return mf.nonlin_semi_nmf(a=a, u=u, v=v,
+                                      use_tf=True,
+                                      use_bias=layer.use_bias,
+                                      num_calc_v=num_calc_v,
+                                      num_calc_u=num_calc_u,
+                                      first_nneg=True,
+                                      svd_cache=svd_cache,
+                                      precision=self._precision,
+                                      backend=self._backend,
+                                      executor=self._executor,
+                                      numerics=self._numerics,
+                                      )
+        # Use Softmax
+        elif layer.activation.type == 'Softmax':
+            print('used softmax!!')
+            return mf.softmax_nmf(a=a, u=u, v=v,
+                                  use_tf=True,
+                                  use_bias=layer.use_bias,
+                                  precision=self._precision,
+                                  backend=self._backend,
+                                  executor=self._executor,
+                                  numerics=self._numerics,
+                                  )
+        return u, v
+    
+    @staticmethod
+    def _biased_kernel(layer):
+        if layer.use_bias:
+            return tf.concat((layer.kernel, layer.bias[None, ...]), axis=0)
+        return layer.kernel
+    
+    @staticmethod
+    def _assign(layer, v):
+        updates = []
+        if layer.use_bias:
+            v, bias = utility.split_v_bias(v)
+            updates.append(layer.bias.assign(bias))
+        updates.append(layer.kernel.assign(v))
+        return updates
+    
+    def _new_svd_cache(self):
+        if not self._use_svd_cache:
+            return None
+        svd_cache = mf.LowRankCache()
+        self._svd_caches.append(svd_cache)
+        return svd_cache
+    
+    def _new_update_state(self):
+        # The state lives in the closure of the py_func, so the Lipschitz estimate is kept across the steps.
+        if self._update_rule in ('accelerated', 'projected_gradient') and self._executor is None:
+            return mf.new_update_state()
+        return None
+    
+    def _gauss_seidel(self, a, layers):
+        updates = []
+        for layer in layers:
+            u, v = self._factorize_layer(layer, a, layer.output, self._biased_kernel(layer),
+                                         svd_cache=self._new_svd_cache(), update_state=self._new_update_state())
+            updates.extend(self._assign(layer, v))
+            a = tf.identity(u)
+        return updates
+    
+    def _jacobi(self, a, layers):
+        updates = []
+        kernel_solves = []
+        for layer in layers:
+            v = self._biased_kernel(layer)
+            svd_cache = self._new_svd_cache()
+            if layer.activation and layer.activation.type == 'Softmax':
+                u, v = self._factorize_layer(layer, a, layer.output, v)
+                updates.extend(self._assign(layer, v))
+            else:
+                # Only the non-negative update is on the path of the targets.
+                u, _ = self._factorize_layer(layer, a, layer.output, v, num_calc_v=0, svd_cache=svd_cache,
+                                             update_state=self._new_update_state())
+                kernel_solves.append((layer, a, u, v, svd_cache))
+            a = tf.identity(u)
+        for layer, a, u, v, svd_cache in kernel_solves:
+            _, v = self._factorize_layer(layer, a, u, v, num_calc_u=0, svd_cache=svd_cache)
+            updates.extend(self._assign(layer, v))
+        return updates
+    
+    def _epoch(self, a, layers):
+        """Ops summing the statistics of the kernels over the batches and solving them.
+        
+        The targets are passed down with the non-negative updates only, like the
+        'jacobi' schedule, while the kernels stay fixed during the epoch. The
+        statistics are u^T u and u^T a of the updated u, with a - relu(uv) in
+        place of a for ReLU, in the dtype of the SVD, so their memory is
+        proportional to the width of the layers rather than to the dataset.
+        
+        Returns:
+            (accumulate op, op solving the kernels and resetting the statistics)
+        """
+        _, stats_dtype = mf_utility.get_dtypes(self._precision)
+        stats_dtype = tf.as_dtype(stats_dtype)
+        num_rows = tf.Variable(0, dtype=tf.int64, trainable=False, name='nmf_epoch_rows')
+        accumulations = [tf.assign_add(num_rows, tf.shape(a, out_type=tf.int64)[0])]
+        solves = []
+        for i, layer in enumerate(layers):
+            if layer.activation and layer.activation.type != 'Relu':
+                raise ValueError("mode 'epoch' solves layers without activation or with ReLU, got {}".format(
+                    layer.activation.type))
+            v = self._biased_kernel(layer)
+            u, _ = self._factorize_layer(layer, a, layer.output, v, num_calc_v=0, svd_cache=self._new_svd_cache(),
+                                         update_state=self._new_update_state())
+            biased_u = tf.concat((u, tf.ones_like(u[:, :1])), axis=1) if layer.use_bias else u
+            biased_u = tf.cast(biased_u, stats_dtype)
+            target = tf.cast(a, stats_dtype)
+            if layer.activation:
+                target -= tf.nn.relu(biased_u @ tf.cast(v, stats_dtype))
+            size = v.shape.as_list()[0]
+            utu = tf.Variable(tf.zeros((size, size), dtype=stats_dtype), trainable=False, name='nmf_utu_{}'.format(i))
+            uta = tf.Variable(tf.zeros(v.shape, dtype=stats_dtype), trainable=False, name='nmf_uta_{}'.format(i))
+            accumulations.append(tf.assign_add(utu, tf.matmul(biased_u, biased_u, transpose_a=True)))
+            accumulations.append(tf.assign_add(uta, tf.matmul(biased_u, target, transpose_a=True)))
+            solves.append((layer, v, utu, uta))
+            a = tf.identity(u)
+        
+        updates = []
+        for layer, v, utu, uta in solves:
+            solve = functools.partial(_solve_kernel, use_bias=layer.use_bias, nonlinear=bool(layer.activation))
+            new_v = tf.py_func(solve, [utu, uta, v, num_rows], v.dtype.base_dtype)
+            new_v.set_shape(v.shape)
+            updates.extend(self._assign(layer, new_v))
+        # The statistics are read by the solves before they are reset.
+        with tf.control_dependencies(updates):
+            resets = [tf.assign(variable, tf.zeros_like(variable))
+                      for variable in [num_rows] + [stat for _, _, utu, uta in solves for stat in (utu, uta)]]
+        return tf.group(*accumulations), tf.group(*resets)
+    
     def minimize(self, loss=None, pretrain=False):
         """Construct the control dependencies for calculating neural net optimized.
         
+        In mode 'epoch', run `accumulate` on every batch of the epoch and then
+        `nmf` once, e.g. by `training.run_epoch`.
+        
         Returns:
-            tf.no_op.
-            The import
+            AttrDict(ae, nmf) of the pre-training and of the factorization ops,
+            and accumulate in mode 'epoch'.
         """
         self._init(loss)
         # pre-train with auto encoder.
         pretrain_op = self._autoencoder() if pretrain else tf.no_op()
         
-        a = self.labels
-        updates = []
         # Reverse
         layers = self._layers[::-1]
-        for i, layer in enumerate(layers):
-            u = layer.output
-            v = layer.kernel
-            if layer.use_bias:
-                v = tf.concat((v, layer.bias[None, ...]), axis=0)
-            
-            # Not use activation (ReLU)
-            if not layer.activation:
-                u, v = mf.semi_nmf(a=a, u=u, v=v,
-                                   use_tf=True,
-                                   use_bias=layer.use_bias,
-                                   num_iters=1,
-                                   first_nneg=True,
-                                   )
-            # Use activation (ReLU)
-            elif utility.get_op_name(layer.activation) == 'Relu':
-                u, v = mf.nonlin_semi_nmf(a=a, u=u, v=v,
-                                          use_tf=True,
-                                          use_bias=layer.use_bias,
-                                          num_calc_v=1,
-                                          num_calc_u=1,
-                                          first_nneg=True,
-                                          )
-            # Use Softmax
-            elif utility.get_op_name(layer.activation) == 'Softmax':
-                print('used softmax!!')
-                u, v = mf.softmax_nmf(a=a, u=u, v=v,
-                                      use_tf=True,
-                                      use_bias=layer.use_bias,
-                                      )
-            if layer.use_bias:
-                v, bias = utility.split_v_bias(v)
-                updates.append(layer.bias.assign(bias))
-            updates.append(layer.kernel.assign(v))
-            a = tf.identity(u)
+        if self._mode == 'epoch':
+            accumulate_op, nmf_op = self._epoch(self.labels, layers)
+            return AttrDict(ae=pretrain_op, accumulate=accumulate_op, nmf=nmf_op)
+        if self._schedule == 'jacobi':
+            updates = self._jacobi(self.labels, layers)
+        else:
+            updates = self._gauss_seidel(self.labels, layers)
         
-        return AttrDict(ae=pretrain_op, nmf=tf.group(*updates))
\ No newline at end of file
+        return AttrDict(ae=pretrain_op, nmf=tf.group(*updates))
@@ -7,6 +7,7 @@ from __future__ import print_function
 import tensorflow as tf
 
 import sakurai_nmf.matrix_factorization as mf
+from . import discovery
 from . import utility
 
 
@@ -30,10 +31,9 @@ class RecurrentNMFOptimizer(object):
     def _init(self, loss):
         self._ops = utility.get_train_ops(graph=self._graph)
         self.inputs, self.labels = utility.get_placeholder_ops(loss)
-        self._layers = utility._zip_layer(inputs=self.inputs,
-                                          loss=loss,
-                                          ops=self._ops,
-                                          graph=self._graph)
+        self._layers = discovery.discover_layers(inputs=self.inputs,
+                                                 loss=loss,
+                                                 ops=self._ops)
     
     def _autoencoder(self):
         inputs_size = self._layers[0].output.shape[1]
@@ -0,0 +1,147 @@
+"""Train and evaluate with one sess.run per batch"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+
+import numpy as np
+import tensorflow as tf
+from agents.tools import AttrDict
+from tensorflow.contrib import graph_editor
+
+from . import utility
+
+# Operations reading the value of a variable into the forward graph.
+_read_types = ('Identity', 'ReadVariableOp')
+
+
+def after(train_op, tensors):
+    """Copies of tensors computed from the variables as updated by train_op.
+    
+    A tensor is computed once in a run, in no particular order with the
+    updates, so the reads of the variables the tensors depend on are replaced
+    by reads under a control dependency on train_op, and the subgraph between
+    them copied. The copies are only for graphs without loops.
+    
+    Args:
+        train_op: Operation updating the variables, or dict of them as
+            `NMFOptimizer.minimize` returns.
+        tensors: Dict of names to tensors, e.g. the loss and the accuracy.
+    
+    Returns:
+        Dict of the names to the copies.
+    """
+    train_ops = list(train_op.values()) if isinstance(train_op, dict) else [train_op]
+    names = list(tensors)
+    variables = {v.op.name: v for v in tf.global_variables()}
+    reads = {}
+    replacements = {}
+    with tf.control_dependencies(train_ops):
+        for name in names:
+            for op in utility.get_graph_index(tensors[name]).operations.values():
+                if op.type not in _read_types or not op.inputs:
+                    continue
+                variable_name = op.inputs[0].op.name
+                if variable_name not in variables:
+                    continue
+                if variable_name not in reads:
+                    reads[variable_name] = variables[variable_name].read_value()
+                replacements[op.outputs[0]] = reads[variable_name]
+        copies = [tensors[name] for name in names]
+        if replacements:
+            copies = graph_editor.graph_replace(copies, replacements)
+        # The ones reading no variable still wait for the update.
+        copies = [tf.identity(copy) for copy in copies]
+    return collections.OrderedDict(zip(names, copies))
+
+
+class TrainStep(object):
+    """Update by train_op and the metrics after the update in one sess.run.
+    
+    The inputs and the labels are fed once for both, unlike running train_op
+    and then the metrics on the same batch again.
+    
+    step = TrainStep(train_op, dict(loss=model.frob_norm, accuracy=model.accuracy))
+    metrics = step(sess, feed_dict={model.inputs: x, model.labels: y})
+    
+    Args:
+        train_op: Operation updating the variables, or dict of them.
+        metrics: Dict of names to the tensors evaluated after the update.
+    """
+    
+    def __init__(self, train_op, metrics):
+        self.train_op = train_op
+        self.metrics = after(train_op, metrics)
+    
+    def __call__(self, sess, feed_dict=None):
+        """Run the step.
+        
+        Returns:
+            AttrDict of the names to the values of the metrics.
+        """
+        return AttrDict(sess.run(self.metrics, feed_dict=feed_dict))
+
+
+def evaluate(sess, metrics, inputs, labels, x, y, batch_size):
+    """Means of the metrics over all the rows of x and y in one pass.
+    
+    The rows are fed in contiguous chunks of batch_size rows, and the means
+    of the chunks are weighted by their rows. If the batch dimension of
+    inputs is static, the last chunk is filled up by repeating its rows, so
+    its means are the ones of its rows when its size divides batch_size, and
+    close to them otherwise.
+    
+    Args:
+        sess: Session.
+        metrics: Dict of names to scalar tensors, means over a batch.
+        inputs: Placeholder of x.
+        labels: Placeholder of y.
+        x: Inputs.
+        y: Labels.
+        batch_size: Number of rows per run.
+    
+    Returns:
+        AttrDict of the names to the means.
+    """
+    static_batch_size = inputs.shape.as_list()[0]
+    if static_batch_size is not None:
+        batch_size = static_batch_size
+    totals = collections.OrderedDict((name, 0.) for name in metrics)
+    num_rows = 0
+    for start in range(0, len(x), batch_size):
+        stop = min(start + batch_size, len(x))
+        batch_x, batch_y = x[start:stop], y[start:stop]
+        if static_batch_size is not None and stop - start < batch_size:
+            index = np.arange(batch_size) % (stop - start)
+            batch_x, batch_y = batch_x[index], batch_y[index]
+        values = sess.run(metrics, feed_dict={inputs: batch_x, labels: batch_y})
+        for name, value in values.items():
+            totals[name] += value * (stop - start)
+        num_rows += stop - start
+    if not num_rows:
+        raise ValueError('x should have at least one row, got {}'.format(len(x)))
+    return AttrDict((name, total / num_rows) for name, total in totals.items())
+
+
+def run_epoch(sess, train_op, batches, inputs, labels):
+    """One epoch of `NMFOptimizer(mode='epoch')`.
+    
+    Args:
+        sess: Session.
+        train_op: `NMFOptimizer.minimize` in mode 'epoch'.
+        batches: (x, y) batches of all the training data, e.g. of
+            `benchmark_model.block_batches`.
+        inputs: Placeholder of x.
+        labels: Placeholder of y.
+    
+    Returns:
+        Number of the batches.
+    """
+    num_batches = 0
+    for x, y in batches:
+        sess.run(train_op.accumulate, feed_dict={inputs: x, labels: y})
+        num_batches += 1
+    sess.run(train_op.nmf)
+    return num_batches
@@ -5,6 +5,8 @@ from __future__ import division
 from __future__ import print_function
 
 import collections
+import weakref
+
 import numpy as np
 import tensorflow as tf
 
@@ -12,6 +14,132 @@ Layer = collections.namedtuple('Layer', 'kernel, bias, recurrent, output, activa
 Layer.__new__.__defaults__ = len(Layer._fields) * (None,)
 
 
+class GraphIndex(object):
+    """Index of the subgraph a tensor depends on, built by one traversal.
+    
+    The tensors are reached breadth-first through the inputs of the
+    operations from the root, like the searches of `get_placeholder_ops` and
+    `collect_outputs` did. The operations reached only through control inputs
+    are indexed too, for the variables of `TensorFlowVariables`.
+    
+    The index keeps only the names and a weak reference to the graph, so a
+    cached index does not keep a dropped graph alive. The tensors and the
+    operations are looked up by name on access.
+    
+    Attributes:
+        graph: tf.Graph of the root.
+        version: graph.version the index was built at.
+        tensors: Tensors reached through the inputs, in breadth-first order.
+        operations: Name of every operation reached to the operation.
+        placeholders: Placeholder tensors in breadth-first order.
+        variable_names: Names of the variable operations.
+        scope_outputs: Top-level name scope to its first tensor in breadth-first order.
+    """
+    
+    def __init__(self, root):
+        graph = root.graph
+        self._graph = weakref.ref(graph)
+        self.version = graph.version
+        self._tensor_names = []
+        self._operation_names = collections.OrderedDict()
+        self._placeholder_names = []
+        self.variable_names = []
+        self._scope_output_names = collections.OrderedDict()
+        self._consumer_names = collections.defaultdict(list)
+        
+        queue = collections.deque([root])
+        explored = {root}
+        # Operations whose control inputs are explored after the data inputs.
+        controlled = []
+        while queue:
+            tf_obj = queue.popleft()
+            if hasattr(tf_obj, 'op'):
+                self._tensor_names.append(tf_obj.name)
+                self._scope_output_names.setdefault(get_name(tf_obj.op), tf_obj.name)
+                if tf_obj.op.type == 'Placeholder':
+                    self._placeholder_names.append(tf_obj.name)
+                tf_obj = tf_obj.op
+            if self._add(tf_obj):
+                controlled.append(tf_obj)
+            for input_tensor in tf_obj.inputs:
+                if input_tensor not in explored:
+                    queue.append(input_tensor)
+                    explored.add(input_tensor)
+        
+        # Tensorflow control inputs can be circular, so the explored
+        # operations are kept track of.
+        queue = collections.deque(controlled)
+        while queue:
+            op = queue.popleft()
+            for input_op in list(op.control_inputs) + [tensor.op for tensor in op.inputs]:
+                if self._add(input_op):
+                    queue.append(input_op)
+    
+    def _add(self, op):
+        """Index op the first time it is reached."""
+        if op.name in self._operation_names:
+            return False
+        self._operation_names[op.name] = None
+        for input_tensor in op.inputs:
+            self._consumer_names[input_tensor.op.name].append(op.name)
+        # op.type is node_def.op without serializing the NodeDef.
+        if 'Variable' in op.type:
+            self.variable_names.append(op.name)
+        return True
+    
+    @property
+    def graph(self):
+        return self._graph()
+    
+    @property
+    def stale(self):
+        """Whether operations were added to the graph after the index was built."""
+        graph = self.graph
+        return graph is None or graph.version != self.version
+    
+    @property
+    def tensors(self):
+        return [self.graph.get_tensor_by_name(name) for name in self._tensor_names]
+    
+    @property
+    def operations(self):
+        graph = self.graph
+        return collections.OrderedDict((name, graph.get_operation_by_name(name))
+                                       for name in self._operation_names)
+    
+    @property
+    def placeholders(self):
+        return [self.graph.get_tensor_by_name(name) for name in self._placeholder_names]
+    
+    @property
+    def scope_outputs(self):
+        graph = self.graph
+        return collections.OrderedDict((scope, graph.get_tensor_by_name(name))
+                                       for scope, name in self._scope_output_names.items())
+    
+    def producers(self, name):
+        """Operations whose outputs the operation of name takes."""
+        return [tensor.op for tensor in self.graph.get_operation_by_name(name).inputs]
+    
+    def consumers(self, name):
+        """Operations of the subgraph taking the outputs of the operation of name."""
+        graph = self.graph
+        return [graph.get_operation_by_name(consumer) for consumer in self._consumer_names.get(name, [])]
+
+
+# The indices hold no strong reference to their graph, so the graphs stay weak keys.
+_graph_indices = weakref.WeakKeyDictionary()
+
+
+def get_graph_index(root):
+    """GraphIndex of root, cached per graph until an operation is added to it."""
+    indices = _graph_indices.setdefault(root.graph, {})
+    index = indices.get(root.name)
+    if index is None or index.stale:
+        index = indices[root.name] = GraphIndex(root)
+    return index
+
+
 def get_train_ops(graph=None):
     graph = graph or tf.get_default_graph()
     vars_ = graph.get_collection(tf.GraphKeys.TRAINABLE_VARIABLES)
@@ -37,32 +165,11 @@ def get_placeholder_ops(loss: tf.Operation):
         inputs (tf.Tensor): inputs of neural network
         labels: (tf.Tensor): labels of neural network
     """
-    queue = collections.deque([loss])
-    explored_inputs = {loss}
-    
-    labels = tf.no_op()
-    inputs = tf.no_op()
-    
-    # We do a BFS on the dependency graph of the input function to find
-    # the variables.
-    _tf_obj = None
-    while len(queue) != 0:
-        tf_obj = queue.popleft()
-        if tf_obj is None:
-            continue
-        if hasattr(tf_obj, 'op'):
-            _tf_obj = tf_obj
-            tf_obj = tf_obj.op
-        if tf_obj.type == 'Placeholder':
-            # TODO: we must implement more safely.
-            if isinstance(labels, tf.Tensor):
-                inputs = _tf_obj
-            elif not isinstance(labels, tf.Tensor):
-                labels = _tf_obj
-        for input_op in tf_obj.inputs:
-            if input_op not in explored_inputs:
-                queue.append(input_op)
-                explored_inputs.add(input_op)
+    placeholders = get_graph_index(loss).placeholders
+    # TODO: we must implement more safely.
+    # The first placeholder found from the loss is the labels and the last one the inputs.
+    labels = placeholders[0] if placeholders else tf.no_op()
+    inputs = placeholders[-1] if len(placeholders) > 1 else tf.no_op()
     return inputs, labels
 
 
@@ -78,34 +185,19 @@ def get_op_name(x):
     return x.name.split('/')[-1]
 
 
-def _get_activation(op, graph=None):
-    graph = graph or tf.get_default_graph()
-    activations = ['Relu', 'Softmax']
-    _activation = None
-    for activation in activations:
-        try:
-            _activation = _activation or \
-                          graph.get_operation_by_name('{}/{}'.format(op, activation))
-        except KeyError:
-            pass
-        if _activation:
-            return _activation
-    return _activation
-
-
 def combine_one_bias(tensor: tf.Tensor, axis=0):
     # For example uncombined matrix (3000, 784)
     # will be (3000, 785)
     if isinstance(tensor, tf.Tensor):
         if axis == 0:
             size = tensor.shape.as_list()[1]
-            ones = tf.ones((1, size), dtype=tf.float64)
+            ones = tf.ones((1, size), dtype=tensor.dtype)
             tensor = tf.identity(
                 tf.concat((tensor, ones), axis=0))
             return tensor
         else:
             size = tensor.shape.as_list()[0]
-            ones = tf.ones((size, 1), dtype=tf.float64)
+            ones = tf.ones((size, 1), dtype=tensor.dtype)
             tensor = tf.identity(
                 tf.concat((tensor, ones), axis=1))
             return tensor
@@ -135,10 +227,14 @@ def zip_layer(inputs: tf.Tensor, ops: list, graph=None):
     Args:
         inputs: Inputs of network
         ops: List of layers collected by tf.get_collection
+        graph: Unused, the activations are found from the kernels by `discovery.find_activation`.
 
     Returns:
         List of layers zipped by weight(kernel) and bias.
     """
+    # discovery imports this module.
+    from . import discovery
+    
     layers = []
     ops_names = {get_name(op) for op in ops}
     # Use temp operation for the last layer doesn't use bias.
@@ -149,8 +245,7 @@ def zip_layer(inputs: tf.Tensor, ops: list, graph=None):
         train_op = ops.pop(0)
         if train_op is None:
             return layers
-        train_op_name = get_name(train_op)
-        activation = _get_activation(train_op_name, graph=graph)
+        activation = discovery.find_activation(train_op)
         
         bias_op = None
         recurrent_op = None
@@ -200,72 +295,6 @@ def zip_layer(inputs: tf.Tensor, ops: list, graph=None):
         outputs = hidden
 
 
-# Newer zip layer
-def _zip_layer(inputs: tf.Tensor, loss: tf.Tensor, ops: list, graph=None):
-    """
-    Args:
-        inputs: Inputs of network
-        ops: List of layers collected by tf.get_collection
-
-    Returns:
-        List of layers zipped by weight(kernel) and bias.
-    """
-    layers = []
-    ops_names = {get_name(op) for op in ops}
-    each_outputs = collect_outputs(loss, ops_names)
-    # Use temp operation for the last layer doesn't use bias.
-    ops.append(None)
-    
-    outputs = inputs
-    while ops:
-        train_op = ops.pop(0)
-        if train_op is None:
-            return layers
-        train_op_name = get_name(train_op)
-        activation = _get_activation(train_op_name, graph=graph)
-        
-        bias_op = None
-        recurrent_op = None
-        use_bias = False
-        
-        if 'recurrent_kernel' in get_op_name(ops[0]):
-            # Checking the kernel's shape correspond to recurrent kernel.
-            kernel_shape = train_op.get_shape()
-            recurrent_kernel_shape = ops[0].get_shape()
-            assert len(recurrent_kernel_shape) == 2, \
-                "There is some bugs,kernel doesn't correspond to recurrent kernel."
-            assert kernel_shape[1] == recurrent_kernel_shape[0], \
-                "There is some bugs,kernel doesn't correspond to recurrent kernel."
-            recurrent_op = ops[0]
-            # bias ops no need.
-            ops.pop(0)
-        
-        # Conform whether the layer have the bias or not.
-        if 'bias' in get_op_name(ops[0]):
-            # Checking the kernel's shape correspond to bias.
-            kernel_shape = train_op.get_shape()
-            bias_shape = ops[0].get_shape()
-            assert len(bias_shape) == 1, "There is some bugs," \
-                                         "kernel doesn't correspond to bias."
-            assert kernel_shape[1] == bias_shape[0], "There is some bugs," \
-                                                     "kernel doesn't correspond to bias."
-            use_bias = True
-            bias_op = ops[0]
-            # bias ops no need.
-            ops.pop(0)
-        
-        layers.append(Layer(kernel=train_op,
-                            bias=bias_op,
-                            recurrent=recurrent_op,
-                            output=outputs,
-                            activation=activation,
-                            use_bias=use_bias,
-                            ))
-        
-        # TODO :have BUGS that cannot forward correct operations.
-        outputs = tf.identity(each_outputs.pop(train_op_name))
-
-
 def collect_outputs(outputs: tf.Tensor, ops_names: set):
     # WARNING no guarantee to get 2 placeholder
     """Collect placeholder from loss.
@@ -278,40 +307,12 @@ def collect_outputs(outputs: tf.Tensor, ops_names: set):
         inputs (tf.Tensor): inputs of neural network
         labels: (tf.Tensor): labels of neural network
     """
-    queue = collections.deque([outputs])
-    variable_names = []
-    explored_inputs = {outputs}
-    
-    each_outputs = collections.OrderedDict()
-    
-    # We do a BFS on the dependency graph of the input function to find
-    # the variables.
-    while len(queue) != 0:
-        # print(queue)
-        tf_obj = queue.popleft()
-        if tf_obj is None:
-            continue
-        # The object put into the queue is not necessarily an operation,
-        # so we want the op attribute to get the operation underlying the
-        # object. Only operations contain the inputs that we can explore.
-        if hasattr(tf_obj, "op"):
-            _tf_obj = tf_obj
-            tf_obj = tf_obj.op
-        tf_obj_name = get_name(tf_obj)
-        
-        ops_name_ = None
-        for ops_name in ops_names:
-            if tf_obj_name == ops_name:
-                each_outputs[ops_name] = _tf_obj
-                ops_name_ = ops_name
-        if ops_name_:
-            ops_names.remove(ops_name_)
-        for input_op in tf_obj.inputs:
-            if input_op not in explored_inputs:
-                queue.append(input_op)
-                explored_inputs.add(input_op)
-        if len(ops_names) == 0:
-            return each_outputs
+    scope_outputs = get_graph_index(outputs).scope_outputs
+    if not set(ops_names) <= set(scope_outputs):
+        return None
+    # In the order the scopes are reached from outputs.
+    return collections.OrderedDict((name, tensor) for name, tensor in scope_outputs.items()
+                                   if name in ops_names)
 
 
 class TensorFlowVariables(object):
@@ -322,9 +323,10 @@ class TensorFlowVariables(object):
             or additional variables that are passed in.
         placeholders (Dict[str, tf.placeholders]): Placeholders for weights.
         assignment_nodes (Dict[str, tf.Tensor]): Nodes that assign weights.
+        shapes (Dict[str, List[int]]): Shapes of the variables.
     """
     
-    def __init__(self, loss):
+    def __init__(self, loss, sess=None):
         """Creates TensorFlowVariables containing extracted variables.
         The variables are extracted by performing a BFS search on the
         dependency graph with loss as the root node. After the tree is
@@ -335,53 +337,110 @@ class TensorFlowVariables(object):
             loss (tf.Operation): The tensorflow operation to extract all
                 variables from.
             sess (tf.Session): Session used for running the get and set
-                methods.
-            input_variables (List[tf.Variables]): Variables to include in the
-                list.
+                methods, the default session by default.
         """
-        queue = collections.deque([loss])
-        variable_names = []
-        explored_inputs = {loss}
-        
-        # We do a BFS on the dependency graph of the input function to find
-        # the variables.
-        while len(queue) != 0:
-            tf_obj = queue.popleft()
-            # print(tf_obj)
-            if tf_obj is None:
-                continue
-            # The object put into the queue is not necessarily an operation,
-            # so we want the op attribute to get the operation underlying the
-            # object. Only operations contain the inputs that we can explore.
-            if hasattr(tf_obj, "op"):
-                tf_obj = tf_obj.op
-            for input_op in tf_obj.inputs:
-                if input_op not in explored_inputs:
-                    queue.append(input_op)
-                    explored_inputs.add(input_op)
-            # Tensorflow control inputs can be circular, so we keep track of
-            # explored operations.
-            for control in tf_obj.control_inputs:
-                if control not in explored_inputs:
-                    queue.append(control)
-                    explored_inputs.add(control)
-            if "Variable" in tf_obj.node_def.op:
-                variable_names.append(tf_obj.node_def.name)
+        self.sess = sess
+        # The variables are the ones `GraphIndex` reached from the loss.
+        variable_names = set(get_graph_index(loss).variable_names)
         self.variables = collections.OrderedDict()
         variable_list = [
             v for v in tf.global_variables()
-            if v.op.node_def.name in variable_names
+            if v.op.name in variable_names
         ]
         for v in variable_list:
-            self.variables[v.op.node_def.name] = v
+            self.variables[v.op.name] = v
         
         self.placeholders = dict()
         self.assignment_nodes = dict()
+        self.shapes = collections.OrderedDict()
         
         # Create new placeholders to put in custom weights.
         for k, var in self.variables.items():
+            self.shapes[k] = var.get_shape().as_list()
             self.placeholders[k] = tf.placeholder(
                 var.value().dtype,
-                var.get_shape().as_list(),
+                self.shapes[k],
                 name="Placeholder_" + k)
-            self.assignment_nodes[k] = var.assign(self.placeholders[k])
\ No newline at end of file
+            self.assignment_nodes[k] = var.assign(self.placeholders[k])
+    
+    def set_session(self, sess):
+        """Sets the session used by the get and set methods."""
+        self.sess = sess
+    
+    def _session(self):
+        sess = self.sess or tf.get_default_session()
+        if sess is None:
+            raise ValueError('TensorFlowVariables has no session, pass sess or use it in a default session')
+        return sess
+    
+    def get_flat_size(self):
+        """Number of the weights of all the variables."""
+        return sum(int(np.prod(shape)) for shape in self.shapes.values())
+    
+    def flat_buffer(self, dtype=None):
+        """Uninitialized flat buffer for `get_weights`, in the dtype of the variables by default."""
+        if dtype is None:
+            dtype = np.result_type(*[var.dtype.base_dtype.as_numpy_dtype for var in self.variables.values()])
+        return np.empty(self.get_flat_size(), dtype=dtype)
+    
+    def views(self, buffer):
+        """Views of each variable in a flat buffer, without copying.
+        
+        Args:
+            buffer: Flat array of `get_flat_size` weights.
+        
+        Returns:
+            OrderedDict of the name of each variable to its weights in buffer.
+        """
+        if buffer.shape != (self.get_flat_size(),):
+            raise ValueError('buffer should have the shape ({},), got {}'.format(self.get_flat_size(), buffer.shape))
+        views = collections.OrderedDict()
+        offset = 0
+        for k, shape in self.shapes.items():
+            size = int(np.prod(shape))
+            views[k] = buffer[offset:offset + size].reshape(shape)
+            offset += size
+        return views
+    
+    def get_weights(self, buffer=None):
+        """Fetches the weights of all the variables in one run.
+        
+        Args:
+            buffer: Flat buffer, e.g. of `flat_buffer`, to copy the weights into.
+        
+        Returns:
+            OrderedDict of the name of each variable to its weights, the views of
+            buffer if it is given.
+        """
+        values = self._session().run(list(self.variables.values()))
+        weights = collections.OrderedDict(zip(self.variables, values))
+        if buffer is None:
+            return weights
+        views = self.views(buffer)
+        for k, value in weights.items():
+            np.copyto(views[k], value)
+        return views
+    
+    def set_weights(self, new_weights):
+        """Assigns the weights of the variables in one run.
+        
+        Args:
+            new_weights: Dict of the name of variables to their weights, e.g. of
+                `get_weights`.
+        """
+        unknown = set(new_weights) - set(self.variables)
+        if unknown:
+            raise ValueError('No variables named {}'.format(sorted(unknown)))
+        # The operations of the assignments don't fetch the assigned values back.
+        self._session().run([self.assignment_nodes[k].op for k in new_weights],
+                            feed_dict={self.placeholders[k]: v for k, v in new_weights.items()})
+    
+    def get_flat(self):
+        """Weights of all the variables in one flat array."""
+        buffer = self.flat_buffer()
+        self.get_weights(buffer)
+        return buffer
+    
+    def set_flat(self, new_weights):
+        """Assigns the weights of all the variables from a flat array, e.g. of `get_flat`."""
+        self.set_weights(self.views(new_weights))
\ No newline at end of file
@@ -0,0 +1,53 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import tempfile
+
+import tensorflow as tf
+
+from sakurai_nmf import benchmarks
+
+
+class TestBenchmarks(tf.test.TestCase):
+    def test_fixtures_are_seeded(self):
+        for kind in benchmarks.kinds:
+            fixture = benchmarks.make_fixture('tiny', kind=kind, use_bias=True, seed=1)
+            same = benchmarks.make_fixture('tiny', kind=kind, use_bias=True, seed=1)
+            for name in ('a', 'u', 'v'):
+                self.assertAllEqual(fixture[name], same[name])
+            batch_size, input_size, output_size = benchmarks.regimes['tiny']
+            self.assertEqual(fixture.a.shape, (batch_size, output_size))
+            self.assertEqual(fixture.u.shape, (batch_size, input_size))
+            self.assertEqual(fixture.v.shape, (input_size + 1, output_size))
+        with self.assertRaises(ValueError):
+            benchmarks.make_fixture('tiny', kind='tanh')
+    
+    def test_run_suite(self):
+        records = benchmarks.run_suite(regime_names=('tiny',), num_warmup=1, num_repeats=2, num_iters=2)
+        self.assertEqual(len(records), 2 * len(benchmarks.solvers))
+        for record in records:
+            self.assertEqual(len(record['durations']), 2)
+            self.assertLess(record['new_loss'], record['old_loss'])
+        
+        path = os.path.join(tempfile.mkdtemp(), 'results.json')
+        benchmarks.write_results(records, path)
+        baseline = benchmarks.load_results(path)
+        self.assertEqual(benchmarks.compare_results(baseline, records), [])
+        slower = [dict(record, min=2 * record['min']) for record in records]
+        regressions = benchmarks.compare_results(baseline, slower)
+        self.assertEqual(len(regressions), len(records))
+        self.assertTrue(all(metric == 'min' for _, metric, _, _ in regressions))
+    
+    def test_run_svd_suite(self):
+        records = benchmarks.run_svd_suite(regime_names=('tiny',), ranks=(10, 20), num_warmup=0,
+                                           num_repeats=1)
+        self.assertEqual([(record['solver'], record['options']['rank']) for record in records],
+                         [('svd_economy', 10), ('svd_randomized', 10), ('svd_economy', 20), ('svd_randomized', 20)])
+        for record in records:
+            self.assertLess(record['new_loss'], record['old_loss'])
+
+
+if __name__ == '__main__':
+    tf.test.main()
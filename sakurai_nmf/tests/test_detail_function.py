@@ -2,9 +2,28 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import functools
+from multiprocessing import shared_memory
+from unittest import mock
+
+import numpy as np
+import scipy.sparse
 import tensorflow as tf
 
 import sakurai_nmf.matrix_factorization as mf
+from sakurai_nmf import losses
+from sakurai_nmf.exception import MatrixFactorizationError
+from sakurai_nmf.matrix_factorization import executor as executor_lib
+from sakurai_nmf.matrix_factorization import np_biased_nmf, np_nmf, utility
+
+
+def random_auv(a_low=0., use_bias=False, seed=0):
+    """Seeded a, non-negative u and v of a layer in batch first, v with the bias row if use_bias."""
+    random_state = np.random.RandomState(seed)
+    a = random_state.uniform(a_low, 1., size=(300, 80))
+    u = random_state.uniform(0., 1., size=(300, 40))
+    v = random_state.uniform(-1., 1., size=(40 + int(use_bias), 80))
+    return a, u, v
 
 
 class TestDetailFunction(tf.test.TestCase):
@@ -17,4 +36,283 @@ class TestDetailFunction(tf.test.TestCase):
         print(tf_u, tf_v)
         assert u.shape == tf_u.shape
         assert v.shape == tf_v.shape
-        
\ No newline at end of file
+    
+    def test_low_rank_methods(self):
+        a = np.random.uniform(size=(300, 40)) @ np.random.uniform(size=(40, 200))
+        for svd_method in ['full', 'economy', functools.partial(utility.randomized_svd, rank=40)]:
+            svd = utility._low_rank(a, svd_method=svd_method)
+            self.assertEqual(svd.u.shape, (300, 40))
+            self.assertEqual(svd.v.shape, (200, 40))
+            self.assertAllClose((svd.u * svd.s) @ svd.v.T, a)
+        
+        # 'randomized' truncates only to an explicit rank, it is the economy SVD by default.
+        a = np.random.uniform(size=(1000, 500))
+        svd = utility._low_rank(a, svd_method='randomized')
+        self.assertEqual(svd.u.shape, (1000, 500))
+        self.assertEqual(svd.v.shape, (500, 500))
+        self.assertAllClose((svd.u * svd.s) @ svd.v.T, a)
+        # Too small to be truncated much, the economy SVD is truncated instead.
+        u, s, vt = utility.randomized_svd(a[:40, :30], rank=10)
+        self.assertEqual(s.shape, (10,))
+        self.assertAllClose(s, np.linalg.svd(a[:40, :30], compute_uv=False)[:10])
+    
+    def test_randomized_svd_rank(self):
+        a = np.random.uniform(size=(500, 20)) @ np.random.uniform(size=(20, 300))
+        a += np.random.normal(scale=1e-3, size=a.shape)
+        svd_method = functools.partial(utility.randomized_svd, rank=20, seed=42)
+        svd = utility._low_rank(a, svd_method=svd_method)
+        self.assertEqual(svd.u.shape, (500, 20))
+        self.assertEqual(svd.v.shape, (300, 20))
+        s = np.linalg.svd(a, compute_uv=False)
+        self.assertAllClose(svd.s, s[:20], rtol=1e-3)
+    
+    def test_low_rank_cache(self):
+        a = np.random.uniform(size=(500, 100))
+        cache = utility.LowRankCache(drift_tol=1e-2)
+        cache.low_rank(a, 'a')
+        b = a + np.random.normal(scale=1e-6, size=a.shape)
+        svd = cache.low_rank(b, 'a')
+        self.assertEqual(cache.num_misses, 1)
+        self.assertEqual(cache.num_refreshes, 1)
+        self.assertAllClose((svd.u * svd.s) @ svd.v.T, b, atol=1e-4)
+        cache.low_rank(np.random.uniform(size=(500, 100)), 'a')
+        self.assertEqual(cache.num_misses, 2)
+        # The refresh moves the left subspace to the range of b, which the cached one misses.
+        x = np.random.uniform(size=(500, 10))
+        y = np.random.uniform(size=(10, 100))
+        cache.low_rank(x @ y, 'b', rcond=1e-8)
+        b = (x + np.random.normal(scale=1e-3, size=x.shape)) @ y
+        svd = cache.low_rank(b, 'b', rcond=1e-8)
+        self.assertEqual(cache.num_refreshes, 2)
+        self.assertAllClose(svd.s, np.linalg.svd(b, compute_uv=False)[:10])
+        self.assertAllClose((svd.u * svd.s) @ svd.v.T, b, atol=1e-8)
+    
+    def test_precision(self):
+        a = np.random.uniform(size=(300, 100))
+        u = np.random.uniform(size=(300, 30))
+        v = np.random.uniform(size=(30, 100))
+        u_64, v_64 = mf.semi_nmf(a, u, v, num_iters=3, precision='float64')
+        for precision in ['float32', 'mixed']:
+            u_32, v_32 = mf.semi_nmf(a, u, v, num_iters=3, precision=precision)
+            self.assertEqual(u_32.dtype, np.float32)
+            self.assertEqual(v_32.dtype, np.float32)
+            self.assertAllClose(u_32 @ v_32, u_64 @ v_64, rtol=1e-3, atol=1e-3)
+        with self.assertRaises(ValueError):
+            mf.semi_nmf(a, u, v, precision='float16')
+    
+    def test_transposed_solvers(self):
+        a = np.random.uniform(size=(300, 100))
+        u = np.random.uniform(-1., 1., size=(300, 31))
+        v = np.random.uniform(size=(30, 100))
+        for solvers in [np_nmf, np_biased_nmf]:
+            _u = u if solvers is np_biased_nmf else u[:, :-1]
+            for solve in [solvers.semi_nmf, solvers.nonlin_semi_nmf, solvers.softmax_nmf]:
+                u_matlab, v_matlab = solve(a, _u, v)
+                u_t, v_t = solve(a.T.copy(), _u.T.copy(), v.T.copy(), transposed=True)
+                self.assertAllClose(u_t.T, u_matlab)
+                self.assertAllClose(v_t.T, v_matlab)
+    
+    def test_workspace(self):
+        a = np.random.uniform(-1., 1., size=(300, 100))
+        u = np.random.uniform(-1., 1., size=(300, 30))
+        v = np.random.uniform(size=(30, 100))
+        workspace = utility.Workspace()
+        u_1, v_1 = np_nmf.semi_nmf(a, u, v, num_iters=3, workspace=workspace)
+        nbytes = workspace.nbytes
+        u_2, v_2 = np_nmf.semi_nmf(a, u, v, num_iters=3, workspace=workspace)
+        self.assertEqual(workspace.nbytes, nbytes)
+        self.assertAllClose(u_1, u_2)
+        self.assertAllClose(v_1, v_2)
+        # The input is not overwritten by the in-place update.
+        self.assertAllClose(np_nmf.semi_nmf(a, u, v, num_iters=3)[1], v_1)
+    
+    def test_streaming_semi_nmf(self):
+        a, u, v = random_auv()
+        bias_v = np.vstack((v, np.ones((1, 80))))
+        for solve, streaming_solve in [(mf.semi_nmf, mf.streaming_semi_nmf),
+                                       (mf.nonlin_semi_nmf, mf.streaming_nonlin_semi_nmf)]:
+            for _v, use_bias in [(v, False), (bias_v, True)]:
+                u_1, v_1 = solve(a, u, _v, use_bias=use_bias, num_iters=2)
+                u_2 = u.copy()
+                chunks = mf.RowChunks(a, u_2, chunk_size=37)
+                v_2 = streaming_solve(chunks, _v, use_bias=use_bias, num_iters=2)
+                self.assertAllClose(u_1, u_2)
+                self.assertAllClose(v_1, v_2)
+        # A generator can be read only once.
+        with self.assertRaises(ValueError):
+            mf.streaming_semi_nmf(mf.iter_chunks(a, u.copy()), v, num_iters=2)
+    
+    def test_process_executor(self):
+        a, u, v = random_auv()
+        with mf.ProcessExecutor(max_workers=2) as executor:
+            for solve in (mf.semi_nmf, mf.nonlin_semi_nmf, mf.softmax_nmf):
+                u_1, v_1 = solve(a, u, v)
+                u_2, v_2 = solve(a, u, v, executor=executor)
+                self.assertAllClose(u_1, u_2)
+                self.assertAllClose(v_1, v_2)
+            # The skipped side is returned as the shared input itself.
+            for kwargs in ({'num_calc_v': 0}, {'num_calc_u': 0}):
+                for solve in (mf.semi_nmf, mf.nonlin_semi_nmf):
+                    u_1, v_1 = solve(a, u, v, **kwargs)
+                    u_2, v_2 = solve(a, u, v, executor=executor, **kwargs)
+                    self.assertAllClose(u_1, u_2)
+                    self.assertAllClose(v_1, v_2)
+            futures = [executor.submit(np_nmf.semi_nmf, a.T, v.T, u.T) for _ in range(2)]
+            for future in futures:
+                u_t, v_t = future.result()
+                self.assertEqual(u_t.shape, v.T.shape)
+                self.assertEqual(v_t.shape, u.T.shape)
+        
+        with mf.ProcessExecutor(max_workers=1) as executor:
+            executor.run(np_nmf.semi_nmf, a, u, v)
+            # The worker loads the NumPy solvers without the __init__ of the packages, which import TensorFlow.
+            modules = executor._pool.submit(eval, 'sorted(__import__("sys").modules)').result()
+        self.assertIn('sakurai_nmf.matrix_factorization.np_nmf', modules)
+        self.assertNotIn('sakurai_nmf.matrix_factorization.matrix_factorization', modules)
+        self.assertNotIn('tensorflow', modules)
+    
+    def test_process_executor_failed_submit(self):
+        a, u, v = random_auv()
+        names = []
+        SharedMemory = shared_memory.SharedMemory
+        
+        def record(*args, **kwargs):
+            shm = SharedMemory(*args, **kwargs)
+            names.append(shm.name)
+            return shm
+        
+        def record_until_full(*args, **kwargs):
+            if len(names) == 2:
+                raise OSError('no space left for the block of v')
+            return record(*args, **kwargs)
+        
+        executor = mf.ProcessExecutor(max_workers=1)
+        with mock.patch.object(executor_lib.shared_memory, 'SharedMemory', record_until_full):
+            with self.assertRaises(OSError):
+                executor.submit(np_nmf.semi_nmf, a, u, v)
+        self.assertEqual(len(names), 2)
+        executor.shutdown()
+        with mock.patch.object(executor_lib.shared_memory, 'SharedMemory', record):
+            with self.assertRaises(RuntimeError):
+                executor.submit(np_nmf.semi_nmf, a, u, v)
+        self.assertEqual(len(names), 5)
+        # All the blocks allocated before the failures are unlinked.
+        for name in names:
+            with self.assertRaises(FileNotFoundError):
+                shared_memory.SharedMemory(name=name)
+    
+    def test_convergence(self):
+        for use_bias in (False, True):
+            a, u, v = random_auv(use_bias=use_bias)
+            # The residual from the Gram matrices is the one of the product.
+            new_u, new_v, info = mf.semi_nmf(a, u, v, use_bias=use_bias, return_info=True)
+            if use_bias:
+                new_u = np.hstack((new_u, np.ones((300, 1))))
+            self.assertAllClose(info.residuals, [np.linalg.norm(a - new_u @ new_v) / np.linalg.norm(a)])
+            
+            _, _, info = mf.semi_nmf(a, u, v, use_bias=use_bias, num_iters=1000, tol=1e-3,
+                                     return_info=True)
+            self.assertTrue(info.converged)
+            self.assertLess(info.num_iters, 1000)
+            self.assertEqual(len(info.residuals), info.num_iters)
+            
+            _, _, info = mf.nonlin_semi_nmf(a, u, v, use_bias=use_bias, num_iters=3, return_info=True)
+            self.assertEqual(info.num_iters, 3)
+            self.assertLess(info.residuals[-1], info.residuals[0])
+        with self.assertRaises(ValueError):
+            mf.semi_nmf(a, u, v, return_info=True, use_tf=True)
+    
+    def test_gram_frobenius_norm(self):
+        a, u, v = random_auv()
+        expected = losses.np_frobenius_norm(a, u @ v)
+        self.assertAllClose(losses.np_gram_frobenius_norm(a, u, v), expected)
+        self.assertAllClose(losses.np_gram_frobenius_norm(a, u, v, x_norm_sq=np.sum(np.square(a)),
+                                                          utx=u.T @ a, utu=u.T @ u), expected)
+        with self.test_session() as sess:
+            self.assertAllClose(sess.run(losses.gram_frobenius_norm(tf.constant(a), tf.constant(u),
+                                                                    tf.constant(v))), expected)
+    
+    def test_update_rules(self):
+        alpha = 1e-2
+        for use_bias in (False, True):
+            a, u, v = random_auv(a_low=-1., use_bias=use_bias)
+            for update_rule in ('accelerated', 'projected_gradient', 'hals'):
+                new_u, new_v = u, v
+                state = mf.new_update_state()
+                objectives = []
+                for _ in range(20):
+                    new_u, new_v = mf.semi_nmf(a, new_u, new_v, use_bias=use_bias, alpha=alpha,
+                                               update_rule=update_rule, state=state)
+                    if use_bias:
+                        # The biased v is solved by ridge regression, so the objective has its penalty.
+                        bias_u = np.hstack((new_u, np.ones((300, 1))))
+                        objectives.append(np.sum(np.square(a - bias_u @ new_v)) + alpha * np.sum(np.square(new_v)))
+                    else:
+                        objectives.append(np.sum(np.square(a - new_u @ new_v)))
+                self.assertGreaterEqual(np.min(new_u), 0.)
+                # Neither the updates of the non-negative u nor the solves of v increase the objective.
+                self.assertTrue(np.all(np.diff(objectives) <= 1e-9 * objectives[0]), msg=update_rule)
+        with self.assertRaises(ValueError):
+            mf.semi_nmf(a, u, v, update_rule='momentum')
+    
+    def test_accelerated_update_rule(self):
+        # In the MATLAB format of np_nmf, v is the non-negative matrix.
+        a, v, u = (x.T for x in random_auv(a_low=-1.))
+        residuals = {}
+        state = np_nmf.new_update_state()
+        for update_rule in ('projected_gradient', 'accelerated'):
+            # With u kept, the updates of v solve one non-negative least squares.
+            _, _, info = np_nmf.semi_nmf(a, u, v, num_iters=30, num_calc_u=0, update_rule=update_rule,
+                                         state=state, return_info=True)
+            residuals[update_rule] = info.residuals[-1]
+        self.assertLessEqual(residuals['accelerated'], residuals['projected_gradient'] * (1. + 1e-12))
+        self.assertIsNotNone(state.eigvec)
+    
+    def test_sparse_input(self):
+        a, u, v = random_auv(a_low=-3.)
+        # Three quarters of the entries of a and u are zeros.
+        a = np.maximum(a, 0.)
+        u = np.maximum(4. * u - 3., 0.)
+        for to_sparse in (scipy.sparse.csr_matrix, scipy.sparse.csc_matrix):
+            for solve in (mf.semi_nmf, mf.nonlin_semi_nmf):
+                u_1, v_1 = solve(a, u, v)
+                u_2, v_2 = solve(to_sparse(a), to_sparse(u), v)
+                self.assertIsInstance(u_2, np.ndarray)
+                self.assertAllClose(u_1, u_2)
+                self.assertAllClose(v_1, v_2)
+        self.assertAllClose(losses.np_gram_frobenius_norm(scipy.sparse.csr_matrix(a), u, v),
+                            losses.np_frobenius_norm(a, u @ v))
+    
+    def test_profiler(self):
+        a, u, v = random_auv(a_low=-1., use_bias=True)
+        with mf.Profiler() as profiler:
+            expected = mf.semi_nmf(a, u, v[:-1], num_iters=2)
+            mf.nonlin_semi_nmf(np.maximum(a, 0.), u, v, use_bias=True)
+        for name in ('compute_u', 'compute_u/svd', 'compute_v/gram', 'nonlin_solve/svd',
+                     'nonlin_solve/solve', 'nonlin_solve/residual'):
+            self.assertIn(name, profiler.stats)
+        self.assertEqual(profiler.stats['compute_u'].calls, 2)
+        # The products of the updates of v write into the buffers of the workspace.
+        self.assertGreater(profiler.stats['compute_v'].flops, 0)
+        self.assertEqual(profiler.stats['compute_v'].nbytes, 0)
+        self.assertGreater(profiler.stats['compute_u/svd'].nbytes, 0)
+        # Outside the scope nothing is recorded and the results do not change.
+        stats = {name: stat.calls for name, stat in profiler.stats.items()}
+        for outputs, expected_outputs in zip(mf.semi_nmf(a, u, v[:-1], num_iters=2), expected):
+            self.assertAllClose(outputs, expected_outputs)
+        self.assertEqual({name: stat.calls for name, stat in profiler.stats.items()}, stats)
+    
+    def test_numerics_guard(self):
+        a, u, v = random_auv(a_low=-1.)
+        expected = mf.semi_nmf(a, u, v, num_iters=2)
+        for numerics in ('off', 'sampled', 'sum'):
+            for outputs, expected_outputs in zip(mf.semi_nmf(a, u, v, num_iters=2, numerics=numerics), expected):
+                self.assertAllEqual(outputs, expected_outputs)
+        nan_u = u.copy()
+        nan_u[10, 5] = np.nan
+        for numerics in ('sampled', 'sum', 'full'):
+            for solve in (mf.semi_nmf, mf.nonlin_semi_nmf):
+                with self.assertRaises(MatrixFactorizationError):
+                    solve(np.maximum(a, 0.), nan_u, v, numerics=numerics)
+        with self.assertRaises(ValueError):
+            mf.semi_nmf(a, u, v, numerics='never')
@@ -8,9 +8,11 @@ import agents
 import numpy as np
 import tensorflow as tf
 
+import sakurai_nmf.matrix_factorization as mf
 from sakurai_nmf import benchmark_model
 from sakurai_nmf.optimizer import optimizers
 from sakurai_nmf.optimizer import rnn_optimizers
+from sakurai_nmf.optimizer import training
 
 
 def default_config():
@@ -73,6 +75,174 @@ class NMFOptimizerTest(tf.test.TestCase):
                 })
                 losses.append(new_loss)
                 print('\nloss {}, accuracy {}'.format(new_loss, acc), end='', flush=True)
+    
+    def test_jacobi_schedule(self):
+        config = agents.tools.AttrDict(default_config())
+        model = benchmark_model.build_tf_one_hot_model(config.batch_size, use_bias=True,
+                                                       activation=tf.nn.relu)
+        train_ops = [optimizers.NMFOptimizer(schedule=schedule).minimize(model.frob_norm).nmf
+                     for schedule in optimizers.schedules]
+        variables = tf.trainable_variables()
+        x = np.random.uniform(0., 1., size=(config.batch_size, 784))
+        y = np.eye(10)[np.random.randint(10, size=config.batch_size)]
+        
+        with self.test_session() as sess:
+            sess.run(tf.global_variables_initializer())
+            initial_values = sess.run(variables)
+            results = []
+            for train_op in train_ops:
+                for variable, value in zip(variables, initial_values):
+                    variable.load(value, sess)
+                sess.run(train_op, feed_dict={model.inputs: x, model.labels: y})
+                results.append(sess.run(variables))
+        # Both schedules solve the same factorizations, only in another order.
+        for gauss_seidel, jacobi in zip(*results):
+            self.assertAllClose(gauss_seidel, jacobi)
+        
+        with self.assertRaises(ValueError):
+            optimizers.NMFOptimizer(schedule='red_black')
+    
+    def test_jacobi_schedule_executor(self):
+        config = agents.tools.AttrDict(default_config())
+        model = benchmark_model.build_tf_one_hot_model(config.batch_size, use_bias=True,
+                                                       activation=tf.nn.relu)
+        with mf.ProcessExecutor(max_workers=2) as executor:
+            train_ops = [optimizers.NMFOptimizer(schedule='jacobi', executor=_executor)
+                             .minimize(model.frob_norm).nmf
+                         for _executor in (None, executor)]
+            variables = tf.trainable_variables()
+            x = np.random.uniform(0., 1., size=(config.batch_size, 784))
+            y = np.eye(10)[np.random.randint(10, size=config.batch_size)]
+            
+            with self.test_session() as sess:
+                sess.run(tf.global_variables_initializer())
+                initial_values = sess.run(variables)
+                results = []
+                for train_op in train_ops:
+                    for variable, value in zip(variables, initial_values):
+                        variable.load(value, sess)
+                    sess.run(train_op, feed_dict={model.inputs: x, model.labels: y})
+                    results.append(sess.run(variables))
+        # The kernel solves keep u, which the workers return as their shared inputs.
+        for in_process, in_workers in zip(*results):
+            self.assertAllClose(in_process, in_workers)
+    
+    def test_accelerated_update_rule(self):
+        model = benchmark_model.build_tf_one_hot_model(300)
+        update_rules = ('projected_gradient', 'accelerated')
+        train_ops = [optimizers.NMFOptimizer(update_rule=update_rule).minimize(model.frob_norm).nmf
+                     for update_rule in update_rules]
+        variables = tf.trainable_variables()
+        random_state = np.random.RandomState(0)
+        x = random_state.uniform(0., 1., size=(300, 784))
+        y = np.eye(10)[random_state.randint(10, size=300)]
+        
+        with self.test_session() as sess:
+            sess.run(tf.global_variables_initializer())
+            initial_values = sess.run(variables)
+            results = []
+            for train_op in train_ops:
+                for variable, value in zip(variables, initial_values):
+                    variable.load(value, sess)
+                steps = []
+                for _ in range(2):
+                    sess.run(train_op, feed_dict={model.inputs: x, model.labels: y})
+                    steps.append(sess.run(variables))
+                results.append(steps)
+        # The momentum restarts at every step, so one update a step is a projected gradient step.
+        for projected_gradient_steps, accelerated_steps in zip(*results):
+            for projected_gradient, accelerated in zip(projected_gradient_steps, accelerated_steps):
+                self.assertAllClose(projected_gradient, accelerated)
+        
+        with self.assertRaises(ValueError):
+            optimizers.NMFOptimizer(update_rule='accelerated', executor=object())
+    
+    def test_svd_cache(self):
+        model = benchmark_model.build_tf_one_hot_model(300, activation=tf.nn.relu)
+        optimizer = optimizers.NMFOptimizer(use_svd_cache=True)
+        train_op = optimizer.minimize(model.frob_norm).nmf
+        variables = tf.trainable_variables()
+        x = np.random.uniform(0., 1., size=(600, 784))
+        y = np.eye(10)[np.random.randint(10, size=600)]
+        
+        with self.test_session() as sess:
+            sess.run(tf.global_variables_initializer())
+            initial_values = sess.run(variables)
+            sess.run(train_op, feed_dict={model.inputs: x[:300], model.labels: y[:300]})
+            # The kernels are the same at the second step, on another batch.
+            for variable, value in zip(variables, initial_values):
+                variable.load(value, sess)
+            sess.run(train_op, feed_dict={model.inputs: x[300:], model.labels: y[300:]})
+        # The SVD of the kernel of each ReLU layer is refreshed, while the activations
+        # of the new batch are decomposed again without a refresh to be rejected.
+        svd_caches = [svd_cache for svd_cache in optimizer._svd_caches if svd_cache.num_misses]
+        self.assertEqual(len(svd_caches), 2)
+        for svd_cache in svd_caches:
+            self.assertEqual(svd_cache.num_misses, 1)
+            self.assertEqual(svd_cache.num_refreshes, 1)
+    
+    def test_epoch_mode(self):
+        config = agents.tools.AttrDict(default_config())
+        model = benchmark_model.build_tf_one_hot_model(config.batch_size, use_bias=True,
+                                                       activation=tf.nn.relu)
+        jacobi_op = optimizers.NMFOptimizer(schedule='jacobi').minimize(model.frob_norm).nmf
+        epoch_op = optimizers.NMFOptimizer(mode='epoch').minimize(model.frob_norm)
+        variables = tf.trainable_variables()
+        x = np.random.uniform(0., 1., size=(config.batch_size * 2, 784))
+        y = np.eye(10)[np.random.randint(10, size=len(x))]
+        
+        with self.test_session() as sess:
+            sess.run(tf.global_variables_initializer())
+            initial_values = sess.run(variables)
+            # An epoch of one batch solves the kernels like the jacobi schedule.
+            sess.run(jacobi_op, feed_dict={model.inputs: x[:config.batch_size],
+                                           model.labels: y[:config.batch_size]})
+            jacobi = sess.run(variables)
+            for variable, value in zip(variables, initial_values):
+                variable.load(value, sess)
+            batches = [(x[:config.batch_size], y[:config.batch_size])]
+            self.assertEqual(training.run_epoch(sess, epoch_op, batches, model.inputs, model.labels), 1)
+            for jacobi_value, epoch_value in zip(jacobi, sess.run(variables)):
+                self.assertAllClose(jacobi_value, epoch_value)
+            
+            # The statistics are reset after the solve.
+            old_loss = sess.run(model.frob_norm, feed_dict={model.inputs: x[:config.batch_size],
+                                                            model.labels: y[:config.batch_size]})
+            batches = benchmark_model.block_batches(x, y, config.batch_size)
+            self.assertEqual(training.run_epoch(sess, epoch_op, batches, model.inputs, model.labels), 2)
+            new_loss = sess.run(model.frob_norm, feed_dict={model.inputs: x[:config.batch_size],
+                                                            model.labels: y[:config.batch_size]})
+            self.assertLess(new_loss, old_loss)
+        
+        with self.assertRaises(ValueError):
+            optimizers.NMFOptimizer(mode='minibatch')
+    
+    def test_train_step(self):
+        config = agents.tools.AttrDict(default_config())
+        model = benchmark_model.build_tf_one_hot_model(config.batch_size, use_bias=True)
+        train_op = optimizers.NMFOptimizer().minimize(model.frob_norm)
+        metrics = dict(loss=model.frob_norm, accuracy=model.accuracy)
+        train_step = training.TrainStep(train_op, metrics)
+        x = np.random.uniform(0., 1., size=(config.batch_size * 2 + 10, 784))
+        y = np.eye(10)[np.random.randint(10, size=len(x))]
+        feed_dict = {model.inputs: x[:config.batch_size], model.labels: y[:config.batch_size]}
+        
+        with self.test_session() as sess:
+            sess.run(tf.global_variables_initializer())
+            old_loss = sess.run(model.frob_norm, feed_dict=feed_dict)
+            train = train_step(sess, feed_dict=feed_dict)
+            # The metrics of the step are the ones after the update.
+            self.assertLess(train.loss, old_loss)
+            self.assertAllClose(train.loss, sess.run(model.frob_norm, feed_dict=feed_dict))
+            
+            # The last 10 rows are repeated up to a batch and weighted by their number.
+            test = training.evaluate(sess, metrics, model.inputs, model.labels, x, y, config.batch_size)
+            index = np.arange(config.batch_size) % 10
+            feed_dicts = [{model.inputs: x[i:i + config.batch_size], model.labels: y[i:i + config.batch_size]}
+                          for i in (0, config.batch_size)]
+            feed_dicts.append({model.inputs: x[-10:][index], model.labels: y[-10:][index]})
+            losses = [sess.run(model.frob_norm, feed_dict=feed_dict) for feed_dict in feed_dicts]
+            self.assertAllClose(test.loss, np.average(losses, weights=[config.batch_size] * 2 + [10]))
 
 class RecurrentNMFTest(tf.test.TestCase):
     
@@ -419,4 +419,54 @@ class TestTfFormatMatrixFactorization(tf.test.TestCase):
         assert a.shape == (_bias_u @ _bias_v).shape
         assert new_loss < old_loss, "new loss should be less than old loss."
         print_format('TensorFlow', 'biased Nonlinear semi-NMF(NOT CALC v)', a, _bias_u, _bias_v, old_loss, new_loss,
-                     duration)
\ No newline at end of file
+                     duration)
+    
+    def test_tf_backend_matches_numpy(self):
+        auv = sio.loadmat(mat_file)
+        a, u, v = auv['a'], auv['u'], auv['v']
+        bias_v = np.vstack((v, np.ones((1, v.shape[1]))))
+        
+        a_ph = tf.placeholder(tf.float64, shape=a.shape)
+        u_ph = tf.placeholder(tf.float64, shape=u.shape)
+        v_ph = tf.placeholder(tf.float64, shape=v.shape)
+        bias_v_ph = tf.placeholder(tf.float64, shape=bias_v.shape)
+        feed_dict = {a_ph: a, u_ph: u, v_ph: v, bias_v_ph: bias_v}
+        
+        for factorize in [semi_nmf, nonlin_semi_nmf, softmax_nmf]:
+            for use_bias, right in [(False, v_ph), (True, bias_v_ph)]:
+                np_ops = factorize(a_ph, u_ph, right, use_tf=True, use_bias=use_bias)
+                tf_ops = factorize(a_ph, u_ph, right, use_tf=True, use_bias=use_bias, backend='tensorflow')
+                with self.test_session() as sess:
+                    np_u, np_v = sess.run(np_ops, feed_dict=feed_dict)
+                    tf_u, tf_v = sess.run(tf_ops, feed_dict=feed_dict)
+                self.assertAllClose(np_u, tf_u)
+                self.assertAllClose(np_v, tf_v)
+        
+        # The outputs solved in float32 are in the dtypes of u and v, like the ones of the numpy backend.
+        for factorize in [semi_nmf, nonlin_semi_nmf, softmax_nmf]:
+            np_ops = factorize(a_ph, u_ph, v_ph, use_tf=True, precision='mixed')
+            tf_ops = factorize(a_ph, u_ph, v_ph, use_tf=True, precision='mixed', backend='tensorflow')
+            self.assertEqual([op.dtype for op in tf_ops], [tf.float64, tf.float64])
+            with self.test_session() as sess:
+                np_u, np_v = sess.run(np_ops, feed_dict=feed_dict)
+                tf_u, tf_v = sess.run(tf_ops, feed_dict=feed_dict)
+            self.assertAllClose(np_u, tf_u, rtol=1e-3, atol=1e-3)
+            self.assertAllClose(np_v, tf_v, rtol=1e-3, atol=1e-3)
+    
+    def test_tf_backend_numerics(self):
+        auv = sio.loadmat(mat_file)
+        a, u, v = auv['a'], auv['u'], auv['v']
+        nan_u = u.copy()
+        nan_u[1, 2] = np.nan
+        
+        a_ph = tf.placeholder(tf.float64, shape=a.shape)
+        u_ph = tf.placeholder(tf.float64, shape=u.shape)
+        v_ph = tf.placeholder(tf.float64, shape=v.shape)
+        for numerics in ('sampled', 'sum', 'full'):
+            tf_ops = semi_nmf(a_ph, u_ph, v_ph, use_tf=True, backend='tensorflow', numerics=numerics)
+            with self.test_session() as sess:
+                tf_u, tf_v = sess.run(tf_ops, feed_dict={a_ph: a, u_ph: u, v_ph: v})
+                self.assertTrue(np.isfinite(tf_u).all() and np.isfinite(tf_v).all())
+                # NaN in the matrix whose SVD is taken is caught by the singular values without a full pass.
+                with self.assertRaises(tf.errors.InvalidArgumentError):
+                    sess.run(tf_ops, feed_dict={a_ph: a, u_ph: nan_u, v_ph: v})
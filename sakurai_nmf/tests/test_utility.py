@@ -1,11 +1,19 @@
+import functools
+import gc
+import os
+import weakref
 from pprint import pprint
 
+import numpy as np
 import tensorflow as tf
 
 from sakurai_nmf import benchmark_model
 from sakurai_nmf import losses
 from sakurai_nmf.matrix_factorization import semi_nmf
+from sakurai_nmf.optimizer import discovery
 from sakurai_nmf.optimizer import utility
+from sakurai_nmf.optimizer.discovery import discover_layers
+from sakurai_nmf.utils import Prefetcher, batch, fork_random_state
 
 mat_file = '../../matrix_factorization/tests/np_tests/small_v_neg.mat'
 
@@ -43,6 +51,19 @@ class UtilityTest(tf.test.TestCase):
         self.assertEqual(layers[1].activation.type, 'Relu')
         self.assertEqual(layers[2].activation, None)
     
+    def test_find_activation(self):
+        with tf.Graph().as_default():
+            x = tf.placeholder(tf.float64, (None, 10))
+            kernels = [tf.get_variable('kernel_{}'.format(i), (10, 10), dtype=tf.float64) for i in range(3)]
+            bias = tf.get_variable('bias', (10,), dtype=tf.float64)
+            # The names do not matter, only the activation applied to the product does.
+            hidden = tf.identity(tf.nn.bias_add(x @ kernels[0], bias), name='dense/Relu')
+            relu = tf.nn.relu(hidden @ kernels[1], name='dense_1/activation')
+            tf.nn.softmax(relu, name='dense_2/Softmax')
+        self.assertIsNone(discovery.find_activation(kernels[0]))
+        self.assertEqual(discovery.find_activation(kernels[1]), relu.op)
+        self.assertIsNone(discovery.find_activation(kernels[2]))
+    
     def test_get_hidden_output(self):
         print()
         model = benchmark_model.build_tf_model()
@@ -103,6 +124,69 @@ class UtilityTest(tf.test.TestCase):
         print('duration', duration)
         self.assertEqual(_inputs, inputs)
         self.assertEqual(_labels, labels)
+    
+    def test_graph_index(self):
+        model = benchmark_model.build_tf_one_hot_model(False)
+        index = utility.get_graph_index(model.frob_norm)
+        self.assertIs(index, utility.get_graph_index(model.frob_norm))
+        self.assertEqual(index.placeholders, [model.labels, model.inputs])
+        self.assertIn(model.frob_norm.op, index.operations.values())
+        # Adding an operation to the graph invalidates the index.
+        tf.identity(model.frob_norm)
+        self.assertTrue(index.stale)
+        self.assertIsNot(index, utility.get_graph_index(model.frob_norm))
+    
+    def test_graph_index_releases_graph(self):
+        graph = tf.Graph()
+        with graph.as_default():
+            model = benchmark_model.build_tf_one_hot_model(False)
+            utility.get_graph_index(model.frob_norm)
+        graph_ref = weakref.ref(graph)
+        # The cached index does not keep the graph alive.
+        del graph, model
+        gc.collect()
+        self.assertIsNone(graph_ref())
+    
+    def test_discover_layers(self):
+        model = benchmark_model.build_tf_model()
+        layers = discover_layers(model.inputs, model.loss, utility.get_train_ops())
+        self.assertEqual([layer.use_bias for layer in layers], [True, False, True])
+        self.assertEqual([layer.activation and layer.activation.type for layer in layers], ['Relu', 'Relu', None])
+        self.assertEqual(layers[0].output, model.inputs)
+        self.assertEqual(layers[1].output.get_shape().as_list(), [batch_size, 100])
+        
+        # The layers are matched by the operations, whatever their names are.
+        tf.reset_default_graph()
+        inputs = tf.placeholder(tf.float64, (batch_size, 784))
+        with tf.name_scope('model'):
+            kernel = tf.get_variable('w', (784, 10), dtype=tf.float64)
+            bias = tf.get_variable('b', (10,), dtype=tf.float64)
+            outputs = tf.nn.softmax(tf.nn.bias_add(inputs @ kernel, bias), name='probabilities')
+        layers = discover_layers(inputs, tf.reduce_sum(outputs), utility.get_train_ops())
+        self.assertEqual(len(layers), 1)
+        self.assertEqual(layers[0].bias, bias)
+        self.assertEqual(layers[0].activation.type, 'Softmax')
+    
+    def test_tensorflow_variables(self):
+        model = benchmark_model.build_tf_model()
+        init = tf.global_variables_initializer()
+        with self.test_session() as sess:
+            sess.run(init)
+            variables = utility.TensorFlowVariables(model.loss, sess)
+            self.assertEqual(variables.get_flat_size(), 784 * 100 + 100 + 100 * 50 + 50 + 1)
+            weights = variables.get_weights()
+            flat = variables.get_flat()
+            buffer = variables.flat_buffer()
+            views = variables.get_weights(buffer)
+            for name, value in weights.items():
+                self.assertAllEqual(views[name], value)
+                self.assertTrue(np.shares_memory(views[name], buffer))
+            self.assertAllEqual(flat, buffer)
+            
+            variables.set_flat(np.zeros_like(flat))
+            self.assertAllEqual(variables.get_flat(), np.zeros_like(flat))
+            variables.set_weights(weights)
+            self.assertAllEqual(variables.get_flat(), flat)
 
 
 class FactorizeTest(tf.test.TestCase):
@@ -133,5 +217,72 @@ class FactorizeTest(tf.test.TestCase):
             print("old {} new {}".format(old_local_loss, new_local_loss))
 
 
+class DatasetTest(tf.test.TestCase):
+    def test_block_batch(self):
+        path = os.path.join(self.get_temp_dir(), 'x.npy')
+        np.save(path, np.arange(1000, dtype=np.float64).reshape((-1, 2)))
+        x = np.load(path, mmap_mode='r')
+        y = x[:, :1]
+        batch_x, batch_y = benchmark_model.block_batch(x, y, batch_size=100)
+        self.assertEqual(batch_x.shape, (100, 2))
+        # Rows of a block are contiguous and x, y stay aligned.
+        self.assertAllEqual(np.diff(batch_x[:, 0]), np.full(99, 2.))
+        self.assertAllEqual(batch_x[:, :1], batch_y)
+        # The blocks start at the same offsets as the ones of block_batches.
+        self.assertEqual(batch_x[0, 0] % 200, 0.)
+        
+        starts = [batch_x[0, 0] for batch_x, _ in benchmark_model.block_batches(x, y, batch_size=150)]
+        self.assertEqual(len(starts), 3)
+        self.assertAllEqual(sorted(starts), [0., 300., 600.])
+    
+    def test_one_hot_cache_paths(self):
+        cache_dir = self.get_temp_dir()
+        paths = benchmark_model.double_model._one_hot_cache_paths(cache_dir, 'mnist', np.float64, seed=0)
+        self.assertEqual(len(paths), 4)
+        # The rows shuffled by another seed are not read from the files of the first.
+        other_paths = benchmark_model.double_model._one_hot_cache_paths(cache_dir, 'mnist', np.float64, seed=1)
+        self.assertFalse(set(paths) & set(other_paths))
+    
+    def test_prefetcher(self):
+        batches = [(np.full((10, 2), i), np.full((10, 1), i)) for i in range(5)]
+        for depth in (0, 2):
+            with Prefetcher(batches, depth=depth) as prefetcher:
+                self.assertAllEqual([x[0, 0] for x, _ in prefetcher], range(5))
+        
+        def fail():
+            raise KeyError('producer')
+        
+        with self.assertRaises(KeyError):
+            next(Prefetcher(fail))
+        
+        path = os.path.join(self.get_temp_dir(), 'x.npy')
+        np.save(path, np.arange(20, dtype=np.float64).reshape((10, 2)))
+        x = np.load(path, mmap_mode='r')
+        # A view of the file is read into memory, a gathered batch is not copied again.
+        block, gathered = Prefetcher._load((x[:5], x[[1, 3]]))
+        self.assertNotIsInstance(block, np.memmap)
+        self.assertFalse(np.shares_memory(block, x))
+        self.assertAllEqual(block, x[:5])
+        self.assertNotIsInstance(gathered, np.memmap)
+        self.assertAllEqual(gathered, x[[1, 3]])
+    
+    def test_prefetcher_seeded(self):
+        x = np.arange(1000, dtype=np.float64).reshape((-1, 2))
+        y = x[:, :1]
+        
+        def sample():
+            np.random.seed(0)
+            sampler = functools.partial(batch, x, y, 10, random_state=fork_random_state())
+            with Prefetcher(sampler, depth=2) as prefetcher:
+                batches = []
+                for _ in range(5):
+                    # The main thread drawing from np.random does not change the batches.
+                    np.random.uniform()
+                    batches.append(next(prefetcher)[0])
+            return batches
+        
+        self.assertAllEqual(sample(), sample())
+
+
 if __name__ == '__main__':
     tf.test.main()
\ No newline at end of file
@@ -1,4 +1,6 @@
 import logging
+import queue
+import threading
 
 import numpy as np
 
@@ -13,11 +15,23 @@ log_levels = dict(
 )
 
 
-def batch(x, y, batch_size):
-  rand_index = np.random.choice(len(x), batch_size)
+def batch(x, y, batch_size, random_state=None):
+  """Batch of random rows, sampled by random_state or the global np.random."""
+  random_state = random_state or np.random
+  rand_index = random_state.choice(len(x), batch_size)
   return x[rand_index], y[rand_index]
 
 
+def fork_random_state():
+  """RandomState of its own for a sampler running in another thread.
+
+  The global np.random is not safe to share with a producer thread, so the
+  sampler gets a RandomState seeded from it. The batches still follow
+  `np.random.seed`, as the seed is drawn in the calling thread.
+  """
+  return np.random.RandomState(np.random.randint(2 ** 31))
+
+
 def prod(xs):
   """Computes the product along the elements in an iterable. Returns 1 for empty iterable.
 
@@ -39,3 +53,98 @@ def rank(x):
 
 def shape(x, unknown=-1):
   return tuple(unknown if dims is None else dims for dims in x.get_shape().as_list())
+
+
+class Prefetcher(object):
+  """Produces batches in a background thread ahead of the training loop.
+
+  The batches are put into a queue bounded by `depth`, so the sampling and
+  gathering of the next batches overlaps `sess.run` of the current one.
+  Memory-mapped arrays are read into memory by the producer as well.
+
+  with Prefetcher(functools.partial(batch, x, y, batch_size, random_state=fork_random_state())) as batches:
+    for step in range(num_steps):
+      batch_x, batch_y = next(batches)
+
+  Args:
+      source: Callable returning a batch, called for every batch, or an
+        iterable of batches. It runs in the background thread, so a sampler
+        should be given a `fork_random_state` instead of the global np.random.
+      depth: Number of batches produced ahead. With 0 the batches are
+        produced synchronously by `next`.
+  """
+
+  _end = object()
+
+  def __init__(self, source, depth=2):
+    if callable(source):
+      self._iterator = iter(source, self._end)
+    else:
+      self._iterator = iter(source)
+    self.depth = depth
+    self._queue = None
+    self._thread = None
+    self._stop = threading.Event()
+    if depth > 0:
+      self._queue = queue.Queue(maxsize=depth)
+      self._thread = threading.Thread(target=self._produce, daemon=True)
+      self._thread.start()
+
+  @staticmethod
+  def _load(batch):
+    # Read a view of the file into memory once, a gathered batch is already in memory.
+    return tuple((np.array(x) if x.base is not None else x.view(np.ndarray)) if isinstance(x, np.memmap) else x
+                 for x in batch)
+
+  def _put(self, item):
+    # Give up on a full queue once the consumer has closed.
+    while not self._stop.is_set():
+      try:
+        self._queue.put(item, timeout=0.1)
+        return True
+      except queue.Full:
+        pass
+    return False
+
+  def _produce(self):
+    try:
+      for batch in self._iterator:
+        if not self._put((self._load(batch), None)):
+          return
+    except Exception as e:
+      self._put((None, e))
+      return
+    self._put((self._end, None))
+
+  def __iter__(self):
+    return self
+
+  def __next__(self):
+    if self._queue is None:
+      return self._load(next(self._iterator))
+    if self._stop.is_set():
+      raise StopIteration
+    batch, error = self._queue.get()
+    if error is not None:
+      self.close()
+      raise error
+    if batch is self._end:
+      self.close()
+      raise StopIteration
+    return batch
+
+  def close(self):
+    """Stop the producer and drop the batches produced ahead."""
+    self._stop.set()
+    if self._thread is not None:
+      while self._thread.is_alive():
+        try:
+          self._queue.get_nowait()
+        except queue.Empty:
+          self._thread.join(timeout=0.1)
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
@@ -22,6 +22,7 @@ setuptools.setup(
         'tensorflow-gpu',
         'keras',
         'agents',
+        'scipy',
     ],
     packages=setuptools.find_packages(),
     classifiers=[